@@ -1,3 +1,13 @@
 from django.test import TestCase
 
-# Create your tests here.
+from kissan.perf_budget import ViewBudget, ViewBudgetMixin
+
+
+class AccountsViewBudgetTests(ViewBudgetMixin, TestCase):
+    urlconf = "accounts.urls"
+
+    def budgets(self):
+        return [
+            ViewBudget("auth", max_queries=0),
+            ViewBudget("register", max_queries=0),
+        ]
@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import FarmingFAQ
+
+
+@admin.register(FarmingFAQ)
+class FarmingFAQAdmin(admin.ModelAdmin):
+    list_display = ("question_ml", "category", "priority", "is_active", "updated_at")
+    list_filter = ("is_active", "category")
+    search_fields = ("question_ml", "question_en")
@@ -0,0 +1,249 @@
+# ai/answer_cache.py
+"""
+Near-duplicate answer cache over ChatLog.
+
+Questions are reduced to word shingles (tokens and token pairs from the shared
+Malayalam-aware tokenizer) and MinHash signatures. A locality-sensitive hash
+over signature bands finds candidates in the question's (farmer, season,
+language) bucket; a candidate whose shingle sets overlap enough is a hit and
+its stored answer is reused instead of calling the model.
+
+Model answers are written from the asking farmer's profile, crops and logs,
+so they are only ever reused for that farmer. Answers shared between farmers
+come from the FAQ index, which holds no personal data.
+"""
+
+import logging
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from core.text import tokenize
+from .models import ChatLog
+from .seasons import SEASON_MONTHS
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS  # Pairs above roughly 50% similarity share a band
+
+# Exact shingle-set Jaccard required for a hit
+SIMILARITY_THRESHOLD = 0.7
+
+# Answers older than this are not reused
+TTL = timedelta(days=14)
+# How often a bucket picks up answers saved by other processes
+REFRESH_SECONDS = 5 * 60
+# Answers are re-read this far behind the watermark, for transactions that committed late
+OVERLAP = timedelta(seconds=60)
+MAX_ENTRIES_PER_BUCKET = 200
+# Buckets kept per process, least recently used dropped first
+MAX_BUCKETS = 5000
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+# Fixed seed: every process must compute the same signatures
+_rng = np.random.default_rng(0x6B697373)
+_A = _rng.integers(1, 1 << 31, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text):
+    tokens = tokenize(text)
+    result = set(tokens)
+    result.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return frozenset(result)
+
+
+def signature(shingle_set):
+    """
+    MinHash signature: for each of NUM_PERM hash functions, the smallest hash
+    of any shingle.
+    """
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return ((hashes[:, None] * _A[None, :] + _B[None, :]) % MERSENNE_PRIME).min(axis=0)
+
+
+def band_keys(sig):
+    return [(band, sig[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class Entry:
+    __slots__ = ("chat_id", "shingles", "bands", "answer", "created_at")
+
+    def __init__(self, chat_id, shingle_set, answer, created_at):
+        self.chat_id = chat_id
+        self.shingles = shingle_set
+        self.bands = band_keys(signature(shingle_set))
+        self.answer = answer
+        self.created_at = created_at
+
+
+class Bucket:
+    """
+    The cached answers of one (farmer, season, language) with their LSH tables.
+    """
+
+    def __init__(self):
+        self.entries = {}  # chat id -> Entry, in the order added
+        self.tables = {}  # (band, band hash) -> set of chat ids
+        self.watermark = None  # Time of the last refresh from the database
+        self.refreshed_at = None
+
+    def add(self, entry):
+        if entry.chat_id in self.entries:
+            return
+        self.entries[entry.chat_id] = entry
+        for key in entry.bands:
+            self.tables.setdefault(key, set()).add(entry.chat_id)
+        while len(self.entries) > MAX_ENTRIES_PER_BUCKET:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, chat_id):
+        entry = self.entries.pop(chat_id)
+        for key in entry.bands:
+            ids = self.tables.get(key)
+            if ids is not None:
+                ids.discard(chat_id)
+                if not ids:
+                    del self.tables[key]
+
+    def find(self, shingle_set, now):
+        candidates = set()
+        for key in band_keys(signature(shingle_set)):
+            candidates.update(self.tables.get(key, ()))
+
+        best, best_score = None, SIMILARITY_THRESHOLD
+        expired = []
+        for chat_id in candidates:
+            entry = self.entries[chat_id]
+            if entry.created_at < now - TTL:
+                expired.append(chat_id)
+                continue
+            score = jaccard(shingle_set, entry.shingles)
+            if score >= best_score:
+                best, best_score = entry, score
+        for chat_id in expired:
+            self.remove(chat_id)
+        return best, best_score
+
+
+_lock = threading.Lock()
+_buckets = OrderedDict()
+_stats = Counter()
+
+
+def _reusable_logs():
+    # Only the model's own answers: FAQ and cache hits saved as chats would
+    # otherwise come back as new entries and renew their TTL forever. Answers
+    # the farmer marked unhelpful or rated poorly are never reused.
+    return (
+        ChatLog.objects.filter(answer_source="model")
+        .exclude(is_helpful=False)
+        .exclude(user_rating__lte=2)
+    )
+
+
+def _refresh(key, bucket):
+    """
+    Loads the farmer's answers saved since the bucket's watermark, in any process.
+    """
+    user_id, season, language = key
+    now = timezone.now()
+    since = now - TTL
+    if bucket.watermark is not None:
+        since = max(since, bucket.watermark - OVERLAP)
+    rows = (
+        _reusable_logs()
+        .filter(
+            user_id=user_id,
+            language=language,
+            created_at__gte=since,
+            created_at__month__in=SEASON_MONTHS.get(season, ()),
+        )
+        .order_by("-created_at")
+        .values_list("id", "user_question", "ai_response", "created_at")[:MAX_ENTRIES_PER_BUCKET]
+    )
+    for chat_id, question, answer, created_at in reversed(rows):
+        shingle_set = shingles(question)
+        if shingle_set:
+            bucket.add(Entry(chat_id, shingle_set, answer, created_at))
+    bucket.watermark = now
+    bucket.refreshed_at = time.monotonic()
+
+
+def _bucket(user_id, season, language):
+    key = (user_id, season, language)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = _buckets[key] = Bucket()
+        while len(_buckets) > MAX_BUCKETS:
+            _buckets.popitem(last=False)
+    else:
+        _buckets.move_to_end(key)
+    if bucket.refreshed_at is None or time.monotonic() - bucket.refreshed_at > REFRESH_SECONDS:
+        _refresh(key, bucket)
+    return bucket
+
+
+def lookup(question, user_id, season, language):
+    """
+    Returns {"answer", "chat_id", "similarity"} for a stored answer to a
+    near-duplicate question the same farmer asked in this season and language,
+    or None.
+    """
+    shingle_set = shingles(question)
+    if not shingle_set:
+        return None
+
+    with _lock:
+        entry, score = _bucket(user_id, season, language).find(shingle_set, timezone.now())
+        _stats["hits" if entry else "misses"] += 1
+
+    if entry is None:
+        return None
+    logger.info(f"Answer cache hit: chat {entry.chat_id}, similarity {score:.2f}")
+    return {"answer": entry.answer, "chat_id": entry.chat_id, "similarity": round(score, 3)}
+
+
+def remember(chat, season):
+    """
+    Adds a freshly saved model answer to its farmer's bucket in this process.
+    """
+    shingle_set = shingles(chat.user_question)
+    if not shingle_set:
+        return
+    with _lock:
+        _bucket(chat.user_id, season, chat.language).add(
+            Entry(chat.id, shingle_set, chat.ai_response, chat.created_at)
+        )
+
+
+def stats():
+    """
+    Hit-rate metric for this process.
+    """
+    with _lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "buckets": len(_buckets),
+            "entries": sum(len(bucket.entries) for bucket in _buckets.values()),
+        }
+
+
+def clear():
+    with _lock:
+        _buckets.clear()
+        _stats.clear()
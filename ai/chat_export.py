@@ -0,0 +1,189 @@
+# ai/chat_export.py
+"""
+Streaming ChatLog export for offline analytics.
+
+Rows are read with a server-side cursor (QuerySet.iterator), or a keyset page
+at a time for the async download view, and written out as they arrive, so
+memory stays flat whatever the table size. An export
+covers the rows whose updated_at is before its watermark; passing that
+watermark as `since` to the next export picks up exactly the rows created or
+changed after it (ratings and feedback update a row).
+
+A farmer's pk is their mobile number, so exports carry a keyed pseudonym of
+it (an HMAC under SECRET_KEY) in user_id instead: stable across exports, so
+a farmer's chats can still be grouped, but not reversible without the key.
+"""
+
+import gzip
+import json
+import zlib
+from datetime import timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatLog
+
+EXPORT_FIELDS = (
+    "id", "created_at", "updated_at", "user_id", "session_id", "language", "category",
+    "user_district", "crops_mentioned", "user_rating", "is_helpful", "answer_source",
+)
+TEXT_FIELDS = ("user_question", "ai_response", "user_feedback")
+
+DEFAULT_CHUNK_SIZE = 2000
+
+USER_ID_SALT = "ai.chat_export.user_id"
+
+# Rows updated this recently are left for the next export: a transaction that
+# started earlier may still commit rows stamped before the watermark
+SETTLE_SECONDS = 60
+
+
+def parse_watermark(value):
+    """
+    Parses an ISO timestamp from a previous export. Returns None for an empty
+    value; raises ValueError for a malformed one.
+    """
+    if not value:
+        return None
+    watermark = parse_datetime(str(value).strip())
+    if watermark is None:
+        raise ValueError("Invalid watermark, expected an ISO timestamp")
+    if timezone.is_naive(watermark):
+        watermark = timezone.make_aware(watermark, dt_timezone.utc)
+    return watermark
+
+
+def new_watermark():
+    return timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+
+
+def _export_values(since, until, fields):
+    logs = ChatLog.objects.filter(updated_at__lt=until)
+    if since is not None:
+        logs = logs.filter(updated_at__gte=since)
+    return logs.order_by("updated_at", "id").values_list(*fields)
+
+
+def pseudonymous_user_id(user_id):
+    return salted_hmac(USER_ID_SALT, str(user_id), algorithm="sha256").hexdigest()[:32]
+
+
+def _export_row(fields, values):
+    row = dict(zip(fields, values))
+    row["user_id"] = pseudonymous_user_id(row["user_id"])
+    row["created_at"] = row["created_at"].isoformat()
+    row["updated_at"] = row["updated_at"].isoformat()
+    return row
+
+
+def export_rows(since, until, with_text=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields one dict per ChatLog with since <= updated_at < until, oldest first.
+    """
+    fields = EXPORT_FIELDS + (TEXT_FIELDS if with_text else ())
+    for values in _export_values(since, until, fields).iterator(chunk_size=chunk_size):
+        yield _export_row(fields, values)
+
+
+async def aexport_rows(since, until, with_text=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    export_rows for async views: pages of `chunk_size` rows, each fetched after
+    the last row's (updated_at, id) off the event loop.
+    """
+    fields = EXPORT_FIELDS + (TEXT_FIELDS if with_text else ())
+    updated_at, row_id = fields.index("updated_at"), fields.index("id")
+    logs = _export_values(since, until, fields)
+    page = logs
+    while True:
+        values = await sync_to_async(list)(page[:chunk_size])
+        for row in values:
+            yield _export_row(fields, row)
+        if len(values) < chunk_size:
+            return
+        last = values[-1]
+        page = logs.filter(
+            Q(updated_at__gt=last[updated_at]) | Q(updated_at=last[updated_at], id__gt=last[row_id])
+        )
+
+
+def _jsonl_line(row):
+    return (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield _jsonl_line(row)
+
+
+async def gzip_jsonl_stream(rows, flush_bytes=64 * 1024):
+    """
+    Gzip-compressed JSONL for an async iterable of rows, as a stream of
+    compressed blocks of roughly `flush_bytes` input each. Async, so under
+    ASGI the response is sent as it is produced instead of being collected
+    into a list first.
+    """
+    compressor = zlib.compressobj(wbits=31)  # 31: gzip container
+    pending = 0
+    async for row in rows:
+        line = _jsonl_line(row)
+        data = compressor.compress(line)
+        pending += len(line)
+        if pending >= flush_bytes:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_jsonl_gz(path, rows):
+    """
+    Writes rows to a gzip-compressed JSONL file. Returns the number of rows.
+    """
+    count = 0
+    with gzip.open(path, "wb") as output:
+        for line in jsonl_lines(rows):
+            output.write(line)
+            count += 1
+    return count
+
+
+def write_parquet(path, rows, with_text=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes rows to a Parquet file, one row group per chunk. Needs pyarrow.
+    Returns the number of rows.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    columns = [
+        ("id", pa.int64()), ("created_at", pa.string()), ("updated_at", pa.string()),
+        ("user_id", pa.string()), ("session_id", pa.string()), ("language", pa.string()),
+        ("category", pa.string()), ("user_district", pa.string()),
+        ("crops_mentioned", pa.list_(pa.string())), ("user_rating", pa.int16()),
+        ("is_helpful", pa.bool_()), ("answer_source", pa.string()),
+    ]
+    if with_text:
+        columns += [(field, pa.string()) for field in TEXT_FIELDS]
+    schema = pa.schema(columns)
+
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunk_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
@@ -0,0 +1,214 @@
+# ai/chat_history.py
+
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Q, Value
+from django.db.models.functions import Greatest, Least
+from core.cursors import decode_cursor, encode_cursor
+from .classify import classify_chat
+from .models import ChatLog, ChatSession
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_LENGTH = 50
+
+# Page sizes: (default, maximum) for the history list and a session's messages
+HISTORY_PAGE_SIZE = (20, 100)
+MESSAGES_PAGE_SIZE = (50, 200)
+
+
+def make_preview(question):
+    return question[:PREVIEW_LENGTH] + ('...' if len(question) > PREVIEW_LENGTH else '')
+
+
+def save_chat(user, session_id, question, response, language='ml', category=None, source='model'):
+    """
+    Writes one question/answer pair and updates its session summary.
+    The category and crops mentioned are extracted from the question; `source`
+    records whether the answer came from the model, a FAQ or the answer cache.
+    """
+    category, crops = classify_chat(question, category)
+    with transaction.atomic():
+        chat = ChatLog.objects.create(
+            user=user,
+            session_id=session_id,
+            user_question=question,
+            ai_response=response,
+            language=language,
+            category=category,
+            user_district=user.district,
+            crops_mentioned=crops,
+            answer_source=source,
+        )
+        record_chat(chat)
+    return chat
+
+
+def _session_update(count, started_at, last_activity_at):
+    """
+    Update values folding `count` chats into a session. A late write (e.g. a
+    spooled chat flushed after newer ones) never moves the session's times back.
+    """
+    return {
+        'message_count': F('message_count') + count,
+        'started_at': Least('started_at', Value(started_at)),
+        'last_activity_at': Greatest('last_activity_at', Value(last_activity_at)),
+    }
+
+
+def record_chat(chat):
+    """
+    Folds a newly written ChatLog into its session's summary row.
+    Call inside the transaction that created the log.
+    """
+    updated = ChatSession.objects.filter(user_id=chat.user_id, session_id=chat.session_id).update(
+        **_session_update(1, chat.created_at, chat.created_at),
+    )
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            ChatSession.objects.create(
+                user_id=chat.user_id,
+                session_id=chat.session_id,
+                preview=make_preview(chat.user_question),
+                language=chat.language,
+                message_count=1,
+                started_at=chat.created_at,
+                last_activity_at=chat.created_at,
+            )
+    except IntegrityError:
+        # Another request created the session first
+        ChatSession.objects.filter(user_id=chat.user_id, session_id=chat.session_id).update(
+            **_session_update(1, chat.created_at, chat.created_at),
+        )
+
+
+def record_chats(chats):
+    """
+    Folds a batch of newly written ChatLogs into their session summaries with
+    one update (or create) per session instead of one per log.
+    Call inside the transaction that created the logs.
+    """
+    sessions = {}
+    for chat in sorted(chats, key=lambda chat: chat.created_at):
+        key = (chat.user_id, chat.session_id)
+        if key in sessions:
+            sessions[key][1] += 1
+            sessions[key][2] = chat.created_at
+        else:
+            sessions[key] = [chat, 1, chat.created_at]
+
+    for (user_id, session_id), (first, count, last_activity_at) in sessions.items():
+        updated = ChatSession.objects.filter(user_id=user_id, session_id=session_id).update(
+            **_session_update(count, first.created_at, last_activity_at),
+        )
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                ChatSession.objects.create(
+                    user_id=user_id,
+                    session_id=session_id,
+                    preview=make_preview(first.user_question),
+                    language=first.language,
+                    message_count=count,
+                    started_at=first.created_at,
+                    last_activity_at=last_activity_at,
+                )
+        except IntegrityError:
+            # Another request created the session first
+            ChatSession.objects.filter(user_id=user_id, session_id=session_id).update(
+                **_session_update(count, first.created_at, last_activity_at),
+            )
+
+
+def rebuild_chat_sessions(user=None):
+    """
+    Recomputes the session summaries from ChatLog, for one user or everyone.
+    Used after bulk imports that bypass record_chat.
+    """
+    logs = ChatLog.objects.all() if user is None else ChatLog.objects.filter(user=user)
+    totals = logs.order_by().values('user_id', 'session_id').annotate(
+        message_count=Count('id'), started_at=Min('created_at'), last_activity_at=Max('created_at'),
+    )
+    # The first log of each session supplies the preview and language
+    first_logs = {}
+    for log in logs.order_by('created_at', 'id').only('user_id', 'session_id', 'user_question', 'language').iterator():
+        first_logs.setdefault((log.user_id, log.session_id), log)
+
+    sessions = []
+    for row in totals:
+        first = first_logs[(row['user_id'], row['session_id'])]
+        sessions.append(ChatSession(
+            user_id=row['user_id'],
+            session_id=row['session_id'],
+            preview=make_preview(first.user_question),
+            language=first.language,
+            message_count=row['message_count'],
+            started_at=row['started_at'],
+            last_activity_at=row['last_activity_at'],
+        ))
+
+    with transaction.atomic():
+        existing = ChatSession.objects.all() if user is None else ChatSession.objects.filter(user=user)
+        existing.delete()
+        ChatSession.objects.bulk_create(sessions, batch_size=1000)
+    logger.info(f"Rebuilt {len(sessions)} chat session summaries")
+    return len(sessions)
+
+
+# --- Keyset pagination ---
+
+def page_size(value, sizes):
+    """
+    Parses a ?limit= value against (default, maximum). Raises ValueError if it is not a number.
+    """
+    default, maximum = sizes
+    if value in (None, ""):
+        return default
+    return max(1, min(int(value), maximum))
+
+
+def keyset_page(queryset, time_field, cursor, limit, descending=False):
+    """
+    One page of `queryset` ordered by (time_field, id), starting after `cursor`.
+    Filtering on the last row's key instead of an OFFSET keeps every page an
+    index range scan. Returns (rows, next cursor or None).
+    """
+    after = decode_cursor(cursor)
+    if after:
+        moment, row_id = after
+        direction = "lt" if descending else "gt"
+        queryset = queryset.filter(
+            Q(**{f"{time_field}__{direction}": moment})
+            | Q(**{time_field: moment, f"id__{direction}": row_id})
+        )
+
+    prefix = "-" if descending else ""
+    rows = list(queryset.order_by(f"{prefix}{time_field}", f"{prefix}id")[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(getattr(rows[-1], time_field), rows[-1].id)
+
+
+def session_history_page(user, cursor=None, limit=HISTORY_PAGE_SIZE[0]):
+    """
+    The user's chat sessions, most recently active first.
+    """
+    sessions = ChatSession.objects.filter(user=user).only(
+        'id', 'session_id', 'last_activity_at', 'language', 'preview', 'message_count',
+    )
+    return keyset_page(sessions, 'last_activity_at', cursor, limit, descending=True)
+
+
+def session_messages_page(user, session_id, cursor=None, limit=MESSAGES_PAGE_SIZE[0]):
+    """
+    A session's chat logs, oldest first.
+    """
+    logs = ChatLog.objects.filter(user=user, session_id=session_id).only(
+        'id', 'created_at', 'user_question', 'ai_response',
+    )
+    return keyset_page(logs, 'created_at', cursor, limit)
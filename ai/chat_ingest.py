@@ -0,0 +1,302 @@
+# ai/chat_ingest.py
+"""
+Buffered ChatLog ingestion.
+
+Requests validate a chat, append it to this process's spool file and an
+in-memory buffer, and return. A background thread writes the buffer with one
+bulk_create when it holds CHAT_INGEST_BATCH_SIZE chats or every
+CHAT_INGEST_FLUSH_SECONDS, then deletes the spool segments it covered.
+
+Delivery is at least once: a chat stays in the spool until the transaction
+writing it commits, so chats buffered by a process that died are replayed
+from its spool by the next process (or `manage.py flush_chat_logs`). Every
+chat carries an ingest_key, and keys already in ChatLog are skipped, so a
+replay never writes a chat twice.
+
+A process holds an flock on each of its segments until it deletes them; the
+kernel drops the lock when the process dies, so a segment that can be locked
+is an orphan. (Process ids are no use for this: containers reuse them.)
+"""
+
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+
+from .chat_history import record_chats
+from .classify import classify_chat, get_automaton
+from .models import ChatLog
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+LANGUAGES = dict(ChatLog.LANGUAGE_CHOICES)
+CATEGORIES = dict(ChatLog.CATEGORY_CHOICES)
+MAX_KEY_LENGTH = ChatLog._meta.get_field("ingest_key").max_length
+MAX_SESSION_ID_LENGTH = ChatLog._meta.get_field("session_id").max_length
+
+SEGMENT_PREFIX = "chats-"
+
+
+def parse_chat(data):
+    """
+    Validates one chat payload ({"question", "response", "language", "category",
+    "session_id", "idempotency_key"}). Returns the cleaned fields or raises
+    ValueError. The category is only a fallback for write_chats' classification.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    question = str(data.get("question") or "").strip()
+    response = str(data.get("response") or "").strip()
+    if not question or not response:
+        raise ValueError("Question and response are required")
+
+    # A client retrying a request sends the same key, so the retry is not stored twice
+    key = str(data.get("idempotency_key") or uuid.uuid4().hex)
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"idempotency_key is longer than {MAX_KEY_LENGTH} characters")
+
+    return {
+        "ingest_key": key,
+        "session_id": str(data.get("session_id") or uuid.uuid4())[:MAX_SESSION_ID_LENGTH],
+        "user_question": question,
+        "ai_response": response,
+        "language": data.get("language") if data.get("language") in LANGUAGES else "ml",
+        "category": data.get("category") if data.get("category") in CATEGORIES else None,
+    }
+
+
+def write_chats(entries):
+    """
+    Writes spooled chats in one transaction, skipping ones already written
+    and ones whose user no longer exists, with the category and crops
+    extracted from each question. Returns the number written.
+    """
+    automaton = get_automaton()
+    keys = {entry["ingest_key"] for entry in entries}
+    user_ids = {entry["user_id"] for entry in entries}
+    with transaction.atomic():
+        seen = set(ChatLog.objects.filter(ingest_key__in=keys).values_list("ingest_key", flat=True))
+        live_users = set(User.objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+
+        chats = []
+        for entry in entries:
+            if entry["ingest_key"] in seen:
+                continue
+            if entry["user_id"] not in live_users:
+                logger.warning(f"Dropping chat {entry['ingest_key']}: user {entry['user_id']} no longer exists")
+                continue
+            seen.add(entry["ingest_key"])
+            category, crops = classify_chat(entry["user_question"], entry.get("category"), automaton)
+            chats.append(ChatLog(**{**entry, "category": category, "crops_mentioned": crops}))
+
+        ChatLog.objects.bulk_create(chats, batch_size=500)
+        record_chats(chats)
+    return len(chats)
+
+
+def _read_segment(path):
+    entries = []
+    with open(path, encoding="utf-8") as segment:
+        for line in segment:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # The last line of a process that died mid-write
+                logger.warning(f"Skipping a truncated line in {path.name}")
+    return entries
+
+
+def _try_lock(segment):
+    try:
+        fcntl.flock(segment, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def replay_orphaned_segments(spool_dir, batch_size):
+    """
+    Writes the chats left in spool segments that no running process holds,
+    then deletes the segments. Returns the number of chats written.
+    """
+    written = 0
+    for path in sorted(Path(spool_dir).glob(f"{SEGMENT_PREFIX}*.jsonl")):
+        try:
+            segment = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            continue  # Flushed and deleted by its owner meanwhile
+        with segment:
+            if not _try_lock(segment):
+                continue  # Still owned by a live process
+            entries = _read_segment(path)
+            for start in range(0, len(entries), batch_size):
+                written += write_chats(entries[start:start + batch_size])
+            path.unlink(missing_ok=True)
+        logger.info(f"Replayed {len(entries)} spooled chats from {path.name}")
+    return written
+
+
+class ChatLogBuffer:
+    def __init__(self, spool_dir, batch_size, flush_seconds):
+        self.spool_dir = Path(spool_dir)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+
+        self._lock = threading.Lock()  # Guards the buffer and the open segment
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._pending = []
+        self._segments = []  # (path, file) of full segments whose chats are all in _pending
+        self._segment = None
+        self._segment_path = None
+
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def _open_segment(self):
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{SEGMENT_PREFIX}{os.getpid()}-{uuid.uuid4().hex}"
+        # Locked before it gets the name replay looks for, so no replay can take it first
+        staging = self.spool_dir / f"{name}.tmp"
+        segment = open(staging, "a", encoding="utf-8")
+        fcntl.flock(segment, fcntl.LOCK_EX)
+        self._segment_path = staging.rename(self.spool_dir / f"{name}.jsonl")
+        self._segment = segment
+
+    def add(self, entry):
+        with self._lock:
+            if self._segment is None:
+                self._open_segment()
+            self._segment.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            # In the OS's hands from here, so a crash of this process loses nothing
+            self._segment.flush()
+            self._pending.append(entry)
+            full = len(self._pending) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-log-flusher", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Writes everything buffered so far. On failure the chats stay buffered
+        and spooled for the next flush, and the error is raised.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                segments, self._segments = self._segments, []
+                if self._segment is not None:
+                    # Kept open, and locked, until its chats are written
+                    segments.append((self._segment_path, self._segment))
+                    self._segment = None
+
+            try:
+                written = 0
+                for start in range(0, len(batch), self.batch_size):
+                    written += write_chats(batch[start:start + self.batch_size])
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch
+                    self._segments[:0] = segments
+                raise
+
+            for path, segment in segments:
+                path.unlink(missing_ok=True)
+                segment.close()
+            if written:
+                logger.info(f"Flushed {written} chat logs")
+            return written
+
+    def _run(self):
+        try:
+            replay_orphaned_segments(self.spool_dir, self.batch_size)
+        except Exception:
+            logger.exception("Replaying spooled chat logs failed")
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            if self._stopped:
+                # stop() does the final flush itself
+                return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Chat log flush failed, retrying on the next one")
+            finally:
+                close_old_connections()
+
+    def stop(self, flush=True):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_seconds + 5)
+        if flush:
+            self.flush()
+            return
+        # Unlocked, so the next process replays them
+        with self._lock:
+            if self._segment is not None:
+                self._segments.append((self._segment_path, self._segment))
+                self._segment = None
+            for _, segment in self._segments:
+                segment.close()
+            self._segments = []
+
+
+_buffer_lock = threading.Lock()
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ChatLogBuffer(
+                    settings.CHAT_INGEST_SPOOL_DIR,
+                    settings.CHAT_INGEST_BATCH_SIZE,
+                    settings.CHAT_INGEST_FLUSH_SECONDS,
+                )
+    return _buffer
+
+
+def enqueue(user, chat):
+    """
+    Buffers a chat cleaned by parse_chat for `user`. Returns the stored entry.
+    """
+    entry = {**chat, "user_id": user.pk, "user_district": user.district}
+    get_buffer().add(entry)
+    return entry
+
+
+def flush():
+    return get_buffer().flush() if _buffer is not None else 0
+
+
+@atexit.register
+def shutdown(flush=True):
+    """
+    Stops the flusher thread and, unless flush=False, writes what is still
+    buffered. Runs on interpreter exit; anything it cannot write stays spooled.
+    """
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is None:
+        return
+    try:
+        buffer.stop(flush=flush)
+    except Exception:
+        logger.exception("Final chat log flush failed; the chats stay spooled for replay")
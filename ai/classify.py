@@ -0,0 +1,238 @@
+# ai/classify.py
+"""
+Server-side category and crop-mention extraction for chat questions.
+
+Every crop name (Malayalam and English, from the crop dataset, the catalog
+and farmers' Crop rows) and every category keyword is compiled into one
+Aho-Corasick automaton, so a question is classified in a single pass over
+its characters however many names there are.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from core import reference_data
+from core.models import Crop, CropCatalog
+from core.text import VIRAMA, normalize
+
+logger = logging.getLogger(__name__)
+
+# Keywords per ChatLog category, in order of precedence for ties
+CATEGORY_KEYWORDS = {
+    "PEST_CONTROL": (
+        "pest", "insect", "disease", "fungus", "fungal", "worm", "aphid", "blight", "wilt", "rot",
+        "mealybug", "mite", "കീട", "രോഗ", "പുഴു", "കുമിൾ", "ഫംഗസ്", "വാട്ടം",
+    ),
+    "WEATHER": (
+        "rain", "weather", "monsoon", "forecast", "temperature", "drought", "flood", "heat",
+        "മഴ", "കാലാവസ്ഥ", "വരൾച്ച", "വെള്ളപ്പൊക്കം", "ചൂട്",
+    ),
+    "FERTILIZER": (
+        "fertilizer", "fertiliser", "manure", "npk", "urea", "potash", "compost", "nutrient",
+        "വളം", "ചാണകം", "യൂറിയ", "പൊട്ടാഷ്", "കമ്പോസ്റ്റ്",
+    ),
+    "IRRIGATION": (
+        "irrigation", "irrigate", "watering", "water", "drip", "sprinkler",
+        "ജലസേചന", "നനയ്ക്ക", "നനച്ച", "വെള്ളം",
+    ),
+    "SOIL_HEALTH": (
+        "soil", "ph", "lime", "liming", "erosion", "മണ്ണ്", "കുമ്മായം",
+    ),
+    "MARKET": (
+        "price", "market", "sell", "selling", "rate", "mandi", "buyer",
+        "വില", "വിപണി", "ചന്ത", "വിൽക്ക", "വിൽപ്പന",
+    ),
+    "CROP_ADVICE": (
+        "sow", "sowing", "plant", "planting", "harvest", "seed", "variety", "yield", "spacing",
+        "വിത്ത്", "നടീൽ", "നടാൻ", "വിളവെടുപ്പ്", "വിളവ്",
+    ),
+}
+
+# Everyday names missing from the dataset, mapped to its English crop names
+CROP_ALIASES = {
+    "rice": "Paddy", "നെല്ല്": "Paddy", "banana": "Plantain", "pepper": "Black Pepper",
+    "chili": "Chilli", "eggplant": "Brinjal", "വഴുതന": "Brinjal", "cassava": "Tapioca",
+    "കപ്പ": "Tapioca", "ഇഞ്ചി": "Ginger", "ഏലം": "Cardamom", "തെങ്ങ്": "Coconut",
+    "areca": "Arecanut", "കവുങ്ങ്": "Arecanut", "അടയ്ക്ക": "Arecanut",
+}
+
+# Shorter crop names are ordinary words too often (the dataset lists ഇല, "leaf", for ginger)
+MIN_CROP_NAME_LENGTH = 3
+
+REFRESH_SECONDS = 5 * 60
+
+CROP, CATEGORY = "crop", "category"
+
+
+def _is_malayalam(char):
+    return "ഀ" <= char <= "ൿ"
+
+
+def _pattern(text):
+    text = normalize(text).strip()
+    # Inflected forms drop the final virama: നെല്ല് / നെല്ലിന്
+    if text and not text.isascii():
+        text = text.rstrip(VIRAMA)
+    return text
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over (pattern, kind, value) entries.
+    """
+
+    def __init__(self, entries):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.patterns = []
+
+        for text, kind, value in entries:
+            node = 0
+            for char in text:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = child
+            self.out[node].append(len(self.patterns))
+            self.patterns.append((len(text), text.isascii(), kind, value))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def matches(self, text):
+        """
+        Yields (kind, value) for every pattern occurrence that starts at a word
+        boundary (and, for English patterns, ends at one, allowing a plural s).
+        """
+        node = 0
+        length = len(text)
+        for end, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for index in self.out[node]:
+                size, ascii_only, kind, value = self.patterns[index]
+                start = end - size + 1
+                before = text[start - 1] if start else " "
+                if ascii_only:
+                    after = end + 1
+                    if after < length and text[after] == "s":
+                        after += 1
+                    if before.isalnum() or (after < length and text[after].isalnum()):
+                        continue
+                elif _is_malayalam(before):
+                    continue
+                yield kind, value
+
+
+def _crop_names():
+    """
+    (name, Malayalam crop name) for every crop the app knows about.
+    """
+    pairs = (
+        [(row.get("crop_malayalam", ""), row.get("crop_english", "")) for row in reference_data.crops().rows]
+        + [(entry.name, entry.english_name) for entry in CropCatalog.objects.all_cached()]
+        + list(Crop.objects.order_by().values_list("name", "english_name").distinct())
+    )
+    names = []
+    english_to_malayalam = {}
+    for malayalam, english in pairs:
+        if not malayalam:
+            continue
+        names.append((malayalam, malayalam))
+        if english:
+            names.append((english, malayalam))
+            english_to_malayalam.setdefault(english.lower(), malayalam)
+    for alias, english in CROP_ALIASES.items():
+        if english.lower() in english_to_malayalam:
+            names.append((alias, english_to_malayalam[english.lower()]))
+    return names
+
+
+def build_automaton():
+    entries = {}
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        for keyword in keywords:
+            entries.setdefault(_pattern(keyword), (CATEGORY, category))
+    for name, crop in _crop_names():
+        pattern = _pattern(name)
+        if len(pattern) >= MIN_CROP_NAME_LENGTH:
+            entries.setdefault(pattern, (CROP, crop))
+    return Automaton((text, kind, value) for text, (kind, value) in entries.items())
+
+
+_lock = threading.Lock()
+_automaton = None  # (dataset version, built at, Automaton)
+
+
+def get_automaton():
+    """
+    The automaton for the current crop dataset, rebuilt when the dataset is
+    reloaded and every REFRESH_SECONDS to pick up new catalog and Crop names.
+    """
+    global _automaton
+    version = reference_data.crops().version
+    current = _automaton
+    if current is None or current[0] != version or time.monotonic() - current[1] > REFRESH_SECONDS:
+        with _lock:
+            if _automaton is None or _automaton[0] != version or time.monotonic() - _automaton[1] > REFRESH_SECONDS:
+                _automaton = (version, time.monotonic(), build_automaton())
+                logger.info(f"Built chat classifier with {len(_automaton[2].patterns)} patterns")
+            current = _automaton
+    return current[2]
+
+
+def classify_question(question, automaton=None):
+    """
+    Returns (category, crops mentioned) for a question: the category with the
+    most keyword hits (CROP_ADVICE when only crops are named, else GENERAL)
+    and the Malayalam names of the crops, in order of first mention.
+    """
+    automaton = automaton or get_automaton()
+    hits = Counter()
+    crops = {}
+    for kind, value in automaton.matches(normalize(question)):
+        if kind == CROP:
+            crops.setdefault(value, None)
+        else:
+            hits[value] += 1
+
+    if hits:
+        order = list(CATEGORY_KEYWORDS)
+        category = max(hits, key=lambda name: (hits[name], -order.index(name)))
+    else:
+        category = "CROP_ADVICE" if crops else "GENERAL"
+    return category, list(crops)
+
+
+def classify_chat(question, category=None, automaton=None):
+    """
+    (category, crops) to store for a chat. A category supplied by the caller
+    (an FAQ's, or the client's) is kept only when the question has no
+    category keywords of its own.
+    """
+    detected, crops = classify_question(question, automaton)
+    if detected == "GENERAL" and category:
+        detected = category
+    return detected, crops
+
+
+def clear():
+    global _automaton
+    with _lock:
+        _automaton = None
@@ -0,0 +1,169 @@
+# ai/conversation.py
+"""
+Rolling summaries of long chat sessions.
+
+Only the last CHAT_CONTEXT_TURNS question/answer pairs of a session go to the
+model verbatim. Older turns are folded into ChatSession.summary after each
+answer is saved, so a prompt stays the same size however long the session
+runs. settings.CHAT_SUMMARIZER picks how turns are folded: "model" asks the
+chat model; "extractive" keeps the first sentence of each question and answer
+and is the local stand-in for tests and the fallback when the model fails.
+"""
+
+import logging
+import re
+
+from django.conf import settings
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .llm import LLMError, stream_reply
+from .models import ChatLog, ChatSession
+
+logger = logging.getLogger(__name__)
+
+# Turns folded in one go at most; a longer backlog is caught up over the next chats
+MAX_FOLD_TURNS = 20
+
+# Characters kept from each question and answer by the extractive summarizer
+QUESTION_CHARS = 120
+ANSWER_CHARS = 200
+
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s|\n")
+
+SUMMARY_PROMPT = (
+    "Update the summary of a conversation between a Kerala farmer and Kissan AI, a farming assistant. "
+    "Keep the farmer's crops, problems, the advice already given and any open questions. "
+    "Write short notes in {language}, at most {limit} characters.\n\n"
+    "Summary so far:\n{summary}\n\n"
+    "New messages:\n{turns}\n\n"
+    "Updated summary:"
+)
+
+
+def _first_sentence(text, limit):
+    sentence = _SENTENCE_END.split(text.strip(), maxsplit=1)[0].strip()
+    if len(sentence) > limit:
+        sentence = sentence[:limit - 1].rstrip() + "…"
+    return sentence
+
+
+def format_turns(turns):
+    """
+    (question, answer) pairs as the dialogue lines used in prompts.
+    """
+    return "\n".join(f"Farmer: {question}\nKissan AI: {answer}" for question, answer in turns)
+
+
+class Summarizer:
+    """
+    Base class: summarize() returns `summary` with `turns` ((question, answer)
+    pairs, oldest first) folded in.
+    """
+
+    async def summarize(self, summary, turns, language):
+        raise NotImplementedError
+
+
+class ExtractiveSummarizer(Summarizer):
+    """
+    One line per turn from the first sentence of the question and the answer;
+    the oldest lines are dropped beyond CHAT_SUMMARY_MAX_CHARS. No model call.
+    """
+
+    async def summarize(self, summary, turns, language):
+        lines = summary.splitlines() if summary else []
+        lines += [
+            f"- Q: {_first_sentence(question, QUESTION_CHARS)} A: {_first_sentence(answer, ANSWER_CHARS)}"
+            for question, answer in turns
+        ]
+        while len(lines) > 1 and sum(len(line) + 1 for line in lines) > settings.CHAT_SUMMARY_MAX_CHARS:
+            lines.pop(0)
+        return "\n".join(lines)[:settings.CHAT_SUMMARY_MAX_CHARS]
+
+
+class ModelSummarizer(Summarizer):
+    """
+    Asks the chat model to rewrite the summary with the new turns, falling back
+    to the extractive summary when the model fails.
+    """
+
+    async def summarize(self, summary, turns, language):
+        prompt = SUMMARY_PROMPT.format(
+            language="Malayalam" if language == "ml" else "English",
+            limit=settings.CHAT_SUMMARY_MAX_CHARS,
+            summary=summary or "(none)",
+            turns=format_turns(turns),
+        )
+        try:
+            text = "".join([chunk async for chunk in stream_reply(prompt, language)]).strip()
+        except LLMError as e:
+            logger.warning(f"Model summary failed, using the extractive summary: {e}")
+            text = ""
+        if not text:
+            return await ExtractiveSummarizer().summarize(summary, turns, language)
+        return text[:settings.CHAT_SUMMARY_MAX_CHARS]
+
+
+SUMMARIZERS = {
+    "model": ModelSummarizer,
+    "extractive": ExtractiveSummarizer,
+}
+
+
+def get_summarizer():
+    name = settings.CHAT_SUMMARIZER
+    summarizer_class = SUMMARIZERS[name] if name in SUMMARIZERS else import_string(name)
+    return summarizer_class()
+
+
+async def session_context(user, session_id):
+    """
+    (summary, recent turns) for the next prompt of a session: the stored
+    summary and the last CHAT_CONTEXT_TURNS turns after it, oldest first.
+    """
+    session = await ChatSession.objects.filter(user=user, session_id=session_id).only(
+        "summary", "summarized_through",
+    ).afirst()
+    if session is None:
+        return "", []
+    recent = [
+        turn async for turn in ChatLog.objects.filter(
+            user=user, session_id=session_id, id__gt=session.summarized_through,
+        ).order_by("-id").values_list("user_question", "ai_response")[:settings.CHAT_CONTEXT_TURNS]
+    ]
+    return session.summary, recent[::-1]
+
+
+async def fold_session(user, session_id):
+    """
+    Folds the session's turns older than its last CHAT_CONTEXT_TURNS into the
+    summary. The update only applies if no concurrent fold moved the summary
+    first. Returns the number of turns folded.
+    """
+    keep = settings.CHAT_CONTEXT_TURNS
+    session = await ChatSession.objects.filter(user=user, session_id=session_id).only(
+        "language", "summary", "summarized_through",
+    ).afirst()
+    if session is None:
+        return 0
+    pending = [
+        row async for row in ChatLog.objects.filter(
+            user=user, session_id=session_id, id__gt=session.summarized_through,
+        ).order_by("id").values_list("id", "user_question", "ai_response")[:MAX_FOLD_TURNS + keep]
+    ]
+    if len(pending) <= keep:
+        return 0
+    fold = pending[:len(pending) - keep]
+
+    summary = await get_summarizer().summarize(
+        session.summary, [(question, answer) for _, question, answer in fold], session.language,
+    )
+    updated = await ChatSession.objects.filter(
+        pk=session.pk, summarized_through=session.summarized_through,
+    ).aupdate(
+        summary=summary,
+        summarized_through=fold[-1][0],
+        summarized_turns=F("summarized_turns") + len(fold),
+    )
+    return len(fold) if updated else 0
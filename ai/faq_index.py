@@ -0,0 +1,229 @@
+# ai/faq_index.py
+"""
+In-memory matcher over the active FarmingFAQ rows.
+
+Each FAQ takes a slot (a bit position). An inverted index maps keyword tokens
+to bitmaps of the FAQs using them, and the district, season, crop and
+language targets are bitmaps too, so narrowing a question down to its
+candidate FAQs is a handful of integer ORs and ANDs. FAQs are added, replaced
+and removed one at a time as they are saved, without rebuilding the rest.
+"""
+
+import logging
+import threading
+import time
+
+from core.text import normalize, tokenize
+from .models import FarmingFAQ
+
+logger = logging.getLogger(__name__)
+
+# An FAQ matches when this many of its keywords (or all of them, if it has
+# fewer) appear in the question
+MIN_KEYWORD_MATCHES = 2
+
+# How often FAQs saved by other processes are picked up
+REFRESH_SECONDS = 60
+
+
+def _keyword_tokens(keyword):
+    return frozenset(tokenize(keyword))
+
+
+def _target_key(value):
+    return normalize(str(value)).strip()
+
+
+def _crop_key(crop):
+    # Tokenized like the question, so നെല്ല് matches നെല്ലിന്
+    return " ".join(tokenize(str(crop)))
+
+
+def _season_key(season):
+    # "Kharif (വർഷാക്കാലം)" and "kharif" target the same season
+    return _target_key(season).split(" ")[0] if season else ""
+
+
+class FAQEntry:
+    __slots__ = ("faq_id", "slot", "keywords", "priority", "answers", "category", "updated_at", "keys")
+
+    def __init__(self, faq, slot):
+        self.faq_id = faq.id
+        self.slot = slot
+        self.keywords = [tokens for tokens in map(_keyword_tokens, faq.keywords or []) if tokens]
+        self.priority = faq.priority
+        self.answers = {"ml": faq.answer_ml, "en": faq.answer_en}
+        self.category = faq.category
+        self.updated_at = faq.updated_at
+        self.keys = []  # (bitmap table, key) pairs this entry's bit is set in
+
+
+class FAQIndex:
+    def __init__(self):
+        self.entries = {}  # faq id -> FAQEntry
+        self.slots = []  # slot -> FAQEntry or None
+        self.free_slots = []
+
+        self.tokens = {}  # keyword token -> bitmap
+        self.districts = {}  # district -> bitmap; "" is FAQs for every district
+        self.seasons = {}
+        self.crops = {}
+        self.languages = {}  # "ml" / "en" -> bitmap of FAQs with an answer in it
+        self.one_token = {}  # "" -> bitmap of FAQs whose keywords are a single token
+        self.refreshed_at = None
+
+    def _set(self, entry, table, key):
+        table[key] = table.get(key, 0) | (1 << entry.slot)
+        entry.keys.append((table, key))
+
+    def add(self, faq):
+        """
+        Adds or replaces one FAQ. Inactive FAQs and FAQs without keywords are removed.
+        """
+        self.remove(faq.id)
+        if not faq.is_active:
+            return
+
+        slot = self.free_slots.pop() if self.free_slots else len(self.slots)
+        entry = FAQEntry(faq, slot)
+        if not entry.keywords:
+            self.free_slots.append(slot)
+            return
+        if slot == len(self.slots):
+            self.slots.append(entry)
+        else:
+            self.slots[slot] = entry
+        self.entries[faq.id] = entry
+
+        keyword_tokens = set().union(*entry.keywords)
+        for token in keyword_tokens:
+            self._set(entry, self.tokens, token)
+        if len(keyword_tokens) == 1:
+            self._set(entry, self.one_token, "")
+        for table, values, key in (
+            (self.districts, faq.applicable_districts, _target_key),
+            (self.seasons, faq.applicable_seasons, _season_key),
+            (self.crops, faq.applicable_crops, _crop_key),
+        ):
+            for value in {key(value) for value in values or []} or {""}:
+                self._set(entry, table, value)
+        for language, answer in entry.answers.items():
+            if answer.strip():
+                self._set(entry, self.languages, language)
+
+    def remove(self, faq_id):
+        entry = self.entries.pop(faq_id, None)
+        if entry is None:
+            return
+        bit = ~(1 << entry.slot)
+        for table, key in entry.keys:
+            table[key] &= bit
+            if not table[key]:
+                del table[key]
+        self.slots[entry.slot] = None
+        self.free_slots.append(entry.slot)
+
+    def match(self, question, district=None, season=None, crops=(), language="ml"):
+        """
+        The best-priority FAQ for the question that targets the district,
+        season and one of the crops (or does not target them), or None.
+        Ties go to the FAQ with more matching keywords.
+        """
+        words = tokenize(question)
+        tokens = set(words)
+        # Every FAQ needs two of its tokens in the question unless it only has one
+        seen_once = seen_twice = 0
+        for token in tokens:
+            bits = self.tokens.get(token, 0)
+            seen_twice |= seen_once & bits
+            seen_once |= bits
+        candidates = seen_twice | (seen_once & self.one_token.get("", 0))
+        if not candidates:
+            return None
+
+        candidates &= self.languages.get(language, 0)
+        candidates &= self.districts.get("", 0) | self.districts.get(_target_key(district or ""), 0)
+        candidates &= self.seasons.get("", 0) | self.seasons.get(_season_key(season), 0)
+        # A crop target is met by a crop the farmer grows or one named in the question
+        crop_bits = self.crops.get("", 0)
+        mentioned = tokens | {f"{a} {b}" for a, b in zip(words, words[1:])}
+        for crop in {_crop_key(crop) for crop in crops if crop} | mentioned:
+            crop_bits |= self.crops.get(crop, 0)
+        candidates &= crop_bits
+
+        best, best_rank = None, None
+        while candidates:
+            low = candidates & -candidates
+            entry = self.slots[low.bit_length() - 1]
+            candidates ^= low
+
+            matched = sum(1 for keyword in entry.keywords if keyword <= tokens)
+            if matched < min(MIN_KEYWORD_MATCHES, len(entry.keywords)):
+                continue
+            rank = (entry.priority, matched, entry.faq_id)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = entry, rank
+        return best
+
+
+_lock = threading.Lock()
+_index = FAQIndex()
+
+
+def _refresh():
+    """
+    Brings the index up to date with the table: FAQs whose updated_at moved are
+    reloaded and FAQs that are gone are dropped, leaving the rest untouched.
+    """
+    current = dict(FarmingFAQ.objects.filter(is_active=True).values_list("id", "updated_at"))
+    for faq_id in [faq_id for faq_id in _index.entries if faq_id not in current]:
+        _index.remove(faq_id)
+    changed = [
+        faq_id for faq_id, updated_at in current.items()
+        if faq_id not in _index.entries or _index.entries[faq_id].updated_at != updated_at
+    ]
+    if changed:
+        for faq in FarmingFAQ.objects.filter(id__in=changed):
+            _index.add(faq)
+        logger.info(f"Loaded {len(changed)} farming FAQs into the matcher")
+    _index.refreshed_at = time.monotonic()
+
+
+def _current_index():
+    if _index.refreshed_at is None or time.monotonic() - _index.refreshed_at > REFRESH_SECONDS:
+        _refresh()
+    return _index
+
+
+def match_faq(question, district=None, season=None, crops=(), language="ml"):
+    """
+    Returns {"faq_id", "answer", "category", "priority"} for the FAQ that
+    answers the question, or None.
+    """
+    with _lock:
+        entry = _current_index().match(question, district, season, crops, language)
+    if entry is None:
+        return None
+    return {
+        "faq_id": entry.faq_id,
+        "answer": entry.answers[language],
+        "category": entry.category,
+        "priority": entry.priority,
+    }
+
+
+def faq_saved(faq):
+    with _lock:
+        if _index.refreshed_at is not None:
+            _index.add(faq)
+
+
+def faq_deleted(faq_id):
+    with _lock:
+        _index.remove(faq_id)
+
+
+def clear():
+    global _index
+    with _lock:
+        _index = FAQIndex()
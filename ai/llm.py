@@ -0,0 +1,232 @@
+# ai/llm.py
+"""
+Model backends for the streaming chat proxy. A backend turns a prompt into an
+async stream of text chunks; settings.LLM_BACKEND picks which one is used.
+"""
+
+import asyncio
+import json
+import logging
+import weakref
+from contextlib import asynccontextmanager
+
+import httpx
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+GEMINI_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent"
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "topK": 40,
+    "topP": 0.95,
+    "maxOutputTokens": 1024,
+}
+
+
+class LLMError(Exception):
+    """The model backend failed or returned something unusable."""
+
+
+class LLMBusy(LLMError):
+    """Every stream slot in this process is taken."""
+
+
+async def _sse_data(response):
+    """
+    Yields the data field of each Server-Sent Event in an httpx streaming response.
+    """
+    data = []
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip())
+        elif not line and data:
+            yield "\n".join(data)
+            data = []
+    if data:
+        yield "\n".join(data)
+
+
+def _event_json(data):
+    """
+    The JSON object in an event's data, or LLMError for a malformed event, so
+    a broken chunk ends the reply with an error event instead of breaking the stream.
+    """
+    try:
+        payload = json.loads(data)
+    except ValueError as e:
+        raise LLMError(f"Malformed event from the model: {e}") from e
+    if not isinstance(payload, dict):
+        raise LLMError("Malformed event from the model: expected a JSON object")
+    return payload
+
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+
+def _client():
+    """
+    One pooled HTTP client per event loop, so connections to the model are reused.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=settings.LLM_IDLE_TIMEOUT))
+        _clients[loop] = client
+    return client
+
+
+class LLMBackend:
+    """
+    Base class: stream() is an async generator of text chunks.
+    """
+
+    async def stream(self, prompt, language):
+        raise NotImplementedError
+
+
+class GeminiBackend(LLMBackend):
+    async def stream(self, prompt, language):
+        if not settings.GEMINI_API_KEY:
+            raise LLMError("GEMINI_API_KEY is not configured")
+
+        url = GEMINI_STREAM_URL.format(model=settings.GEMINI_MODEL)
+        body = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": GENERATION_CONFIG}
+        async with _client().stream(
+            "POST", url, params={"alt": "sse"}, json=body,
+            headers={"x-goog-api-key": settings.GEMINI_API_KEY},
+        ) as response:
+            if response.status_code != 200:
+                raise LLMError(f"Gemini returned HTTP {response.status_code}")
+            async for data in _sse_data(response):
+                payload = _event_json(data)
+                try:
+                    texts = [
+                        part["text"]
+                        for candidate in payload.get("candidates", [])[:1]
+                        for part in candidate.get("content", {}).get("parts", [])
+                        if part.get("text")
+                    ]
+                except (AttributeError, KeyError, TypeError) as e:
+                    raise LLMError(f"Unexpected event from Gemini: {e!r}") from e
+                for text in texts:
+                    yield text
+
+
+class LocalBackend(LLMBackend):
+    """
+    Any HTTP model server that takes POST {"prompt", "language"} and answers
+    with SSE events carrying {"text": ...}, ending with "data: [DONE]".
+    `manage.py run_stub_llm` is such a server.
+    """
+
+    async def stream(self, prompt, language):
+        async with _client().stream(
+            "POST", settings.LLM_LOCAL_URL, json={"prompt": prompt, "language": language},
+        ) as response:
+            if response.status_code != 200:
+                raise LLMError(f"Model server returned HTTP {response.status_code}")
+            async for data in _sse_data(response):
+                if data == "[DONE]":
+                    return
+                text = _event_json(data).get("text")
+                if not isinstance(text, str):
+                    raise LLMError("Model server event has no text")
+                yield text
+
+
+def stub_reply(prompt, language):
+    """
+    Deterministic canned answer used by the stub backend and the stand-in model server.
+    """
+    question = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+    if language == "ml":
+        return f"ഇത് ഒരു പരീക്ഷണ മറുപടിയാണ്. നിങ്ങളുടെ ചോദ്യം: {question}"
+    return f"This is a test reply. You asked: {question}"
+
+
+class StubBackend(LLMBackend):
+    """
+    In-process canned replies streamed word by word, for tests and offline work.
+    """
+
+    async def stream(self, prompt, language):
+        for word in stub_reply(prompt, language).split(" "):
+            await asyncio.sleep(0)
+            yield word + " "
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "local": LocalBackend,
+    "stub": StubBackend,
+}
+
+
+def get_backend():
+    name = settings.LLM_BACKEND
+    backend_class = BACKENDS[name] if name in BACKENDS else import_string(name)
+    return backend_class()
+
+
+# --- Concurrency limit ---
+
+_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+
+
+def _semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _slots.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENT_STREAMS)
+        _slots[loop] = semaphore
+    return semaphore
+
+
+def streams_full():
+    return _semaphore().locked()
+
+
+@asynccontextmanager
+async def stream_slot():
+    """
+    Holds one of the LLM_MAX_CONCURRENT_STREAMS slots of this process, waiting
+    at most LLM_QUEUE_TIMEOUT seconds for one. Raises LLMBusy on timeout.
+    """
+    semaphore = _semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), settings.LLM_QUEUE_TIMEOUT)
+    except TimeoutError:
+        raise LLMBusy("Too many chats in progress, try again shortly")
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+async def stream_reply(prompt, language):
+    """
+    Streams the configured backend's reply within the concurrency limit.
+    Each chunk, the first included, must arrive within LLM_IDLE_TIMEOUT seconds
+    and the whole reply within LLM_STREAM_TIMEOUT. Raises LLMError on failure.
+    """
+    backend = get_backend()
+    async with stream_slot():
+        chunks = backend.stream(prompt, language)
+        try:
+            async with asyncio.timeout(settings.LLM_STREAM_TIMEOUT):
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(anext(chunks), settings.LLM_IDLE_TIMEOUT)
+                    except StopAsyncIteration:
+                        return
+                    yield chunk
+        except TimeoutError:
+            raise LLMError("The model took too long to answer")
+        except httpx.HTTPError as e:
+            logger.warning(f"Model request failed: {e}")
+            raise LLMError("Could not reach the model")
+        finally:
+            await chunks.aclose()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ai.retrieval import write_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the retrieval index of well-rated chat answers (ANSWER_INDEX_PATH). "
+        "Web processes map the new file within a minute and apply newer ratings on "
+        "top, so run it from cron (e.g. nightly) to keep their in-memory part small."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Write here instead of ANSWER_INDEX_PATH")
+
+    def handle(self, *args, **options):
+        count, path = write_index(options["path"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} rated chat answers in {path}"))
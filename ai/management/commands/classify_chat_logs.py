@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ai.classify import classify_chat, get_automaton
+from ai.models import ChatLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract the category and crops mentioned from every stored chat question, "
+        "as is now done when a chat is written. Walks the table in id order in "
+        "batches and only updates rows whose values change."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        automaton = get_automaton()
+        last_id = 0
+        scanned = updated = 0
+
+        while True:
+            rows = list(
+                ChatLog.objects.filter(id__gt=last_id).order_by("id")
+                .values_list("id", "user_question", "category", "crops_mentioned")[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            scanned += len(rows)
+
+            now = timezone.now()
+            changed = []
+            for chat_id, question, category, crops in rows:
+                new_category, new_crops = classify_chat(question, category, automaton)
+                if (new_category, new_crops) != (category, crops):
+                    # updated_at moves so incremental exports pick the change up
+                    changed.append(ChatLog(id=chat_id, category=new_category, crops_mentioned=new_crops, updated_at=now))
+            ChatLog.objects.bulk_update(changed, ["category", "crops_mentioned", "updated_at"])
+            updated += len(changed)
+
+        self.stdout.write(self.style.SUCCESS(f"Classified {scanned} chat logs, {updated} updated"))
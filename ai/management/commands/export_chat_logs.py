@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ai.chat_export import (
+    DEFAULT_CHUNK_SIZE, export_rows, new_watermark, parse_watermark, write_jsonl_gz, write_parquet,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Export chat logs for offline analytics as gzip-compressed JSONL or Parquet, "
+        "streaming rows so memory use does not grow with the table. With --state the "
+        "export is incremental: it starts from the watermark saved by the previous run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="File to write, e.g. chatlogs.jsonl.gz or chatlogs.parquet")
+        parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+        parser.add_argument("--since", help="Only rows updated at or after this ISO timestamp")
+        parser.add_argument("--state", help="File holding the watermark; read before and updated after the export")
+        parser.add_argument("--with-text", action="store_true", help="Include questions, answers and feedback")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        state = Path(options["state"]) if options["state"] else None
+        since = options["since"]
+        if since is None and state is not None and state.exists():
+            since = state.read_text().strip()
+        try:
+            since = parse_watermark(since)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        until = new_watermark()
+        rows = export_rows(since, until, with_text=options["with_text"], chunk_size=options["chunk_size"])
+        output = Path(options["output"])
+        partial = output.with_name(output.name + ".partial")
+        try:
+            if options["format"] == "parquet":
+                count = write_parquet(partial, rows, options["with_text"], options["chunk_size"])
+            else:
+                count = write_jsonl_gz(partial, rows)
+        except RuntimeError as e:
+            partial.unlink(missing_ok=True)
+            raise CommandError(str(e))
+        partial.replace(output)
+
+        # Only advanced once the file is complete, so a failed run is simply repeated
+        if state is not None:
+            state.write_text(until.isoformat())
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {count} chat logs to {output} (watermark {until.isoformat()})"
+        ))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ai.chat_ingest import replay_orphaned_segments
+
+
+class Command(BaseCommand):
+    help = (
+        "Write chat logs left in the spool (CHAT_INGEST_SPOOL_DIR) by web processes "
+        "that stopped before flushing. Chats already written are skipped. Safe to "
+        "run from cron or a deploy hook while the site is up."
+    )
+
+    def handle(self, *args, **options):
+        written = replay_orphaned_segments(settings.CHAT_INGEST_SPOOL_DIR, settings.CHAT_INGEST_BATCH_SIZE)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} spooled chat logs"))
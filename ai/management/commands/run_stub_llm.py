@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand
+
+from ai.llm import stub_reply
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a stand-in model server for the chat proxy (LLM_BACKEND=local). "
+        "It answers POST {\"prompt\", \"language\"} with canned replies streamed "
+        "word by word as Server-Sent Events, so the streaming path can be exercised "
+        "without a Gemini key or network access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--delay", type=float, default=0.05, help="Seconds between streamed words")
+        parser.add_argument("--first-token-delay", type=float, default=0.3,
+                            help="Seconds before the first word, like a real model's prefill")
+
+    def handle(self, *args, **options):
+        self.delay = options["delay"]
+        self.first_token_delay = options["first_token_delay"]
+        try:
+            asyncio.run(self.serve(options["host"], options["port"]))
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self.stdout.write(f"Stub model server listening on http://{host}:{port}/generate")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            if not request_line.startswith(b"POST "):
+                writer.write(b"HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+            )
+            await writer.drain()
+            await asyncio.sleep(self.first_token_delay)
+            for word in stub_reply(payload.get("prompt", ""), payload.get("language", "ml")).split(" "):
+                event = json.dumps({"text": word + " "}, ensure_ascii=False)
+                writer.write(f"data: {event}\n\n".encode())
+                await writer.drain()
+                await asyncio.sleep(self.delay)
+            writer.write(b"data: [DONE]\n\n")
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,62 @@
+# Generated by Django 5.1.6 on 2026-10-19 13:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def backfill_chat_sessions(apps, schema_editor):
+    ChatLog = apps.get_model('ai', 'ChatLog')
+    ChatSession = apps.get_model('ai', 'ChatSession')
+
+    first_logs = {}
+    for log in ChatLog.objects.order_by('created_at', 'id').only('user_id', 'session_id', 'user_question', 'language').iterator():
+        first_logs.setdefault((log.user_id, log.session_id), log)
+
+    sessions = []
+    totals = ChatLog.objects.order_by().values('user_id', 'session_id').annotate(
+        message_count=Count('id'), started_at=Min('created_at'), last_activity_at=Max('created_at'),
+    )
+    for row in totals:
+        question = first_logs[(row['user_id'], row['session_id'])].user_question
+        sessions.append(ChatSession(
+            user_id=row['user_id'],
+            session_id=row['session_id'],
+            preview=question[:50] + ('...' if len(question) > 50 else ''),
+            language=first_logs[(row['user_id'], row['session_id'])].language,
+            message_count=row['message_count'],
+            started_at=row['started_at'],
+            last_activity_at=row['last_activity_at'],
+        ))
+    ChatSession.objects.bulk_create(sessions, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=100)),
+                ('preview', models.CharField(max_length=60)),
+                ('language', models.CharField(choices=[('ml', 'Malayalam'), ('en', 'English')], default='ml', max_length=2)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField()),
+                ('last_activity_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_activity_at'],
+                'indexes': [models.Index(fields=['user', '-last_activity_at', '-id'], name='ai_chatsess_user_id_90cac0_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'session_id'), name='unique_chat_session_per_user')],
+            },
+        ),
+        migrations.RunPython(backfill_chat_sessions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0002_chatsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatlog',
+            name='ingest_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-19 13:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0003_chatlog_ingest_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatlog',
+            index=models.Index(fields=['updated_at', 'id'], name='ai_chatlog_updated_d0e794_idx'),
+        ),
+    ]
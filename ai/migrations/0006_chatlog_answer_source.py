@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0005_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatlog',
+            name='answer_source',
+            field=models.CharField(choices=[('model', 'Model'), ('faq', 'Farming FAQ'), ('cache', 'Answer cache')], default='model', max_length=10),
+        ),
+    ]
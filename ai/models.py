@@ -25,6 +25,12 @@ class ChatLog(models.Model):
         ('MARKET', 'Market Information'),
         ('OTHER', 'Other'),
     ]
+
+    SOURCE_CHOICES = [
+        ('model', 'Model'),
+        ('faq', 'Farming FAQ'),
+        ('cache', 'Answer cache'),
+    ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_logs")
     session_id = models.CharField(max_length=100)  # To group conversations
@@ -32,6 +38,8 @@ class ChatLog(models.Model):
     ai_response = models.TextField()
     language = models.CharField(max_length=2, choices=LANGUAGE_CHOICES, default='ml')
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='GENERAL')
+    # Where the answer came from; only model answers are reused by the answer cache
+    answer_source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='model')
     
     # Context information
     user_district = models.CharField(max_length=50, blank=True, null=True)
@@ -42,6 +50,9 @@ class ChatLog(models.Model):
     is_helpful = models.BooleanField(null=True, blank=True)
     user_feedback = models.TextField(blank=True, null=True)
     
+    # Set by buffered ingestion so a replayed write is recognised and skipped
+    ingest_key = models.CharField(max_length=64, unique=True, blank=True, null=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -51,11 +62,42 @@ class ChatLog(models.Model):
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['session_id', '-created_at']),
             models.Index(fields=['category', '-created_at']),
+            models.Index(fields=['updated_at', 'id']),  # Incremental exports
         ]
     
     def _str_(self):
         return f"Chat by {self.user.name or self.user.mobile} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
+class ChatSession(models.Model):
+    """
+    One row per chat session, kept up to date as ChatLog rows are written,
+    so the history list is a single query instead of one per session.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_sessions")
+    session_id = models.CharField(max_length=100)
+    preview = models.CharField(max_length=60)  # Start of the first question
+    language = models.CharField(max_length=2, choices=ChatLog.LANGUAGE_CHOICES, default='ml')  # Of the first question
+    message_count = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField()
+    last_activity_at = models.DateTimeField()
+
+    # Rolling summary of the turns older than the ones sent to the model verbatim
+    summary = models.TextField(blank=True)
+    summarized_through = models.PositiveBigIntegerField(default=0)  # Id of the last ChatLog in the summary
+    summarized_turns = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-last_activity_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'session_id'], name='unique_chat_session_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.session_id} ({self.message_count} messages)"
+
 # You can also add this helper model for storing common farming FAQs
 class FarmingFAQ(models.Model):
     """
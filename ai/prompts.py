@@ -0,0 +1,269 @@
+# ai/prompts.py
+"""
+Prompt construction for the chat proxy.
+
+The farmer's data is reduced to compact facts (each crop's stage, days since
+each kind of activity, pending advisories), memoized per user data version.
+For each question those facts are ranked by relevance - crops the question
+names first, then crops with urgent advisories, then growing crops - and
+added until PROMPT_CONTEXT_TOKENS is reached, so the prompt stays the same
+size however many crops and logs the farmer has.
+"""
+
+from itertools import zip_longest
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Max, Q, When
+from django.utils import timezone
+
+from core.context_version import catalog_version, user_version
+from core.models import ActivityLog, Advisory, Crop
+from .classify import classify_question
+from .conversation import format_turns
+from .seasons import get_current_season
+
+SYSTEM_PROMPTS = {
+    "ml": "You are Kissan AI, a helpful farming assistant for Kerala farmers. Respond ONLY in Malayalam. "
+          "Provide practical advice based on the user profile, crops, and recent activities. "
+          "Be encouraging and use local farming knowledge.",
+    "en": "You are Kissan AI, a helpful farming assistant for Kerala farmers. Respond ONLY in English. "
+          "Provide practical advice based on the user profile, crops, and recent activities. "
+          "Be encouraging and use local farming knowledge.",
+}
+
+LANGUAGE_NAMES = {"ml": "Malayalam", "en": "English"}
+
+# Pending advisories kept in the memoized facts; the budget decides how many are sent
+MAX_ADVISORIES = 10
+ADVISORY_ORDER = {"URGENT": 0, "ROUTINE": 1, "TIP": 2}
+
+# Activities per question category, listed first on each crop line
+ACTIVITY_LABELS = {
+    "irrigate": "irrigated",
+    "fertilize": "fertilized",
+    "pesticide": "pesticide",
+}
+CATEGORY_ACTIVITIES = {
+    "IRRIGATION": "irrigate",
+    "FERTILIZER": "fertilize",
+    "PEST_CONTROL": "pesticide",
+}
+
+FACTS_CACHE_SECONDS = 24 * 60 * 60
+
+CROPS_HEADER = "Crops (most relevant first):"
+ADVISORIES_HEADER = "Pending advisories:"
+LEFT_OUT_NOTE = "(+{count} more crops not listed)"
+
+# Characters of each retrieved past answer included in a prompt
+PASSAGE_CHARS = 400
+
+
+def _char_counts(text):
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return ascii_chars, len(text) - ascii_chars
+
+
+def _tokens(ascii_chars, other_chars):
+    return ascii_chars // 4 + other_chars // 2 + 1
+
+
+def estimate_tokens(text):
+    """
+    Rough model token count: about four characters per token for English, while
+    Malayalam script takes about one token per two characters.
+    """
+    return _tokens(*_char_counts(text))
+
+
+def _crop_stage(crop, today):
+    if crop.is_harvested:
+        stage = "harvested"
+    elif crop.is_sown and crop.sown_date:
+        stage = f"sown {(today - crop.sown_date).days} days ago"
+    elif crop.is_sown:
+        stage = "growing"
+    else:
+        stage = "not sown yet"
+    catalog = crop.catalog_entry
+    if catalog is not None and not crop.is_harvested and catalog.harvests_in(today.month):
+        stage += ", harvest season"
+    return stage
+
+
+def build_context_facts(user):
+    """
+    The farmer's data reduced to what the prompt can use. Three queries, and
+    the size depends on the number of crops, never on the number of logs.
+    """
+    today = timezone.now().date()
+    crops = list(Crop.objects.filter(user=user).order_by("id"))
+
+    last_done = {
+        row["crop_id"]: row
+        for row in ActivityLog.objects.filter(crop__user=user).order_by().values("crop_id").annotate(
+            irrigate=Max("date", filter=Q(did_irrigate=True)),
+            fertilize=Max("date", filter=Q(did_fertilize=True)),
+            pesticide=Max("date", filter=Q(did_apply_pesticide=True)),
+        )
+    }
+
+    advisories = (
+        Advisory.objects.filter(crop__user=user, is_acknowledged=False)
+        .annotate(rank=Case(
+            *(When(category=category, then=rank) for category, rank in ADVISORY_ORDER.items()),
+            default=len(ADVISORY_ORDER),
+        ))
+        .order_by("rank", "-date", "-id")
+        .values("crop_id", "category", "message")[:MAX_ADVISORIES]
+    )
+
+    crop_facts = []
+    for crop in crops:
+        done = last_done.get(crop.id, {})
+        crop_facts.append({
+            "id": crop.id,
+            "name": crop.name,
+            "english_name": crop.english_name or "",
+            "catalog_name": crop.catalog_entry.name if crop.catalog_entry else crop.name,
+            "growing": crop.is_sown and not crop.is_harvested,
+            "stage": _crop_stage(crop, today),
+            "days_since": {
+                activity: (today - done[activity]).days if done.get(activity) else None
+                for activity in ACTIVITY_LABELS
+            },
+        })
+
+    return {
+        "profile": [
+            f"Name: {user.name or 'Farmer'}",
+            f"District: {user.district or 'Kerala'}",
+            f"Farm Size: {user.get_acreage_display() if user.acreage else 'Small scale'}",
+            f"Soil Type: {user.soil_type or 'Mixed'}",
+            f"Pincode: {user.pincode or ''}",
+            f"Season: {get_current_season()}",
+        ],
+        "crops": crop_facts,
+        "advisories": list(advisories),
+    }
+
+
+def get_context_facts(user):
+    """
+    build_context_facts, memoized until the farmer's data (or the day) changes.
+    """
+    key = (
+        f"prompt-facts:{user.pk}:{user_version(user.pk)}:{catalog_version()}:"
+        f"{timezone.now().date().isoformat()}"
+    )
+    facts = cache.get(key)
+    if facts is None:
+        facts = build_context_facts(user)
+        cache.set(key, facts, FACTS_CACHE_SECONDS)
+    return facts
+
+
+def _crop_line(crop, first_activity):
+    activities = sorted(ACTIVITY_LABELS, key=lambda activity: activity != first_activity)
+    done = ", ".join(
+        f"{ACTIVITY_LABELS[activity]} "
+        + ("never" if crop["days_since"][activity] is None else f"{crop['days_since'][activity]}d ago")
+        for activity in activities
+    )
+    english = f" ({crop['english_name']})" if crop["english_name"] else ""
+    return f"- {crop['name']}{english}: {crop['stage']}; {done}"
+
+
+def build_prompt_context(facts, question, budget):
+    """
+    The context block for one question: the profile, then crop and advisory
+    lines ranked by relevance to the question, added while they fit `budget`
+    tokens. Crops left out are counted in a closing note.
+    """
+    category, mentioned = classify_question(question)
+    mentioned = set(mentioned)
+    first_activity = CATEGORY_ACTIVITIES.get(category)
+    crops_by_id = {crop["id"]: crop for crop in facts["crops"]}
+    urgent_crops = {advisory["crop_id"] for advisory in facts["advisories"] if advisory["category"] == "URGENT"}
+
+    def crop_rank(crop):
+        named = crop["name"] in mentioned or crop["catalog_name"] in mentioned
+        return (not named, crop["id"] not in urgent_crops, not crop["growing"], crop["id"])
+
+    def advisory_rank(advisory):
+        crop = crops_by_id.get(advisory["crop_id"])
+        named = crop is not None and (crop["name"] in mentioned or crop["catalog_name"] in mentioned)
+        return (not named, ADVISORY_ORDER.get(advisory["category"], 3))
+
+    lines = ["User Profile:", *facts["profile"]]
+
+    # Crops and advisories alternate so neither crowds the other out
+    crop_lines = [_crop_line(crop, first_activity) for crop in sorted(facts["crops"], key=crop_rank)]
+    advisory_lines = [
+        f"- {crops_by_id[advisory['crop_id']]['name'] if advisory['crop_id'] in crops_by_id else ''} "
+        f"[{advisory['category']}]: {advisory['message']}"
+        for advisory in sorted(facts["advisories"], key=advisory_rank)
+    ]
+
+    # Characters in the block so far, with room kept for the section headers
+    # and the left-out note, so the finished block never exceeds the budget
+    fixed = "\n".join(lines)
+    if crop_lines:
+        fixed += f"\n\n{CROPS_HEADER}\n" + LEFT_OUT_NOTE.format(count=len(crop_lines))
+    if advisory_lines:
+        fixed += f"\n\n{ADVISORIES_HEADER}"
+    used_ascii, used_other = _char_counts(fixed)
+
+    chosen = {"crops": [], "advisories": []}
+    queue = [
+        item
+        for pair in zip_longest(
+            [("crops", line) for line in crop_lines], [("advisories", line) for line in advisory_lines],
+        )
+        for item in pair if item is not None
+    ]
+
+    for section, line in queue:
+        line_ascii, line_other = _char_counts(line)
+        # +1 for the newline before the line
+        if _tokens(used_ascii + line_ascii + 1, used_other + line_other) > budget:
+            continue
+        chosen[section].append(line)
+        used_ascii += line_ascii + 1
+        used_other += line_other
+
+    if chosen["crops"]:
+        lines += ["", CROPS_HEADER, *chosen["crops"]]
+    left_out = len(crop_lines) - len(chosen["crops"])
+    if left_out:
+        lines.append(LEFT_OUT_NOTE.format(count=left_out))
+    if chosen["advisories"]:
+        lines += ["", ADVISORIES_HEADER, *chosen["advisories"]]
+    return "\n".join(lines)
+
+
+def build_prompt(user, question, language, summary="", recent=(), passages=()):
+    """
+    The full prompt for one question: system instructions, the farmer's
+    context within the token budget, well-rated past answers to similar
+    questions (the farmer's own and FAQ answers), the session so far (its rolling summary and recent turns), then
+    the question. Built server-side so the browser never talks to the model
+    directly.
+    """
+    context = build_prompt_context(get_context_facts(user), question, settings.PROMPT_CONTEXT_TOKENS)
+    grounding = ""
+    if passages:
+        grounding = "Earlier answers rated helpful for similar questions (use them only if relevant):\n" + "\n".join(
+            f"- Q: {passage['question']}\n  A: {passage['answer'][:PASSAGE_CHARS]}" for passage in passages
+        ) + "\n\n"
+    conversation = ""
+    if summary:
+        conversation += f"Conversation so far:\n{summary}\n\n"
+    if recent:
+        conversation += f"Recent messages:\n{format_turns(recent)}\n\n"
+    return (
+        f"{SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS['ml'])}\n\n{context}\n\n{grounding}{conversation}"
+        f"Please provide a helpful response in {LANGUAGE_NAMES.get(language, 'Malayalam')} language only.\n\n"
+        f"User Question: {question}"
+    )
@@ -0,0 +1,495 @@
+# ai/retrieval.py
+"""
+BM25 retrieval over the answers farmers rated highly, to ground the model.
+
+Chats rated 4 or more, or marked helpful, are indexed by question and answer
+with the shared Malayalam-aware tokenizer. A model answer was written from its
+farmer's name, crops and logs, so it is only retrieved for that farmer; FAQ
+answers hold nothing personal and are retrieved for everyone. `manage.py build_answer_index`
+writes the index as one file of flat arrays (sorted term hashes, postings in
+CSR layout, document lengths and texts). Workers memory-map that file instead
+of re-tokenizing the table at start-up. Ratings given since the file was
+written are applied on top: newly qualifying chats go to a small in-memory
+delta, and chats that no longer qualify are masked out of the file's postings.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.text import tokenize
+from .models import ChatLog
+
+logger = logging.getLogger(__name__)
+
+# Question terms count double: a new question is matched against old questions first
+QUESTION_WEIGHT = 2.0
+ANSWER_WEIGHT = 1.0
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Passages scoring lower share too little with the question to help
+MIN_SCORE = 2.0
+
+# How often a worker picks up new ratings and a rebuilt index file
+REFRESH_SECONDS = 30
+# Ratings are re-read this far behind the watermark, for transactions that committed late
+OVERLAP = timedelta(seconds=60)
+
+MAGIC = b"KSANSIDX"
+# Bumped whenever the tokenizer changes, so files indexed with the old terms are rebuilt
+FORMAT_VERSION = 3
+ALIGNMENT = 64
+
+LANGUAGES = ("ml", "en")
+UNKNOWN_LANGUAGE = 255
+
+ARRAYS = (
+    "term_hashes",  # uint64, sorted
+    "term_offsets",  # int64, postings of term i are [term_offsets[i], term_offsets[i + 1])
+    "post_docs",  # int32
+    "post_tf",  # float32, weighted term frequency
+    "chat_ids",  # int64, ascending
+    "doc_lengths",  # float32
+    "languages",  # uint8, index into LANGUAGES
+    "owners",  # uint64, owner_key() of the farmer the chat is private to, SHARED for FAQ answers
+    "text_offsets",  # int64, question of doc i at 2i, answer at 2i + 1
+    "text",  # uint8, UTF-8
+)
+
+
+def qualifies(rating, helpful):
+    """
+    Whether a chat's answer is worth retrieving: rated 4 or more, or marked
+    helpful, without also being rated 2 or less or marked unhelpful.
+    """
+    if helpful is False or (rating is not None and rating <= 2):
+        return False
+    return helpful is True or (rating is not None and rating >= 4)
+
+
+# Owner of chats any farmer may be shown
+SHARED = 0
+
+
+def owner_key(user_id):
+    """
+    The owner recorded for a farmer's chats: a hash, so the index file holds no
+    mobile numbers.
+    """
+    return term_hash(f"user:{user_id}") or 1
+
+
+def chat_owner(user_id, answer_source):
+    return SHARED if answer_source == "faq" else owner_key(user_id)
+
+
+def qualifying_logs():
+    return (
+        ChatLog.objects.filter(Q(user_rating__gte=4) | Q(is_helpful=True))
+        .exclude(is_helpful=False)
+        .exclude(user_rating__lte=2)
+    )
+
+
+def term_hash(token):
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+
+
+def _frequencies(question, answer):
+    frequencies = Counter()
+    for text, weight in ((question, QUESTION_WEIGHT), (answer, ANSWER_WEIGHT)):
+        for token in tokenize(text):
+            frequencies[term_hash(token)] += weight
+    return frequencies
+
+
+def _language_code(language):
+    return LANGUAGES.index(language) if language in LANGUAGES else UNKNOWN_LANGUAGE
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class Segment:
+    """
+    An immutable index over a set of chats as flat numpy arrays, built from
+    rows or memory-mapped from a file written by save().
+    """
+
+    def __init__(self, arrays, watermark, mapping=None):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.watermark = watermark
+        self.size = len(self.chat_ids)
+        self._mapping = mapping  # Keeps the file mapped while the arrays are in use
+
+    @classmethod
+    def build(cls, rows, watermark):
+        """
+        rows: (chat id, question, answer, language, owner) in ascending id order.
+        """
+        hashes, docs, tfs = [], [], []
+        chat_ids, lengths, languages, owners, text_offsets = [], [], [], [], [0]
+        text = bytearray()
+        for doc, (chat_id, question, answer, language, owner) in enumerate(rows):
+            frequencies = _frequencies(question, answer)
+            hashes.extend(frequencies)
+            docs.extend([doc] * len(frequencies))
+            tfs.extend(frequencies.values())
+            chat_ids.append(chat_id)
+            lengths.append(sum(frequencies.values()))
+            languages.append(_language_code(language))
+            owners.append(owner)
+            for part in (question, answer):
+                text += part.encode()
+                text_offsets.append(len(text))
+
+        hashes = np.array(hashes, dtype=np.uint64)
+        docs = np.array(docs, dtype=np.int32)
+        order = np.lexsort((docs, hashes))
+        term_hashes, counts = np.unique(hashes[order], return_counts=True)
+        arrays = {
+            "term_hashes": term_hashes.astype(np.uint64),
+            "term_offsets": np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            "post_docs": docs[order],
+            "post_tf": np.array(tfs, dtype=np.float32)[order],
+            "chat_ids": np.array(chat_ids, dtype=np.int64),
+            "doc_lengths": np.array(lengths, dtype=np.float32),
+            "languages": np.array(languages, dtype=np.uint8),
+            "owners": np.array(owners, dtype=np.uint64),
+            "text_offsets": np.array(text_offsets, dtype=np.int64),
+            "text": np.frombuffer(bytes(text), dtype=np.uint8),
+        }
+        return cls(arrays, watermark)
+
+    def save(self, path):
+        """
+        Writes the segment: a magic number, a JSON header giving each array's
+        dtype, offset and length, then the arrays, each aligned for mapping.
+        """
+        layout, offset = {}, 0
+        for name in ARRAYS:
+            array = getattr(self, name)
+            layout[name] = [array.dtype.str, offset, len(array)]
+            offset = _align(offset + array.nbytes)
+        header = json.dumps({
+            "format": FORMAT_VERSION, "watermark": self.watermark.isoformat(), "arrays": layout,
+        }).encode()
+        start = _align(len(MAGIC) + 8 + len(header))
+
+        with open(path, "wb") as output:
+            output.write(MAGIC + len(header).to_bytes(8, "little") + header)
+            for name in ARRAYS:
+                output.seek(start + layout[name][1])
+                output.write(getattr(self, name).tobytes())
+            output.truncate(start + offset)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Maps a file written by save(). The arrays are read-only views of the
+        mapping, so loading costs no parsing and the pages are shared by every
+        worker on the machine. Raises ValueError for a file in another format.
+        """
+        with open(path, "rb") as source:
+            mapping = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapping[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not an answer index file")
+        header_end = len(MAGIC) + 8 + int.from_bytes(mapping[len(MAGIC):len(MAGIC) + 8], "little")
+        header = json.loads(mapping[len(MAGIC) + 8:header_end])
+        if header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported answer index format {header.get('format')}")
+
+        start = _align(header_end)
+        arrays = {}
+        for name in ARRAYS:
+            dtype, offset, count = header["arrays"][name]
+            arrays[name] = (
+                np.frombuffer(mapping, dtype=np.dtype(dtype), count=count, offset=start + offset)
+                if count else np.empty(0, dtype=np.dtype(dtype))
+            )
+        return cls(arrays, parse_datetime(header["watermark"]), mapping)
+
+    def find(self, chat_id):
+        doc = int(np.searchsorted(self.chat_ids, chat_id))
+        return doc if doc < self.size and self.chat_ids[doc] == chat_id else None
+
+    def postings(self, term):
+        term = np.uint64(term)
+        position = int(np.searchsorted(self.term_hashes, term))
+        if position < len(self.term_hashes) and self.term_hashes[position] == term:
+            start, end = self.term_offsets[position], self.term_offsets[position + 1]
+            return self.post_docs[start:end], self.post_tf[start:end]
+        return None
+
+    def texts(self, doc):
+        offsets = self.text_offsets
+        return (
+            bytes(self.text[offsets[2 * doc]:offsets[2 * doc + 1]]).decode(),
+            bytes(self.text[offsets[2 * doc + 1]:offsets[2 * doc + 2]]).decode(),
+        )
+
+
+class DeltaDoc:
+    __slots__ = ("frequencies", "length", "language", "owner", "question", "answer")
+
+    def __init__(self, question, answer, language, owner):
+        self.frequencies = _frequencies(question, answer)
+        self.length = sum(self.frequencies.values())
+        self.language = _language_code(language)
+        self.owner = owner
+        self.question = question
+        self.answer = answer
+
+
+class AnswerIndex:
+    """
+    A segment plus the ratings given since it was built: chats that stopped
+    qualifying are masked out of it and newly qualifying ones kept in memory.
+    Document frequencies still count masked chats, as in any segmented index.
+    """
+
+    def __init__(self, segment, source):
+        self.segment = segment
+        self.source = source  # The file the segment was loaded from, see _file_source()
+        self.watermark = segment.watermark
+        self.alive = np.ones(segment.size, dtype=bool)
+        self.delta = {}  # chat id -> DeltaDoc
+        self.delta_postings = {}  # term hash -> {chat id: tf}
+        self.count = segment.size
+        self.total_length = float(segment.doc_lengths.sum())
+
+    def discard(self, chat_id):
+        doc = self.segment.find(chat_id)
+        if doc is not None and self.alive[doc]:
+            self.alive[doc] = False
+            self.count -= 1
+            self.total_length -= float(self.segment.doc_lengths[doc])
+        entry = self.delta.pop(chat_id, None)
+        if entry is not None:
+            for term in entry.frequencies:
+                postings = self.delta_postings[term]
+                del postings[chat_id]
+                if not postings:
+                    del self.delta_postings[term]
+            self.count -= 1
+            self.total_length -= entry.length
+
+    def apply(self, chat_id, question, answer, language, rating, helpful, owner):
+        """
+        Brings one chat's entry in line with its current rating.
+        """
+        if not qualifies(rating, helpful):
+            self.discard(chat_id)
+            return
+        doc = self.segment.find(chat_id)
+        if chat_id in self.delta or (doc is not None and self.alive[doc]):
+            return  # Already indexed; questions and answers never change
+        if doc is not None:
+            # Masked earlier and qualifying again: revive it rather than copy it
+            self.alive[doc] = True
+            self.count += 1
+            self.total_length += float(self.segment.doc_lengths[doc])
+            return
+        entry = DeltaDoc(question, answer, language, owner)
+        self.delta[chat_id] = entry
+        for term, frequency in entry.frequencies.items():
+            self.delta_postings.setdefault(term, {})[chat_id] = frequency
+        self.count += 1
+        self.total_length += entry.length
+
+    def search(self, question, user_id, language=None, limit=3):
+        """
+        Returns up to `limit` [{"chat_id", "question", "answer", "score"}],
+        best first, from the farmer's own chats and the shared ones, in
+        `language` when given.
+        """
+        owner = np.uint64(owner_key(user_id))
+        terms = {term_hash(token) for token in tokenize(question)}
+        if not terms or self.count <= 0:
+            return []
+        segment = self.segment
+        average_length = max(self.total_length / self.count, 1.0)
+        scores = np.zeros(segment.size, dtype=np.float32)
+        delta_scores = Counter()
+
+        for term in terms:
+            postings = segment.postings(term)
+            delta_postings = self.delta_postings.get(term, {})
+            frequency = (len(postings[0]) if postings else 0) + len(delta_postings)
+            if not frequency:
+                continue
+            idf = math.log(1 + (self.count - frequency + 0.5) / (frequency + 0.5))
+            if postings:
+                docs, tf = postings
+                norm = K1 * (1 - B + B * segment.doc_lengths[docs] / average_length)
+                scores[docs] += idf * tf * (K1 + 1) / (tf + norm)
+            for chat_id, tf in delta_postings.items():
+                norm = K1 * (1 - B + B * self.delta[chat_id].length / average_length)
+                delta_scores[chat_id] += idf * tf * (K1 + 1) / (tf + norm)
+
+        keep = self.alive & (scores >= MIN_SCORE) & ((segment.owners == SHARED) | (segment.owners == owner))
+        if language is not None:
+            keep &= segment.languages == _language_code(language)
+        candidates = np.flatnonzero(keep)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+
+        results = []
+        for doc in candidates:
+            question_text, answer_text = segment.texts(doc)
+            results.append({
+                "chat_id": int(segment.chat_ids[doc]), "question": question_text, "answer": answer_text,
+                "score": float(scores[doc]),
+            })
+        for chat_id, score in delta_scores.items():
+            entry = self.delta[chat_id]
+            if (
+                score >= MIN_SCORE and entry.owner in (SHARED, owner)
+                and (language is None or entry.language == _language_code(language))
+            ):
+                results.append({"chat_id": chat_id, "question": entry.question, "answer": entry.answer, "score": score})
+
+        results.sort(key=lambda result: (-result["score"], result["chat_id"]))
+        for result in results:
+            result["score"] = round(result["score"], 3)
+        return results[:limit]
+
+
+def build_segment():
+    """
+    Builds a segment from the database. Ratings given while it runs are
+    picked up by the OVERLAP re-read after the watermark.
+    """
+    watermark = timezone.now()
+    rows = (
+        (chat_id, question, answer, language, chat_owner(user_id, source))
+        for chat_id, question, answer, language, user_id, source in qualifying_logs().order_by("id").values_list(
+            "id", "user_question", "ai_response", "language", "user_id", "answer_source",
+        ).iterator(chunk_size=2000)
+    )
+    return Segment.build(rows, watermark)
+
+
+def write_index(path=None):
+    """
+    Builds the index from the database and replaces the index file in one
+    step, so workers only ever map a complete file. Returns (chats indexed, path).
+    """
+    path = Path(path or settings.ANSWER_INDEX_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    segment = build_segment()
+    partial = path.with_name(f"{path.name}.{os.getpid()}.partial")
+    try:
+        segment.save(partial)
+        os.replace(partial, path)
+    finally:
+        partial.unlink(missing_ok=True)
+    return segment.size, path
+
+
+def _file_source(path):
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+_lock = threading.Lock()
+_index = None
+_refreshed_at = None
+
+
+def _refresh():
+    """
+    Maps the index file if it is new (or builds the index in memory if there
+    is none), then applies the ratings given since its watermark.
+    """
+    global _index, _refreshed_at
+    path = Path(settings.ANSWER_INDEX_PATH)
+    source = _file_source(path)
+    if _index is None or _index.source != source:
+        segment = None
+        if source is not None:
+            try:
+                segment = Segment.load(path)
+                logger.info(f"Mapped answer index {path} with {segment.size} chats")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load answer index {path}: {e}")
+        if segment is None:
+            segment = build_segment()
+            logger.info(f"Built answer index in memory with {segment.size} chats; "
+                        f"run `manage.py build_answer_index` so workers can map it instead")
+        _index = AnswerIndex(segment, source)
+
+    now = timezone.now()
+    rows = ChatLog.objects.filter(updated_at__gte=_index.watermark - OVERLAP).values_list(
+        "id", "user_question", "ai_response", "language", "user_rating", "is_helpful", "user_id", "answer_source",
+    ).iterator(chunk_size=2000)
+    for *row, user_id, source in rows:
+        _index.apply(*row, chat_owner(user_id, source))
+    _index.watermark = now
+    _refreshed_at = time.monotonic()
+
+
+def retrieve(question, user_id, language=None, limit=None):
+    """
+    The best-matching well-rated past answers to the farmer's `question`
+    (see AnswerIndex.search).
+    """
+    with _lock:
+        if _index is None or time.monotonic() - _refreshed_at > REFRESH_SECONDS:
+            _refresh()
+        return _index.search(question, user_id, language, limit or settings.RETRIEVAL_TOP_K)
+
+
+def chat_rated(chat):
+    """
+    Applies a new rating in this process at once; other workers pick it up
+    within REFRESH_SECONDS.
+    """
+    with _lock:
+        if _index is not None:
+            _index.apply(chat.id, chat.user_question, chat.ai_response, chat.language,
+                         chat.user_rating, chat.is_helpful, chat_owner(chat.user_id, chat.answer_source))
+
+
+def stats():
+    with _lock:
+        if _index is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "mapped": _index.segment._mapping is not None,
+            "chats": _index.count,
+            "in_file": _index.segment.size,
+            "masked": int(_index.segment.size - _index.alive.sum()),
+            "in_memory": len(_index.delta),
+        }
+
+
+def clear():
+    global _index, _refreshed_at
+    with _lock:
+        _index = None
+        _refreshed_at = None
@@ -0,0 +1,27 @@
+# ai/seasons.py
+
+from django.utils import timezone
+
+KHARIF = "Kharif (വർഷാക്കാലം)"
+RABI = "Rabi (ശീതകാലം)"
+SUMMER = "Summer (വേനൽക്കാലം)"
+
+# Kerala's agricultural seasons by calendar month
+SEASON_MONTHS = {
+    KHARIF: (6, 7, 8, 9),  # June to September
+    RABI: (10, 11, 12, 1),  # October to January
+    SUMMER: (2, 3, 4, 5),  # February to May
+}
+
+
+def season_for_month(month):
+    for season, months in SEASON_MONTHS.items():
+        if month in months:
+            return season
+
+
+def get_current_season():
+    """
+    Determine current agricultural season in Kerala
+    """
+    return season_for_month(timezone.now().month)
@@ -0,0 +1,19 @@
+# ai/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import faq_index
+from .models import FarmingFAQ
+
+
+# Applied on commit, so a rolled-back admin save never reaches the matcher
+@receiver(post_save, sender=FarmingFAQ)
+def faq_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: faq_index.faq_saved(instance))
+
+
+@receiver(post_delete, sender=FarmingFAQ)
+def faq_deleted(sender, instance, **kwargs):
+    faq_id = instance.id
+    transaction.on_commit(lambda: faq_index.faq_deleted(faq_id))
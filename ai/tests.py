@@ -1,3 +1,655 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ai import answer_cache, chat_ingest, classify, faq_index, retrieval
+from ai.chat_export import aexport_rows
+from ai.chat_history import record_chats, session_history_page
+from ai.conversation import ExtractiveSummarizer, ModelSummarizer, fold_session, session_context
+from ai.chat_ingest import ChatLogBuffer, parse_chat, replay_orphaned_segments, write_chats
+from ai.llm import LLMError, stream_reply
+from ai.prompts import build_prompt_context, estimate_tokens
+from ai.seasons import get_current_season
+from ai.models import ChatLog, ChatSession, FarmingFAQ
+from core.models import Crop
+from kissan.perf_budget import ViewBudget, ViewBudgetMixin, consume_streaming_content, make_farmer
+
+
+@override_settings(LLM_BACKEND="stub", CHAT_SUMMARIZER="extractive")
+class AIViewBudgetTests(ViewBudgetMixin, TestCase):
+    urlconf = "ai.urls"
+
+    def setUp(self):
+        super().setUp()
+        # chat_stream is budgeted on a cold answer cache, FAQ index and prompt facts,
+        # in a session long enough to fold a turn into its summary
+        answer_cache.clear()
+        faq_index.clear()
+        classify.get_automaton()  # Warm, as in a running server
+        # Buffered chats are measured up to the buffer, never written by the flusher
+        self.enterContext(override_settings(
+            CHAT_INGEST_SPOOL_DIR=self.enterContext(tempfile.TemporaryDirectory()),
+            CHAT_INGEST_FLUSH_SECONDS=3600,
+        ))
+        self.addCleanup(chat_ingest.shutdown, flush=False)
+        # No index file, so the retrieval index is built from the seeded chats and stays warm
+        self.enterContext(override_settings(
+            ANSWER_INDEX_PATH=f"{self.enterContext(tempfile.TemporaryDirectory())}/answer_index.bin",
+        ))
+        retrieval.clear()
+        retrieval.retrieve("", self.user.pk)
+
+    def use_farmer(self, user):
+        # Staff, so the export budget measures the export rather than the 403
+        user.is_staff = True
+        user.save(update_fields=["is_staff"])
+        super().use_farmer(user)
+
+    def budgets(self):
+        chat = {"question": "How much water does paddy need?", "response": "About 500 litres a day.",
+                "language": "en", "session_id": "session-0"}
+        return [
+            ViewBudget("ai:ai_page", max_queries=8),
+            ViewBudget("ai:chat_page", max_queries=8),
+            ViewBudget("ai:user_context", max_queries=5),
+            ViewBudget("ai:farming_tips", max_queries=3),
+            ViewBudget("ai:save_chat_interaction", max_queries=2, method="post",
+                       content_type="application/json", data=chat),
+            ViewBudget("ai:save_chat", max_queries=2, method="post",
+                       content_type="application/json", data=chat),
+            ViewBudget("ai:chat_stream", max_queries=17, method="post",
+                       content_type="application/json", data=chat),
+            ViewBudget("ai:rate_chat", max_queries=4, method="post", content_type="application/json",
+                       kwargs={"chat_id": lambda t: ChatLog.objects.filter(user=t.user).first().id},
+                       data={"rating": 5, "is_helpful": True}),
+            ViewBudget("ai:get_chat_history", max_queries=3),
+            ViewBudget("ai:get_chat_session", max_queries=4, kwargs={"session_id": "session-0"}),
+            ViewBudget("ai:export_chat_logs", max_queries=3),
+            ViewBudget("ai:debug_logs", max_queries=5),
+        ]
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        self.user = make_farmer()
+        self.now = timezone.now()
+
+    def write(self, session_id, minutes_ago):
+        chat = ChatLog.objects.create(user=self.user, session_id=session_id, user_question="q", ai_response="a")
+        ChatLog.objects.filter(id=chat.id).update(created_at=self.now - timedelta(minutes=minutes_ago))
+        chat.refresh_from_db()
+        record_chats([chat])
+        return chat
+
+    def test_late_write_never_moves_session_times_back(self):
+        self.write("s", 5)
+        self.write("s", 30)  # e.g. flushed from the ingest spool after the newer chat
+        session = ChatSession.objects.get(user=self.user, session_id="s")
+        self.assertEqual(session.message_count, 2)
+        self.assertEqual(session.last_activity_at, self.now - timedelta(minutes=5))
+        self.assertEqual(session.started_at, self.now - timedelta(minutes=30))
+
+    def test_history_pages_most_recent_first(self):
+        for minutes_ago, session_id in enumerate("abc"):
+            self.write(session_id, minutes_ago)
+        first, cursor = session_history_page(self.user, limit=2)
+        rest, end = session_history_page(self.user, cursor=cursor, limit=2)
+        self.assertEqual([s.session_id for s in first + rest], ["a", "b", "c"])
+        self.assertIsNone(end)
+
+
+class ModelStreamTests(TestCase):
+    def reply(self, body, backend):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+
+        async def read():
+            async with httpx.AsyncClient(transport=transport) as client:
+                with mock.patch("ai.llm._client", return_value=client):
+                    return "".join([chunk async for chunk in stream_reply("prompt", "en")])
+
+        with override_settings(LLM_BACKEND=backend, GEMINI_API_KEY="key"):
+            return async_to_sync(read)()
+
+    def test_local_events_are_joined(self):
+        body = b'data: {"text": "Water "}\n\ndata: {"text": "daily"}\n\ndata: [DONE]\n\n'
+        self.assertEqual(self.reply(body, "local"), "Water daily")
+        body = b'data: {"candidates": [{"content": {"parts": [{"text": "Water daily"}]}}]}\n\n'
+        self.assertEqual(self.reply(body, "gemini"), "Water daily")
+
+    def test_malformed_events_raise_llm_error(self):
+        for backend, body in [
+            ("local", b"data: {not json\n\n"),
+            ("local", b'data: {"answer": "x"}\n\n'),
+            ("gemini", b'data: {"candidates": [{"content": {"parts": ["x"]}}]}\n\n'),
+            ("gemini", b"data: [1, 2]\n\n"),
+        ]:
+            with self.subTest(backend=backend, body=body), self.assertRaises(LLMError):
+                self.reply(body, backend)
+
+
+class AnswerCacheTests(TestCase):
+    question = "How often should I water paddy in summer?"
+
+    def setUp(self):
+        answer_cache.clear()
+        self.addCleanup(answer_cache.clear)
+        self.user = make_farmer()
+        self.season = get_current_season()
+
+    def chat(self, user, question=question, source="model", minutes_ago=0):
+        chat = ChatLog.objects.create(
+            user=user, session_id="s", user_question=question, ai_response="Every two days.",
+            language="en", user_district=user.district, answer_source=source,
+        )
+        if minutes_ago:
+            ChatLog.objects.filter(id=chat.id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return chat
+
+    def lookup(self, user, question="How often should I water my paddy in summer?"):
+        return answer_cache.lookup(question, user.pk, self.season, "en")
+
+    def refreshed(self):
+        return mock.patch.object(answer_cache, "REFRESH_SECONDS", -1)
+
+    def test_near_duplicate_of_own_question_hits(self):
+        chat = self.chat(self.user)
+        hit = self.lookup(self.user)
+        self.assertEqual(hit["chat_id"], chat.id)
+        self.assertGreaterEqual(hit["similarity"], answer_cache.SIMILARITY_THRESHOLD)
+        self.assertIsNone(self.lookup(self.user, "Which fertilizer suits coconut?"))
+
+    def test_answers_are_never_shared_between_farmers(self):
+        self.chat(make_farmer("9000000003"))
+        self.assertIsNone(self.lookup(self.user))
+
+    def test_expired_and_reused_answers_are_not_loaded(self):
+        self.chat(self.user, source="cache")
+        self.chat(self.user, source="faq")
+        self.chat(self.user, minutes_ago=int(answer_cache.TTL.total_seconds() // 60) + 1)
+        self.assertIsNone(self.lookup(self.user))
+
+    def test_late_commit_behind_the_watermark_is_picked_up(self):
+        self.assertIsNone(self.lookup(self.user))
+        # Committed after the refresh, but stamped before it by a slower transaction
+        self.chat(self.user, minutes_ago=0.5)
+        with self.refreshed():
+            self.assertIsNotNone(self.lookup(self.user))
+
+
+class ChatIngestTests(TestCase):
+    def setUp(self):
+        self.user = make_farmer()
+        self.spool = self.enterContext(tempfile.TemporaryDirectory())
+
+    def entry(self, key):
+        chat = parse_chat({"question": "When to sow paddy?", "response": "In June.", "idempotency_key": key})
+        return {**chat, "user_id": self.user.pk, "user_district": self.user.district}
+
+    def buffer(self):
+        buffer = ChatLogBuffer(self.spool, batch_size=100, flush_seconds=3600)
+        self.addCleanup(buffer.stop, flush=False)
+        return buffer
+
+    def test_replayed_chats_are_written_once(self):
+        self.assertEqual(write_chats([self.entry("a"), self.entry("a"), self.entry("b")]), 2)
+        self.assertEqual(write_chats([self.entry("a")]), 0)
+        self.assertEqual(ChatLog.objects.filter(user=self.user).count(), 2)
+
+    def test_flush_writes_and_deletes_the_segment(self):
+        buffer = self.buffer()
+        buffer.add(self.entry("a"))
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(list(Path(self.spool).iterdir()), [])
+        self.assertEqual(ChatLog.objects.get(user=self.user).ingest_key, "a")
+
+    def test_only_segments_nobody_holds_are_replayed(self):
+        buffer = self.buffer()
+        buffer.add(self.entry("a"))
+        self.assertEqual(replay_orphaned_segments(self.spool, 100), 0)
+
+        # As if the process died: its lock is gone, its segment stays
+        buffer.stop(flush=False)
+        self.assertEqual(replay_orphaned_segments(self.spool, 100), 1)
+        self.assertEqual(list(Path(self.spool).iterdir()), [])
+        self.assertEqual(ChatLog.objects.filter(ingest_key="a").count(), 1)
+
+
+class ChatExportTests(TestCase):
+    def setUp(self):
+        self.user = make_farmer()
+        self.user.is_staff = True
+        self.user.save(update_fields=["is_staff"])
+        self.client.force_login(self.user, backend="accounts.backends.MobileBackend")
+
+    def chat(self, minutes_ago):
+        chat = ChatLog.objects.create(user=self.user, session_id="s", user_question="q", ai_response="a")
+        ChatLog.objects.filter(id=chat.id).update(updated_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return chat
+
+    def export(self, since=None):
+        response = self.client.get(reverse("ai:export_chat_logs"), {"since": since} if since else {})
+        self.assertTrue(response.is_async)
+        lines = gzip.decompress(consume_streaming_content(response)).decode().splitlines()
+        return [json.loads(line)["id"] for line in lines], response["X-Export-Watermark"]
+
+    def test_each_export_picks_up_where_the_last_stopped(self):
+        old = self.chat(minutes_ago=10)
+        self.chat(minutes_ago=0)  # Not settled yet
+        ids, watermark = self.export()
+        self.assertEqual(ids, [old.id])
+
+        rated = ChatLog.objects.exclude(id=old.id).get()
+        ChatLog.objects.filter(id=rated.id).update(updated_at=timezone.now() - timedelta(seconds=30))
+        with mock.patch("ai.chat_export.timezone.now", return_value=timezone.now() + timedelta(minutes=5)):
+            ids, _ = self.export(since=watermark)
+        self.assertEqual(ids, [rated.id])
+
+    def test_pages_through_rows_with_equal_timestamps(self):
+        chats = [self.chat(minutes_ago=10) for _ in range(5)]
+        ChatLog.objects.update(updated_at=timezone.now() - timedelta(minutes=10))
+
+        async def read():
+            return [row["id"] async for row in aexport_rows(None, timezone.now(), chunk_size=2)]
+
+        self.assertEqual(async_to_sync(read)(), [chat.id for chat in chats])
+
+    def test_farmers_are_exported_under_a_pseudonym(self):
+        self.chat(minutes_ago=10)
+        self.chat(minutes_ago=10)
+        ChatLog.objects.create(user=make_farmer("9000000003"), session_id="s", user_question="q", ai_response="a")
+        ChatLog.objects.update(updated_at=timezone.now() - timedelta(minutes=10))
+
+        response = self.client.get(reverse("ai:export_chat_logs"))
+        body = gzip.decompress(consume_streaming_content(response)).decode()
+        self.assertNotIn("9000000002", body)
+        self.assertNotIn("9000000003", body)
+        user_ids = [json.loads(line)["user_id"] for line in body.splitlines()]
+        self.assertEqual(user_ids[0], user_ids[1])
+        self.assertNotEqual(user_ids[0], user_ids[2])
+
+    def test_staff_only(self):
+        self.user.is_staff = False
+        self.user.save(update_fields=["is_staff"])
+        self.assertEqual(self.client.get(reverse("ai:export_chat_logs")).status_code, 403)
+
+
+class PromptContextTests(TestCase):
+    def facts(self, crops, advisories=0):
+        return {
+            "profile": ["Name: Farmer", "District: കോഴിക്കോട്"],
+            "crops": [
+                {
+                    "id": i, "name": f"വിള {i}", "english_name": f"Crop {i}", "catalog_name": f"വിള {i}",
+                    "growing": True, "stage": f"sown {i} days ago",
+                    "days_since": {"irrigate": 1, "fertilize": None, "pesticide": 12},
+                }
+                for i in range(crops)
+            ],
+            "advisories": [
+                {"crop_id": i, "category": "URGENT" if i % 3 == 0 else "TIP", "message": f"Check crop {i} for pests"}
+                for i in range(advisories)
+            ],
+        }
+
+    def test_context_never_exceeds_the_budget(self):
+        for crops, advisories, budget in [(50, 0, 100), (50, 20, 100), (200, 10, 600), (3, 3, 40)]:
+            with self.subTest(crops=crops, advisories=advisories, budget=budget):
+                context = build_prompt_context(self.facts(crops, advisories), "how much water?", budget)
+                self.assertLessEqual(estimate_tokens(context), budget)
+
+    def test_everything_fits_a_large_budget(self):
+        context = build_prompt_context(self.facts(5, 2), "how much water?", 10_000)
+        self.assertNotIn("more crops not listed", context)
+        self.assertIn("Check crop 1 for pests", context)
+
+    def test_left_out_crops_are_counted(self):
+        context = build_prompt_context(self.facts(50), "how much water?", 100)
+        listed = context.count("\n- ")
+        self.assertIn(f"(+{50 - listed} more crops not listed)", context)
+
+
+class UserContextETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_farmer()
+        self.client.force_login(self.user, backend="accounts.backends.MobileBackend")
+        self.url = reverse("ai:user_context")
+
+    def test_unchanged_context_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((response["ETag"], response.content), (etag, b""))
+
+    def test_a_new_crop_changes_the_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        # The version is bumped when the write commits
+        with self.captureOnCommitCallbacks(execute=True):
+            Crop.objects.create(user=self.user, name="കപ്പ", english_name="Tapioca")
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual([crop["name"] for crop in response.json()["crops"]], ["കപ്പ"])
+
+    def test_body_is_cached_under_its_etag(self):
+        Crop.objects.create(user=self.user, name="കപ്പ")
+        etag = self.client.get(self.url)["ETag"]
+        # Queryset updates send no signal, so the version and the cached body stay
+        Crop.objects.filter(user=self.user).update(name="ഇഞ്ചി")
+
+        response = self.client.get(self.url)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["crops"][0]["name"], "കപ്പ")
+
+
+class ClassifyTests(TestCase):
+    def setUp(self):
+        Crop.objects.create(user=make_farmer(), name="കാന്താരി", english_name="Bird Chilli")
+        self.automaton = classify.build_automaton()
+
+    def classify(self, question, category=None):
+        return classify.classify_chat(question, category, automaton=self.automaton)
+
+    def test_matches_only_whole_words(self):
+        automaton = classify.Automaton([("rot", classify.CATEGORY, "PEST_CONTROL"), ("pest", classify.CATEGORY, "PEST_CONTROL")])
+        self.assertEqual(len(list(automaton.matches("pests rot"))), 2)
+        self.assertEqual(list(automaton.matches("carrot rotation pesto")), [])
+
+    def test_most_keyword_hits_wins(self):
+        self.assertEqual(self.classify("Rain and heat are coming, should I water?")[0], "WEATHER")
+        self.assertEqual(self.classify("How much water and drip irrigation after rain?")[0], "IRRIGATION")
+
+    def test_ties_follow_category_order(self):
+        self.assertEqual(self.classify("price of fertilizer")[0], "FERTILIZER")
+
+    def test_crops_in_order_of_first_mention(self):
+        # A farmer's own crop name, the dataset's Chilli inside it, and an alias of Paddy (അരി)
+        self.assertEqual(
+            self.classify("My bird chilli plants and നെല്ലിന് leaves, and the bird chilli again"),
+            ("CROP_ADVICE", ["കാന്താരി", "മുളക്", "അരി"]),
+        )
+
+    def test_malayalam_names_match_inflected_but_not_inside_words(self):
+        self.assertEqual(self.classify("നെല്ലിന്റെ ഇലകൾ")[1], ["അരി"])
+        self.assertEqual(self.classify("കാട്ടുനെല്ല്")[1], [])
+
+    def test_callers_category_only_without_keywords(self):
+        self.assertEqual(self.classify("hello", "MARKET")[0], "MARKET")
+        self.assertEqual(self.classify("hello")[0], "GENERAL")
+        self.assertEqual(self.classify("any pest problem?", "MARKET")[0], "PEST_CONTROL")
+
+
+@override_settings(CHAT_SUMMARIZER="extractive", CHAT_CONTEXT_TURNS=2, CHAT_SUMMARY_MAX_CHARS=1500)
+class ConversationSummaryTests(TestCase):
+    def setUp(self):
+        self.user = make_farmer()
+        self.chat(5)
+
+    def chat(self, count):
+        start = ChatLog.objects.filter(user=self.user).count()
+        record_chats([
+            ChatLog.objects.create(
+                user=self.user, session_id="s",
+                user_question=f"Question {n}. More detail.", ai_response=f"Answer {n}. Longer explanation.",
+            )
+            for n in range(start, start + count)
+        ])
+
+    def fold(self):
+        return async_to_sync(fold_session)(self.user, "s")
+
+    def context(self):
+        return async_to_sync(session_context)(self.user, "s")
+
+    def test_all_but_the_last_turns_are_folded(self):
+        self.assertEqual(self.fold(), 3)
+        summary, recent = self.context()
+        self.assertEqual(summary.splitlines(), [f"- Q: Question {n}. A: Answer {n}." for n in range(3)])
+        self.assertEqual([question for question, _ in recent], ["Question 3. More detail.", "Question 4. More detail."])
+        self.assertEqual(ChatSession.objects.get(user=self.user, session_id="s").summarized_turns, 3)
+        self.assertEqual(self.fold(), 0)
+
+    def test_new_turns_fold_onto_the_summary(self):
+        self.fold()
+        self.chat(1)
+        self.assertEqual(self.fold(), 1)
+        self.assertEqual(len(self.context()[0].splitlines()), 4)
+
+    @override_settings(CHAT_SUMMARY_MAX_CHARS=50)
+    def test_oldest_lines_are_dropped_beyond_the_limit(self):
+        self.fold()
+        self.assertEqual(self.context()[0], "- Q: Question 2. A: Answer 2.")
+
+    def test_a_concurrent_fold_wins(self):
+        async def summarize_after_another_fold(summarizer, summary, turns, language):
+            await ChatSession.objects.filter(user=self.user, session_id="s").aupdate(summarized_through=1)
+            return "lost"
+
+        with mock.patch.object(ExtractiveSummarizer, "summarize", summarize_after_another_fold):
+            self.assertEqual(self.fold(), 0)
+        self.assertEqual(self.context()[0], "")
+
+    def test_model_summary_falls_back_to_extractive(self):
+        async def failing_reply(prompt, language):
+            raise LLMError("model down")
+            yield
+
+        turns = [("Question. More.", "Answer. More.")]
+        with mock.patch("ai.conversation.stream_reply", failing_reply), self.assertLogs("ai.conversation", "WARNING"):
+            summary = async_to_sync(ModelSummarizer().summarize)("", turns, "en")
+        self.assertEqual(summary, "- Q: Question. A: Answer.")
+
+
+class RetrievalTests(TestCase):
+    owner = retrieval.owner_key("9000000002")
+    rows = [
+        (1, "How do I treat leaf spot on paddy?", "Spray a copper fungicide and drain the field.", "en", owner),
+        (2, "When should I harvest banana?", "Harvest when the fingers are plump.", "en", owner),
+        (3, "How much water does coconut need?", "Water coconut palms weekly in summer.", "en", owner),
+        (4, "നെല്ലിന് ഇലപ്പുള്ളി രോഗം", "കോപ്പർ കുമിൾനാശിനി തളിക്കുക", "ml", owner),
+        (5, "Which fertilizer for pepper vines?", "Apply compost and NPK before monsoon.", "en", owner),
+        (6, "Paddy leaves turning yellow", "Apply nitrogen fertilizer in split doses.", "en", owner),
+    ]
+
+    def setUp(self):
+        self.segment = retrieval.Segment.build(self.rows, timezone.now())
+        self.index = retrieval.AnswerIndex(self.segment, None)
+
+    def ids(self, question, language=None, index=None, user_id="9000000002"):
+        return [result["chat_id"] for result in (index or self.index).search(question, user_id, language)]
+
+    def test_best_matches_first(self):
+        self.assertEqual(self.ids("leaf spot on my paddy"), [1])
+        self.assertEqual(self.ids("yellow paddy leaves need fertilizer")[0], 6)
+        # Sharing one common word is not enough
+        self.assertEqual(self.ids("paddy"), [])
+
+    def test_language_filter(self):
+        self.assertEqual(self.ids("നെല്ലിന്റെ ഇലപ്പുള്ളി രോഗം", "ml"), [4])
+        self.assertEqual(self.ids("നെല്ലിന്റെ ഇലപ്പുള്ളി രോഗം", "en"), [])
+
+    def test_saved_file_searches_the_same(self):
+        path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "answer_index.bin"
+        self.segment.save(path)
+        loaded = retrieval.AnswerIndex(retrieval.Segment.load(path), None)
+        for question in ("leaf spot on my paddy", "water for coconut", "yellow paddy leaves need fertilizer"):
+            self.assertEqual(loaded.search(question, "9000000002"), self.index.search(question, "9000000002"))
+
+    def test_ratings_mask_revive_and_add_chats(self):
+        question, answer = self.rows[0][1:3]
+        self.index.apply(1, question, answer, "en", rating=1, helpful=None, owner=self.owner)
+        self.assertEqual(self.ids("leaf spot on my paddy"), [])
+        self.index.apply(1, question, answer, "en", rating=5, helpful=None, owner=self.owner)
+        self.assertEqual(self.ids("leaf spot on my paddy"), [1])
+
+        self.index.apply(7, "Leaf spot in the paddy nursery", "Remove infected seedlings.", "en",
+                         rating=None, helpful=True, owner=self.owner)
+        self.assertEqual(sorted(self.ids("leaf spot on my paddy")), [1, 7])
+
+    def test_qualifies(self):
+        self.assertTrue(retrieval.qualifies(4, None))
+        self.assertTrue(retrieval.qualifies(None, True))
+        self.assertFalse(retrieval.qualifies(3, None))
+        self.assertFalse(retrieval.qualifies(5, False))
+        self.assertFalse(retrieval.qualifies(2, True))
+
+    def test_farmers_never_see_each_others_answers(self):
+        farmer_a, farmer_b = make_farmer(), make_farmer("9000000003")
+        question = "How do I treat leaf spot on paddy?"
+        # Unrelated rated chats, so the leaf spot terms are rare enough to score
+        ChatLog.objects.bulk_create([
+            ChatLog(user=farmer_b, session_id="b", user_question=q, ai_response=a, language=language, user_rating=5)
+            for _, q, a, language, _ in self.rows[1:]
+        ])
+        own = ChatLog.objects.create(user=farmer_a, session_id="s", user_question=question,
+                                     ai_response="Ravi, spray your paddy at 673001 with copper fungicide.",
+                                     language="en", user_rating=5)
+        faq = ChatLog.objects.create(user=farmer_a, session_id="s", user_question=question,
+                                     ai_response="Spray a copper fungicide and drain the field.",
+                                     language="en", is_helpful=True, answer_source="faq")
+        self.enterContext(override_settings(
+            ANSWER_INDEX_PATH=f"{self.enterContext(tempfile.TemporaryDirectory())}/answer_index.bin",
+        ))
+        retrieval.clear()
+        self.addCleanup(retrieval.clear)
+
+        def passages(user):
+            return sorted(passage["chat_id"] for passage in retrieval.retrieve(question, user.pk))
+
+        # From the built segment
+        self.assertEqual(passages(farmer_a), sorted([own.id, faq.id]))
+        self.assertEqual(passages(farmer_b), [faq.id])
+
+        # And from ratings applied since
+        late = ChatLog.objects.create(user=farmer_a, session_id="s", user_question=question,
+                                      ai_response="Ravi, your paddy needs copper fungicide.", language="en")
+        late.user_rating = 5
+        late.save(update_fields=["user_rating", "updated_at"])
+        retrieval.chat_rated(late)
+        self.assertIn(late.id, passages(farmer_a))
+        self.assertEqual(passages(farmer_b), [faq.id])
+
+
+def make_faq(**fields):
+    return FarmingFAQ(**{
+        "question_ml": "ചോദ്യം", "answer_ml": "ഉത്തരം", "answer_en": "Answer", "category": "PEST_CONTROL",
+        "keywords": ["leaf spot", "paddy", "fungicide"], **fields,
+    })
+
+
+class FAQMatcherTests(TestCase):
+    def setUp(self):
+        faq_index.clear()
+        self.addCleanup(faq_index.clear)
+        self.index = faq_index.FAQIndex()
+
+    def add(self, faq_id, **fields):
+        self.index.add(make_faq(id=faq_id, **fields))
+
+    def match(self, question, **kwargs):
+        entry = self.index.match(question, **kwargs)
+        return entry and entry.faq_id
+
+    def test_two_keywords_must_match(self):
+        self.add(1)
+        self.assertEqual(self.match("paddy needs a fungicide?"), 1)
+        self.assertEqual(self.match("leaf spot on paddy"), 1)
+        # Both tokens of one keyword are still one keyword
+        self.assertIsNone(self.match("leaf spot everywhere"))
+        self.assertIsNone(self.match("paddy"))
+
+    def test_a_single_token_faq_needs_only_that_token(self):
+        self.add(1, keywords=["subsidy"])
+        self.assertEqual(self.match("any subsidy for me?"), 1)
+        self.assertIsNone(self.match("any help for me?"))
+
+    def test_district_and_season_targets(self):
+        self.add(1, applicable_districts=["കോഴിക്കോട്"], applicable_seasons=["Kharif (വർഷാക്കാലം)"])
+        self.assertEqual(self.match("paddy fungicide", district="കോഴിക്കോട്", season="Kharif"), 1)
+        self.assertIsNone(self.match("paddy fungicide", district="തൃശൂർ", season="Kharif"))
+        self.assertIsNone(self.match("paddy fungicide", district="കോഴിക്കോട്", season="Rabi"))
+
+    def test_empty_targets_mean_everywhere(self):
+        self.add(1)
+        self.assertEqual(self.match("paddy fungicide", district="തൃശൂർ", season="Rabi", crops=["വാഴ"]), 1)
+
+    def test_crop_target_met_by_a_grown_or_mentioned_crop(self):
+        self.add(1, keywords=["fungicide", "spray"], applicable_crops=["നെല്ല്"])
+        self.assertEqual(self.match("which fungicide to spray", crops=["നെല്ല്"]), 1)
+        self.assertEqual(self.match("നെല്ലിന് which fungicide to spray"), 1)
+        self.assertIsNone(self.match("which fungicide to spray", crops=["വാഴ"]))
+
+    def test_only_faqs_answered_in_the_language(self):
+        self.add(1, answer_en="")
+        self.assertEqual(self.match("paddy fungicide", language="ml"), 1)
+        self.assertIsNone(self.match("paddy fungicide", language="en"))
+
+    def test_priority_first_then_matched_keywords(self):
+        self.add(1, priority=1)
+        self.add(2, priority=5, keywords=["paddy", "fungicide", "drain"])
+        self.assertEqual(self.match("leaf spot on paddy, which fungicide?"), 2)
+        self.add(2, priority=1, keywords=["paddy", "fungicide", "drain"])
+        # Three keywords of 1 against two of 2
+        self.assertEqual(self.match("leaf spot on paddy, which fungicide?"), 1)
+
+    def test_removed_slots_are_reused(self):
+        self.add(1)
+        self.add(2, keywords=["banana", "harvest"])
+        self.index.remove(1)
+        self.add(3, keywords=["coconut", "water"])
+        self.assertEqual(self.index.entries[3].slot, 0)
+        self.assertIsNone(self.match("paddy fungicide"))
+        self.assertEqual(self.match("when to harvest banana"), 2)
+        self.assertEqual(self.match("coconut water"), 3)
+
+    def test_deactivated_faq_stops_matching(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            faq = make_faq()
+            faq.save()
+        self.assertEqual(faq_index.match_faq("paddy fungicide")["faq_id"], faq.id)
+
+        faq.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            faq.save()
+        self.assertIsNone(faq_index.match_faq("paddy fungicide"))
+
+    def test_rolled_back_save_is_never_served(self):
+        faq_index.match_faq("warm up")
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    make_faq().save()
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertIsNone(faq_index.match_faq("paddy fungicide"))
+
+    def test_refresh_picks_up_other_processes_changes(self):
+        self.assertIsNone(faq_index.match_faq("paddy fungicide"))
+        # Written without signals, as by another process
+        [faq] = FarmingFAQ.objects.bulk_create([make_faq()])
+        self.assertIsNone(faq_index.match_faq("paddy fungicide"))
+
+        later = time.monotonic() + faq_index.REFRESH_SECONDS + 1
+        with mock.patch("ai.faq_index.time.monotonic", return_value=later):
+            self.assertEqual(faq_index.match_faq("paddy fungicide")["faq_id"], faq.id)
+            FarmingFAQ.objects.filter(id=faq.id).update(is_active=False)
+            faq_index._refresh()
+            self.assertIsNone(faq_index.match_faq("paddy fungicide"))
@@ -14,13 +14,18 @@ urlpatterns = [
     path("api/farming-tips/", views.get_farming_tips, name="farming_tips"),
     
     # Chat interaction endpoints
+    path("chat/stream/", views.chat_stream, name="chat_stream"),
     path("save_chat/", views.save_chat_interaction, name="save_chat_interaction"),
     path("api/save-chat/", views.save_chat_interaction, name="save_chat"),  # Alternative endpoint
+    path("api/chat/<int:chat_id>/rating/", views.rate_chat, name="rate_chat"),
     
     # Chat history endpoints
     path("history/", views.get_chat_history, name="get_chat_history"),
     path("history/<str:session_id>/", views.get_chat_session, name="get_chat_session"),
     
+    # Analytics export (staff only)
+    path("export/chat-logs/", views.export_chat_logs, name="export_chat_logs"),
+    
     # Debug endpoint (remove in production)
     path("debug/logs/", views.debug_chat_logs, name="debug_logs"),
 ]
\ No newline at end of file
@@ -1,7 +1,7 @@
 # ai/views.py
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
 from datetime import timedelta
@@ -9,8 +9,29 @@ import json
 import uuid
 from .models import *
 from core.models import Crop, ActivityLog, Advisory
+from core import reference_data
+from core.context_version import acatalog_version, auser_version
+from core.recommendations import recommend_for_user
 from accounts.models import User
+from asgiref.sync import sync_to_async
 from django.db.models import Max, F, Subquery, OuterRef
+from django.http import StreamingHttpResponse
+from django.views.decorators.http import require_GET, require_POST
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.core.cache import cache
+import hashlib
+from .chat_history import (
+    HISTORY_PAGE_SIZE, MESSAGES_PAGE_SIZE, page_size, save_chat, session_history_page, session_messages_page,
+)
+from . import answer_cache, chat_export, chat_ingest, conversation, retrieval
+from .faq_index import match_faq
+from .llm import LLMError, stream_reply, streams_full
+from .prompts import build_prompt
+from .seasons import get_current_season
+
+# Upper bound on how long a superseded context lingers; any write bumps the version
+USER_CONTEXT_CACHE_SECONDS = 60 * 60
 
 @login_required
 def ai_page(request):
@@ -46,162 +67,310 @@ def ai_page(request):
     return render(request, "ai/ai.html", context)
 
 
-@login_required
-@csrf_exempt
-def get_user_context(request):
+async def build_user_context(user):
     """
-    API endpoint to get user context for AI
+    The farmer's profile, crops, recent activities and pending advisories for the AI
     """
-    if request.method == 'GET':
-        user = request.user
-        
-        # Build comprehensive user profile
-        user_profile = {
-            'name': user.name or 'Farmer',
-            'district': dict(user.DISTRICTS).get(user.district, user.district) if user.district else 'Kerala',
-            'acreage': dict(user.ACREAGE_CHOICES).get(user.acreage, user.acreage) if user.acreage else 'Not specified',
-            'soil_type': dict(user.SOIL_TYPES).get(user.soil_type, user.soil_type) if user.soil_type else 'Mixed',
-            'pincode': user.pincode or '',
+    user_profile = {
+        'name': user.name or 'Farmer',
+        'district': user.get_district_display() if user.district else 'Kerala',
+        'acreage': user.get_acreage_display() if user.acreage else 'Not specified',
+        'soil_type': user.get_soil_type_display() if user.soil_type else 'Mixed',
+        'pincode': user.pincode or '',
+    }
+
+    # select_related: the catalog fields must not fall back to a sync lookup here
+    crops_data = [
+        {
+            'name': crop.name,
+            'english_name': crop.english_name or '',
+            'is_sown': crop.is_sown,
+            'is_harvested': crop.is_harvested,
+            'sown_date': crop.sown_date.isoformat() if crop.sown_date else '',
+            'harvested_date': crop.harvested_date.isoformat() if crop.harvested_date else '',
+            'fertilizer': crop.fertilizer or '',
+            'pesticide': crop.pesticide or '',
+            'irrigation_liters': crop.irrigation_liters or '',
+            'sunlight_hours': crop.sunlight_hours or '',
+            'notes': crop.notes or ''
         }
-        
-        # Get crops information
-        crops_data = []
-        for crop in user.crops.all():
-            crop_info = {
-                'name': crop.name,
-                'english_name': crop.english_name or '',
-                'is_sown': crop.is_sown,
-                'is_harvested': crop.is_harvested,
-                'sown_date': crop.sown_date.strftime('%Y-%m-%d') if crop.sown_date else '',
-                'harvested_date': crop.harvested_date.strftime('%Y-%m-%d') if crop.harvested_date else '',
-                'fertilizer': crop.fertilizer or '',
-                'pesticide': crop.pesticide or '',
-                'irrigation_liters': crop.irrigation_liters or '',
-                'sunlight_hours': crop.sunlight_hours or '',
-                'notes': crop.notes or ''
-            }
-            crops_data.append(crop_info)
-        
-        # Get recent activities
-        recent_activities = []
-        activities = ActivityLog.objects.filter(
-            crop__user=user,
-            date__gte=timezone.now().date() - timedelta(days=15)
-        ).select_related('crop').order_by('-date')[:20]
-        
-        for activity in activities:
-            activity_info = {
-                'crop_name': activity.crop.name,
-                'date': activity.date.strftime('%Y-%m-%d'),
-                'did_irrigate': activity.did_irrigate,
-                'did_fertilize': activity.did_fertilize,
-                'did_apply_pesticide': activity.did_apply_pesticide,
-                'notes': activity.notes or ''
-            }
-            recent_activities.append(activity_info)
-        
-        # Get pending advisories
-        advisories_data = []
-        advisories = Advisory.objects.filter(
-            crop__user=user,
-            is_acknowledged=False
-        ).select_related('crop').order_by('-date')[:5]
-        
-        for advisory in advisories:
-            advisory_info = {
-                'crop_name': advisory.crop.name,
-                'message': advisory.message,
-                'category': advisory.category,
-                'date': advisory.date.strftime('%Y-%m-%d')
-            }
-            advisories_data.append(advisory_info)
-        
-        # Get weather context
-        current_season = get_current_season()
-        
-        response_data = {
-            'profile': user_profile,
-            'crops': crops_data,
-            'recent_activities': recent_activities,
-            'pending_advisories': advisories_data,
-            'season': current_season,
-            'location': {
-                'district': user_profile['district'],
-                'pincode': user_profile['pincode']
-            }
+        async for crop in Crop.objects.filter(user=user).select_related('catalog')
+    ]
+
+    activities = ActivityLog.objects.filter(
+        crop__user=user,
+        date__gte=timezone.now().date() - timedelta(days=15)
+    ).order_by('-date').values(
+        'crop__name', 'date', 'did_irrigate', 'did_fertilize', 'did_apply_pesticide', 'notes',
+    )[:20]
+    recent_activities = [
+        {
+            'crop_name': activity['crop__name'],
+            'date': activity['date'].isoformat(),
+            'did_irrigate': activity['did_irrigate'],
+            'did_fertilize': activity['did_fertilize'],
+            'did_apply_pesticide': activity['did_apply_pesticide'],
+            'notes': activity['notes'] or ''
         }
-        
-        return JsonResponse(response_data)
-    
-    return JsonResponse({'error': 'Method not allowed'}, status=405)
+        async for activity in activities
+    ]
+
+    advisories = Advisory.objects.filter(
+        crop__user=user,
+        is_acknowledged=False
+    ).order_by('-date').values('crop__name', 'message', 'category', 'date')[:5]
+    advisories_data = [
+        {
+            'crop_name': advisory['crop__name'],
+            'message': advisory['message'],
+            'category': advisory['category'],
+            'date': advisory['date'].isoformat(),
+        }
+        async for advisory in advisories
+    ]
+
+    return {
+        'profile': user_profile,
+        'crops': crops_data,
+        'recent_activities': recent_activities,
+        'pending_advisories': advisories_data,
+        'season': get_current_season(),
+        # Reading the datasets may reload them and rebuild the matrix: not on the event loop
+        'recommended_crops': await sync_to_async(recommend_for_user)(user),
+        'location': {
+            'district': user_profile['district'],
+            'pincode': user_profile['pincode']
+        }
+    }
+
+
+def _dataset_versions():
+    # May stat and reload the CSVs, so async callers run it in a thread
+    return reference_data.crops().version, reference_data.prices().version
+
+
+async def _user_context_etag(user):
+    """
+    Changes whenever the user's data does (signals bump the version), on a new
+    day (the activity window, season and recommendations move) and when the crop
+    catalog or the reference datasets change.
+    """
+    version = "-".join(str(part) for part in (
+        await auser_version(user.pk),
+        await acatalog_version(),
+        timezone.now().date().isoformat(),
+        *await sync_to_async(_dataset_versions)(),
+    ))
+    return hashlib.md5(version.encode()).hexdigest()[:16]
 
 
-def get_current_season():
+@login_required
+@csrf_exempt
+async def get_user_context(request):
     """
-    Determine current agricultural season in Kerala
+    API endpoint to get user context for AI.
+    The serialized context is cached under its ETag, so repeated polls are a
+    cache read, or a 304 when the client sends If-None-Match. Async, with the
+    async ORM, so it holds no worker thread under ASGI.
     """
-    current_month = timezone.now().month
+    if request.method == 'GET':
+        user = await request.auser()
+        etag = quote_etag(await _user_context_etag(user))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            cache_key = f"user-context:{user.pk}:{etag}"
+            body = await cache.aget(cache_key)
+            if body is None:
+                body = json.dumps(await build_user_context(user))
+                await cache.aset(cache_key, body, USER_CONTEXT_CACHE_SECONDS)
+            response = HttpResponse(body, content_type='application/json')
+
+        response['ETag'] = etag
+        # Let the browser keep the body but revalidate on every poll
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     
-    if current_month in [6, 7, 8, 9]:  # June to September
-        return "Kharif (വർഷാക്കാലം)"
-    elif current_month in [10, 11, 12, 1]:  # October to January
-        return "Rabi (ശീതകാലം)"
-    else:  # February to May
-        return "Summer (വേനൽക്കാലം)"
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
 
 
 @login_required
 @csrf_exempt
-def save_chat_interaction(request):
+async def save_chat_interaction(request):
     """
-    Save AI chat interactions permanently in DB (ChatLog model)
+    Save AI chat interactions permanently in DB (ChatLog model).
+    The chat is buffered and written in a batch shortly after, so the reply is
+    202 Accepted; resending with the same idempotency_key never stores it twice.
     """
     if request.method == 'POST':
         try:
-            # Parse request data
             data = json.loads(request.body)
-            
-            # Extract incoming data with validation
-            user_question = data.get('question', '').strip()
-            ai_response = data.get('response', '').strip()
-            language = data.get('language', 'ml')
-            category = data.get('category', 'GENERAL')
-            crops = data.get('crops', [])
-            session_id = data.get("session_id")
-            
-            # Validate required fields
-            if not user_question or not ai_response:
-                return JsonResponse({'error': 'Question and response are required'}, status=400)
-
-            # Generate session_id if not passed
-            if not session_id:
-                session_id = str(uuid.uuid4())
-
-            # Save to ChatLog model
-            chat = ChatLog.objects.create(
-                user=request.user,
-                session_id=session_id,
-                user_question=user_question,
-                ai_response=ai_response,
-                language=language,
-                category=category,
-                user_district=request.user.district,
-                crops_mentioned=crops if isinstance(crops, list) else []
-            )
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+        try:
+            chat = chat_ingest.parse_chat(data)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        # The spool write is blocking file I/O, kept off the event loop
+        entry = await sync_to_async(chat_ingest.enqueue)(await request.auser(), chat)
+        return JsonResponse({
+            'status': 'accepted',
+            'idempotency_key': entry['ingest_key'],
+            'session_id': entry['session_id'],
+            'timestamp': timezone.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }, status=202)
+
+    return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _instant_answer(user, question, language, season):
+    """
+    An answer that needs no model call: a matching farming FAQ first, then a
+    stored answer to a near-duplicate of a question the farmer asked this season.
+    """
+    crops = [
+        name for pair in Crop.objects.filter(user=user, is_harvested=False).values_list('name', 'english_name')
+        for name in pair
+    ]
+    faq = match_faq(question, user.district, season, crops, language)
+    if faq:
+        category = faq['category'] if faq['category'] in dict(ChatLog.CATEGORY_CHOICES) else 'GENERAL'
+        return {'answer': faq['answer'], 'category': category, 'source': 'faq'}
+
+    cached = answer_cache.lookup(question, user.pk, season, language)
+    if cached:
+        return {'answer': cached['answer'], 'category': 'GENERAL', 'source': 'cache'}
+    return None
+
 
-            return JsonResponse({
-                'status': 'success',
-                'chat_id': chat.id,
-                'session_id': chat.session_id,
-                'timestamp': chat.created_at.strftime("%Y-%m-%d %H:%M:%S")
+def _save_model_answer(user, session_id, question, answer, language, season):
+    """
+    Writes the answer at once rather than through chat_ingest: the 'done'
+    event carries the chat id that rate_chat takes, and the session's next
+    prompt and summary fold read this row.
+    """
+    chat = save_chat(user, session_id, question, answer, language)
+    answer_cache.remember(chat, season)
+    return chat
+
+
+@login_required
+@require_POST
+async def chat_stream(request):
+    """
+    Answers a question by streaming the model's reply as Server-Sent Events:
+    'token' events carry text as it arrives, then one 'done' event (the chat
+    was saved) or 'error' event. Serve under ASGI so waiting on the model does
+    not hold a worker thread. Questions a farming FAQ answers, and near-duplicates
+    of the farmer's own recent questions, are answered without calling the model. The model sees
+    the session's rolling summary and last few turns, not its whole history, and
+    well-rated past answers to similar questions.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    question = str(data.get('question', '')).strip()
+    if not question:
+        return JsonResponse({'error': 'Question is required'}, status=400)
+    language = data.get('language') if data.get('language') in ('ml', 'en') else 'ml'
+    session_id = str(data.get('session_id') or uuid.uuid4())[:100]
+
+    user = await request.auser()
+    season = get_current_season()
+    instant = await sync_to_async(_instant_answer)(user, question, language, season)
+
+    if instant is None and streams_full():
+        response = JsonResponse({'error': 'Too many chats in progress, try again shortly'}, status=503)
+        response['Retry-After'] = '5'
+        return response
+
+    async def events():
+        if instant:
+            yield _sse_event('token', {'text': instant['answer']})
+            # Written at once, as in _save_model_answer
+            chat = await sync_to_async(save_chat)(
+                user, session_id, question, instant['answer'], language, instant['category'],
+                source=instant['source'],
+            )
+            yield _sse_event('done', {
+                'chat_id': chat.id, 'session_id': session_id, 'cached': True, 'source': instant['source'],
             })
+            await conversation.fold_session(user, session_id)
+            return
 
-        except json.JSONDecodeError as e:
-            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
-        except Exception as e:
-            return JsonResponse({'error': str(e)}, status=500)
+        summary, recent = await conversation.session_context(user, session_id)
+        passages = await sync_to_async(retrieval.retrieve)(question, user.pk, language)
+        prompt = await sync_to_async(build_prompt)(user, question, language, summary, recent, passages)
+        parts = []
+        try:
+            async for chunk in stream_reply(prompt, language):
+                parts.append(chunk)
+                yield _sse_event('token', {'text': chunk})
+        except LLMError as e:
+            yield _sse_event('error', {'error': str(e)})
+            return
 
-    return JsonResponse({'error': 'Method not allowed'}, status=405)
+        answer = ''.join(parts).strip()
+        if not answer:
+            yield _sse_event('error', {'error': 'The model returned an empty answer'})
+            return
+        chat = await sync_to_async(_save_model_answer)(user, session_id, question, answer, language, season)
+        yield _sse_event('done', {'chat_id': chat.id, 'session_id': session_id, 'cached': False, 'source': 'model'})
+        # After 'done', so the farmer is not kept waiting on the summary
+        await conversation.fold_session(user, session_id)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx-style proxies from buffering the stream
+    return response
+
+
+@login_required
+@require_POST
+def rate_chat(request, chat_id):
+    """
+    Records the farmer's rating (1-5), helpful vote and feedback on one of
+    their answers. Well-rated answers are retrieved to ground later answers.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    chat = ChatLog.objects.filter(id=chat_id, user=request.user).first()
+    if chat is None:
+        return JsonResponse({'error': 'Chat not found'}, status=404)
+
+    fields = []
+    if 'rating' in data:
+        rating = data['rating']
+        if rating is not None and (type(rating) is not int or not 1 <= rating <= 5):
+            return JsonResponse({'error': 'rating must be a whole number from 1 to 5'}, status=400)
+        chat.user_rating = rating
+        fields.append('user_rating')
+    if 'is_helpful' in data:
+        if data['is_helpful'] not in (True, False, None):
+            return JsonResponse({'error': 'is_helpful must be true, false or null'}, status=400)
+        chat.is_helpful = data['is_helpful']
+        fields.append('is_helpful')
+    if 'feedback' in data:
+        chat.user_feedback = str(data['feedback'] or '').strip()[:2000] or None
+        fields.append('user_feedback')
+    if not fields:
+        return JsonResponse({'error': 'Send rating, is_helpful or feedback'}, status=400)
+
+    # updated_at moves so exports and the retrieval index pick the rating up
+    chat.save(update_fields=fields + ['updated_at'])
+    retrieval.chat_rated(chat)
+    return JsonResponse({
+        'status': 'success', 'chat_id': chat.id, 'rating': chat.user_rating, 'is_helpful': chat.is_helpful,
+    })
 
 
 @login_required
@@ -239,65 +408,87 @@ def get_farming_tips(request):
 @login_required
 def get_chat_history(request):
     """
-    API endpoint to get a list of all chat sessions for the current user.
-    Fixed version that properly handles session grouping.
+    API endpoint to get the current user's chat sessions, most recent first,
+    one page at a time: ?limit= and the previous page's ?cursor=.
     """
-    # Get unique session IDs with their latest dates
-    session_data = ChatLog.objects.filter(
-        user=request.user
-    ).values('session_id').annotate(
-        last_date=Max('created_at')
-    ).order_by('-last_date')
-    
-    history_list = []
-    for session in session_data:
-        # Get the first chat log for this session to get the first question and language
-        first_log = ChatLog.objects.filter(
-            user=request.user,
-            session_id=session['session_id']
-        ).order_by('created_at').first()
-        
-        if first_log:
-            history_list.append({
-                'id': session['session_id'],
-                'date': session['last_date'].strftime('%Y-%m-%d %H:%M:%S'),
-                'language': first_log.language,
-                'preview': first_log.user_question[:50] + ('...' if len(first_log.user_question) > 50 else '')
-            })
+    try:
+        limit = page_size(request.GET.get('limit'), HISTORY_PAGE_SIZE)
+        sessions, next_cursor = session_history_page(request.user, request.GET.get('cursor'), limit)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
 
-    return JsonResponse({'history': history_list})
+    history_list = [
+        {
+            'id': session.session_id,
+            'date': session.last_activity_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'language': session.language,
+            'preview': session.preview,
+            'message_count': session.message_count,
+        }
+        for session in sessions
+    ]
+
+    return JsonResponse({'history': history_list, 'next_cursor': next_cursor, 'has_more': next_cursor is not None})
 
 
 @login_required
 def get_chat_session(request, session_id):
     """
-    API endpoint to get all messages for a specific chat session.
+    API endpoint to get the messages of a chat session, oldest first,
+    one page at a time: ?limit= and the previous page's ?cursor=.
     """
     # Verify the session belongs to the user
-    chat_logs = ChatLog.objects.filter(
-        user=request.user, 
-        session_id=session_id
-    ).order_by('created_at')
-    
-    if not chat_logs.exists():
+    session = ChatSession.objects.filter(user=request.user, session_id=session_id).first()
+    if session is None:
         return JsonResponse({'error': 'Chat session not found'}, status=404)
 
+    try:
+        limit = page_size(request.GET.get('limit'), MESSAGES_PAGE_SIZE)
+        chat_logs, next_cursor = session_messages_page(request.user, session_id, request.GET.get('cursor'), limit)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
     messages = []
     for log in chat_logs:
         messages.append({'role': 'user', 'content': log.user_question})
         messages.append({'role': 'assistant', 'content': log.ai_response})
-    
-    # Get the language from the first log entry of the session
-    language = chat_logs.first().language
 
     return JsonResponse({
         'messages': messages, 
-        'language': language, 
+        'language': session.language,
         'id': session_id,
-        'total_messages': len(messages)
+        'summary': session.summary,
+        'total_messages': session.message_count * 2,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
     })
 
 
+@login_required
+@require_GET
+async def export_chat_logs(request):
+    """
+    Staff only: streams chat logs as gzip-compressed JSONL for offline analytics.
+    ?since= (the X-Export-Watermark of the previous export) makes it incremental;
+    ?text=1 includes the questions, answers and feedback. Async, so the rows
+    stream from the database cursor to the client without being buffered.
+    """
+    user = await request.auser()
+    if not user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    try:
+        since = chat_export.parse_watermark(request.GET.get('since'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    until = chat_export.new_watermark()
+    rows = chat_export.aexport_rows(since, until, with_text=request.GET.get('text') == '1')
+    response = StreamingHttpResponse(chat_export.gzip_jsonl_stream(rows), content_type='application/gzip')
+    response['Content-Disposition'] = f'attachment; filename="chatlogs-{until:%Y%m%dT%H%M%S}.jsonl.gz"'
+    response['X-Export-Watermark'] = until.isoformat()
+    return response
+
+
 @login_required
 def debug_chat_logs(request):
     """
@@ -311,6 +502,8 @@ def debug_chat_logs(request):
     debug_info = {
         'total_logs': all_logs.count(),
         'unique_sessions': ChatLog.objects.filter(user=user).values('session_id').distinct().count(),
+        'answer_cache': answer_cache.stats(),
+        'retrieval': retrieval.stats(),
         'recent_logs': []
     }
     
@@ -339,15 +532,3 @@ def get_weather_advice(district, pincode=None):
         'advice': 'Good weather for most crops. Monitor for excess moisture.'
     }
 
-
-def get_crop_recommendations(user_profile, season):
-    """
-    Recommend crops based on user profile and season
-    """
-    recommendations = []
-    
-    if user_profile.get('district') in ['കോഴിക്കോട്', 'കണ്ണൂർ', 'വയനാട്']:
-        if "വർഷാക്കാലം" in season:
-            recommendations.extend(['നെൽ', 'കവുങ്ങ്', 'കുരുമുളക്'])
-    
-    return recommendations
\ No newline at end of file
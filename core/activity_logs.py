@@ -0,0 +1,296 @@
+# core/activity_logs.py
+
+import logging
+from datetime import timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .context_version import bump_user_version
+from .cursors import decode_cursor, encode_cursor
+from .models import ActivityLog, Crop
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on entries accepted in one bulk or sync request
+MAX_BULK_ENTRIES = 500
+
+# Upper bound on server changes returned by one sync response
+SYNC_PAGE_SIZE = 200
+
+# Rows updated this recently are left for the next sync: updated_at is stamped
+# before commit, so a transaction still in flight may commit rows stamped
+# before the cursor the client has already moved past
+SYNC_SETTLE_SECONDS = 10
+
+ACTIVITY_FLAGS = ("did_irrigate", "did_fertilize", "did_apply_pesticide")
+
+# Longest note accepted for one day's log
+MAX_NOTES_LENGTH = 2000
+
+
+def _as_bool(value):
+    """
+    Accepts JSON booleans as well as the 'on'/'1'/'true' strings sent by forms.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("on", "1", "true", "yes")
+    return bool(value)
+
+
+def _parse_entry(raw, today):
+    """
+    Validates a single activity entry. Returns (entry, error message).
+    """
+    if not isinstance(raw, dict):
+        return None, "Entry must be an object"
+
+    try:
+        crop_id = int(raw.get("crop_id"))
+    except (TypeError, ValueError):
+        return None, "Invalid crop_id"
+
+    log_date = raw.get("date")
+    try:
+        log_date = parse_date(log_date) if log_date else today
+    except (TypeError, ValueError):
+        log_date = None
+    if log_date is None:
+        return None, "Invalid date, expected YYYY-MM-DD"
+    if log_date > today:
+        return None, "Cannot log activity for a future date"
+
+    notes = raw.get("notes") or ""
+    if not isinstance(notes, str):
+        return None, "notes must be text"
+    notes = notes.strip()
+    if len(notes) > MAX_NOTES_LENGTH:
+        return None, f"notes must be at most {MAX_NOTES_LENGTH} characters"
+
+    entry = {"crop_id": crop_id, "date": log_date, "notes": notes}
+    for flag in ACTIVITY_FLAGS:
+        entry[flag] = _as_bool(raw.get(flag, False))
+    return entry, None
+
+
+def parse_activity_entries(raw_entries):
+    """
+    Validates raw activity entries from a JSON payload.
+    Returns (entries, errors). Entries are de-duplicated on (crop_id, date),
+    the last occurrence winning, so a single upsert never touches a row twice.
+    """
+    if not isinstance(raw_entries, list):
+        return [], [{"index": None, "error": "'entries' must be a list"}]
+    if len(raw_entries) > MAX_BULK_ENTRIES:
+        return [], [{"index": None, "error": f"At most {MAX_BULK_ENTRIES} entries are allowed per request"}]
+
+    today = timezone.now().date()
+    entries = {}
+    errors = []
+
+    for index, raw in enumerate(raw_entries):
+        entry, error = _parse_entry(raw, today)
+        if error:
+            errors.append({"index": index, "error": error})
+            continue
+        entries[(entry["crop_id"], entry["date"])] = entry
+
+    return list(entries.values()), errors
+
+
+def bulk_upsert_activity_logs(user, entries):
+    """
+    Writes many daily logs for the user's crops in one statement.
+    Ownership of every crop is checked with a single query; entries for crops
+    the user does not own are returned as rejected instead of being written.
+    """
+    crop_ids = {entry["crop_id"] for entry in entries}
+    owned_ids = set(
+        Crop.objects.filter(user=user, id__in=crop_ids).values_list("id", flat=True)
+    )
+
+    logs = []
+    rejected = []
+    for entry in entries:
+        if entry["crop_id"] not in owned_ids:
+            rejected.append({"crop_id": entry["crop_id"], "date": entry["date"].isoformat(), "error": "Crop not found"})
+            continue
+        logs.append(ActivityLog(**entry))
+
+    if logs:
+        ActivityLog.objects.bulk_create(
+            logs,
+            update_conflicts=True,
+            unique_fields=["crop", "date"],
+            # Clearing the sync fields makes later conflicts compare against this write's time
+            update_fields=[*ACTIVITY_FLAGS, "notes", "updated_at", "client_updated_at", "idempotency_key"],
+        )
+        # bulk_create sends no post_save signals
+        bump_user_version(user.pk)
+        logger.info(f"Upserted {len(logs)} activity logs for user {user.pk}")
+
+    return len(logs), rejected
+
+
+# --- Offline delta sync ---
+
+def serialize_log(log):
+    return {
+        "id": log.id,
+        "crop_id": log.crop_id,
+        "date": log.date.isoformat(),
+        "did_irrigate": log.did_irrigate,
+        "did_fertilize": log.did_fertilize,
+        "did_apply_pesticide": log.did_apply_pesticide,
+        "notes": log.notes or "",
+        "updated_at": log.updated_at.isoformat(),
+        "client_updated_at": log.client_updated_at.isoformat() if log.client_updated_at else None,
+    }
+
+
+def parse_sync_deltas(raw_deltas):
+    """
+    Validates client deltas. Besides the activity entry fields every delta needs
+    an 'idempotency_key' and a 'client_updated_at' timestamp. When the batch has
+    several deltas for the same (crop_id, date), the most recent one is kept and
+    carries the keys of the others in 'supersedes'.
+    """
+    if not isinstance(raw_deltas, list):
+        return [], [{"index": None, "error": "'changes' must be a list"}]
+    if len(raw_deltas) > MAX_BULK_ENTRIES:
+        return [], [{"index": None, "error": f"At most {MAX_BULK_ENTRIES} changes are allowed per request"}]
+
+    now = timezone.now()
+    today = now.date()
+    deltas = {}
+    errors = []
+
+    for index, raw in enumerate(raw_deltas):
+        entry, error = _parse_entry(raw, today)
+        if error:
+            errors.append({"index": index, "error": error})
+            continue
+
+        key = str(raw.get("idempotency_key") or "").strip()
+        if not key or len(key) > 64:
+            errors.append({"index": index, "error": "idempotency_key is required (max 64 characters)"})
+            continue
+
+        try:
+            client_updated_at = parse_datetime(str(raw.get("client_updated_at") or ""))
+        except ValueError:
+            client_updated_at = None
+        if client_updated_at is None:
+            errors.append({"index": index, "error": "Invalid client_updated_at, expected an ISO 8601 timestamp"})
+            continue
+        if timezone.is_naive(client_updated_at):
+            client_updated_at = timezone.make_aware(client_updated_at, dt_timezone.utc)
+        # A device clock running ahead must not win every future conflict
+        entry["client_updated_at"] = min(client_updated_at, now)
+        entry["idempotency_key"] = key
+
+        pair = (entry["crop_id"], entry["date"])
+        previous = deltas.get(pair)
+        if previous is None:
+            entry["supersedes"] = []
+            deltas[pair] = entry
+            continue
+        winner, loser = (entry, previous) if previous["client_updated_at"] <= entry["client_updated_at"] else (previous, entry)
+        winner["supersedes"] = [
+            key for key in [*previous["supersedes"], loser["idempotency_key"]] if key != winner["idempotency_key"]
+        ]
+        deltas[pair] = winner
+
+    return list(deltas.values()), errors
+
+
+def sync_activity_logs(user, deltas, cursor=None, limit=SYNC_PAGE_SIZE):
+    """
+    Applies client deltas and returns the server changes since `cursor`.
+
+    Conflicts on (crop, date) are resolved last-writer-wins on the time the change
+    was made: the client's timestamp for synced rows, the server write time for
+    rows saved through the web forms. A delta whose idempotency_key matches the
+    row's last applied key is acknowledged without being written again, and
+    deltas dropped in favour of a newer one in the same batch are listed as
+    superseded so the client can stop retrying them.
+
+    Changes are returned only up to SYNC_SETTLE_SECONDS ago, so the cursor never
+    passes a write that has not committed yet.
+    """
+    since = decode_cursor(cursor)
+
+    crop_ids = {delta["crop_id"] for delta in deltas}
+    owned_ids = set(
+        Crop.objects.filter(user=user, id__in=crop_ids).values_list("id", flat=True)
+    )
+
+    applied, duplicates, conflicts, rejected, superseded = [], [], [], [], []
+    with transaction.atomic():
+        existing = {}
+        if owned_ids:
+            current_logs = ActivityLog.objects.select_for_update().filter(
+                crop_id__in=owned_ids,
+                date__in={delta["date"] for delta in deltas},
+            )
+            existing = {(log.crop_id, log.date): log for log in current_logs}
+
+        to_write = []
+        for delta in deltas:
+            key = delta["idempotency_key"]
+            superseded.extend(delta["supersedes"])
+            if delta["crop_id"] not in owned_ids:
+                rejected.append({"idempotency_key": key, "error": "Crop not found"})
+                continue
+
+            current = existing.get((delta["crop_id"], delta["date"]))
+            if current is not None:
+                if current.idempotency_key == key:
+                    duplicates.append(key)
+                    continue
+                server_changed_at = current.client_updated_at or current.updated_at
+                if server_changed_at > delta["client_updated_at"]:
+                    conflicts.append({"idempotency_key": key, "server": serialize_log(current)})
+                    continue
+
+            to_write.append(ActivityLog(**{field: value for field, value in delta.items() if field != "supersedes"}))
+            applied.append(key)
+
+        if to_write:
+            ActivityLog.objects.bulk_create(
+                to_write,
+                update_conflicts=True,
+                unique_fields=["crop", "date"],
+                update_fields=[*ACTIVITY_FLAGS, "notes", "updated_at", "client_updated_at", "idempotency_key"],
+            )
+            bump_user_version(user.pk)
+
+    settled = timezone.now() - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    changes_qs = ActivityLog.objects.filter(crop__user=user, updated_at__lt=settled)
+    if since:
+        since_updated_at, since_id = since
+        changes_qs = changes_qs.filter(
+            Q(updated_at__gt=since_updated_at) | Q(updated_at=since_updated_at, id__gt=since_id)
+        )
+    changes = list(changes_qs.order_by("updated_at", "id")[:limit + 1])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    if changes:
+        next_cursor = encode_cursor(changes[-1].updated_at, changes[-1].id)
+    else:
+        next_cursor = cursor or ""
+
+    if to_write:
+        logger.info(f"Synced {len(to_write)} activity logs for user {user.pk}")
+
+    return {
+        "applied": applied,
+        "duplicates": duplicates,
+        "conflicts": conflicts,
+        "rejected": rejected,
+        "superseded": superseded,
+        "changes": [serialize_log(log) for log in changes],
+        "cursor": next_cursor,
+        "has_more": has_more,
+    }
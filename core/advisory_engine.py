@@ -1,14 +1,22 @@
 # core/advisory_engine.py
 
+import asyncio
+import weakref
+import httpx
 import requests
 from datetime import date, timedelta, datetime
+from django.conf import settings
+from django.db.models import Max, Q
 from django.utils import timezone
+from .context_version import bump_user_version
 from .models import Advisory, ActivityLog, Crop
 import logging
 
 # It's good practice to use Django's logging
 logger = logging.getLogger(__name__)
 
+WEATHER_TIMEOUT = 10  # Seconds
+
 # District coordinates mapping (same as before)
 DISTRICT_COORDINATES = {
     "തിരുവനന്തപുരം": {"lat": 8.5241, "lng": 76.9366}, "കൊല്ലം": {"lat": 8.8932, "lng": 76.6141},
@@ -20,10 +28,9 @@ DISTRICT_COORDINATES = {
     "കണ്ണൂർ": {"lat": 11.8745, "lng": 75.3704}, "കാസർഗോഡ്": {"lat": 12.4996, "lng": 74.9869}
 }
 
-def get_weather_forecast(district: str):
+def _weather_request(district: str):
     """
-    Fetches and processes 5-day weather forecast.
-    Returns a simplified dictionary or None on failure.
+    The (url, headers, params) of the forecast request for a district, or None.
     """
     coordinates = DISTRICT_COORDINATES.get(district)
     if not coordinates:
@@ -36,60 +43,128 @@ def get_weather_forecast(district: str):
         logger.error("RapidAPI key is not set. Weather forecast will not work.")
         return None
         
-    url = "https://open-weather13.p.rapidapi.com/fivedaysforcast"
     headers = {
         "x-rapidapi-key": api_key,
         "x-rapidapi-host": "open-weather13.p.rapidapi.com"
     }
     params = {"latitude": coordinates["lat"], "longitude": coordinates["lng"]}
+    return settings.WEATHER_API_URL, headers, params
+
+
+def _process_forecast(data):
+    """
+    Reduces the API's 3-hourly forecast to one summary per day.
+    """
+    if not data.get("list"):
+        return None
+
+    forecast_by_day = {}
+    for item in data["list"]:
+        day_key = datetime.fromtimestamp(item["dt"]).date()
+        if day_key not in forecast_by_day:
+            forecast_by_day[day_key] = []
+        
+        forecast_by_day[day_key].append({
+            "temp": round(item["main"]["temp"] - 273.15, 1),
+            "humidity": item["main"]["humidity"],
+            "description": item["weather"][0]["description"],
+            "main": item["weather"][0]["main"],
+            "rain_3h": item.get("rain", {}).get("3h", 0),
+        })
+
+    processed_forecast = []
+    for day, forecasts in forecast_by_day.items():
+        if not forecasts: continue
+        processed_forecast.append({
+            "date": day,
+            "max_temp": max(f['temp'] for f in forecasts),
+            "min_temp": min(f['temp'] for f in forecasts),
+            "avg_humidity": sum(f['humidity'] for f in forecasts) / len(forecasts),
+            "will_rain": any(f['rain_3h'] > 0 for f in forecasts),
+            "total_rain": sum(f['rain_3h'] for f in forecasts),
+            "conditions": [f['main'] for f in forecasts]
+        })
+    
+    return sorted(processed_forecast, key=lambda x: x['date'])
+
+
+def get_weather_forecast(district: str):
+    """
+    Fetches and processes 5-day weather forecast.
+    Returns a simplified dictionary or None on failure.
+    """
+    weather_request = _weather_request(district)
+    if weather_request is None:
+        return None
+    url, headers, params = weather_request
 
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=10)
+        response = requests.get(url, headers=headers, params=params, timeout=WEATHER_TIMEOUT)
         response.raise_for_status()  # Raises an HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
-
-        if not data.get("list"):
-            return None
-
-        forecast_by_day = {}
-        for item in data["list"]:
-            day_key = datetime.fromtimestamp(item["dt"]).date()
-            if day_key not in forecast_by_day:
-                forecast_by_day[day_key] = []
-            
-            forecast_by_day[day_key].append({
-                "temp": round(item["main"]["temp"] - 273.15, 1),
-                "humidity": item["main"]["humidity"],
-                "description": item["weather"][0]["description"],
-                "main": item["weather"][0]["main"],
-                "rain_3h": item.get("rain", {}).get("3h", 0),
-            })
+        return _process_forecast(response.json())
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"Error fetching weather data for {district}: {e}")
+        return None
 
-        processed_forecast = []
-        for day, forecasts in forecast_by_day.items():
-            if not forecasts: continue
-            processed_forecast.append({
-                "date": day,
-                "max_temp": max(f['temp'] for f in forecasts),
-                "min_temp": min(f['temp'] for f in forecasts),
-                "avg_humidity": sum(f['humidity'] for f in forecasts) / len(forecasts),
-                "will_rain": any(f['rain_3h'] > 0 for f in forecasts),
-                "total_rain": sum(f['rain_3h'] for f in forecasts),
-                "conditions": [f['main'] for f in forecasts]
-            })
-        
-        return sorted(processed_forecast, key=lambda x: x['date'])
 
-    except requests.RequestException as e:
+_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+
+def _client():
+    """
+    One pooled HTTP client per event loop, so connections to the weather API are reused.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(timeout=WEATHER_TIMEOUT)
+        _clients[loop] = client
+    return client
+
+
+async def aget_weather_forecast(district: str):
+    """
+    get_weather_forecast for async views: waiting on the API holds no thread.
+    """
+    weather_request = _weather_request(district)
+    if weather_request is None:
+        return None
+    url, headers, params = weather_request
+
+    try:
+        response = await _client().get(url, headers=headers, params=params)
+        response.raise_for_status()
+        return _process_forecast(response.json())
+    except (httpx.HTTPError, ValueError) as e:
         logger.error(f"Error fetching weather data for {district}: {e}")
         return None
 
 
-def analyze_crop_and_weather(crop: Crop, weather_forecast: list):
+def last_activity_dates(crops):
+    """
+    {crop id: (last irrigation, last fertilizer, last pesticide date)} for
+    several crops in one query. Crops without logs are missing.
+    """
+    rows = (
+        ActivityLog.objects.filter(crop__in=crops)
+        .order_by()
+        .values("crop_id")
+        .annotate(
+            irrigated=Max("date", filter=Q(did_irrigate=True)),
+            fertilized=Max("date", filter=Q(did_fertilize=True)),
+            sprayed=Max("date", filter=Q(did_apply_pesticide=True)),
+        )
+    )
+    return {row["crop_id"]: (row["irrigated"], row["fertilized"], row["sprayed"]) for row in rows}
+
+
+def analyze_crop_and_weather(crop: Crop, weather_forecast: list, last_activity=None):
     """
     The FIXED core analysis function.
     Decides what actions are needed based on logs and weather.
     Now properly handles unsown crops and prevents illogical advisories.
+    `last_activity` is the crop's entry from last_activity_dates(), looked up
+    when not given.
     """
     today = timezone.now().date()
     advisories = []
@@ -118,14 +193,14 @@ def analyze_crop_and_weather(crop: Crop, weather_forecast: list):
         return advisories  # Return early for unsown crops
 
     # --- Get Recent Activity (Only for sown crops) ---
-    last_irrigation_log = ActivityLog.objects.filter(crop=crop, did_irrigate=True).order_by('-date').first()
-    last_fertilizer_log = ActivityLog.objects.filter(crop=crop, did_fertilize=True).order_by('-date').first()
-    last_pesticide_log = ActivityLog.objects.filter(crop=crop, did_apply_pesticide=True).order_by('-date').first()
+    if last_activity is None:
+        last_activity = last_activity_dates([crop]).get(crop.id, (None, None, None))
+    last_irrigation, last_fertilizer, last_pesticide = last_activity
 
     # Calculate days since last activities (with proper defaults)
-    days_since_irrigation = (today - last_irrigation_log.date).days if last_irrigation_log else 0
-    days_since_fertilizer = (today - last_fertilizer_log.date).days if last_fertilizer_log else 0
-    days_since_pesticide = (today - last_pesticide_log.date).days if last_pesticide_log else 0
+    days_since_irrigation = (today - last_irrigation).days if last_irrigation else 0
+    days_since_fertilizer = (today - last_fertilizer).days if last_fertilizer else 0
+    days_since_pesticide = (today - last_pesticide).days if last_pesticide else 0
     
     # Calculate crop age (guaranteed to be valid since crop is sown)
     crop_age = (today - crop.sown_date).days
@@ -274,46 +349,72 @@ def generate_advisories_for_crop(crop: Crop):
     This will delete old advisories and create new ones for today.
     FIXED: Better cleanup logic and error handling.
     """
+    return write_advisories_for_crop(crop, get_weather_forecast(crop.user.district))
+
+
+def write_advisories_for_crop(crop: Crop, weather_forecast):
+    """
+    Replaces today's advisories for a crop with ones for `weather_forecast`
+    (None when it could not be fetched).
+    """
+    return write_advisories_for_crops([crop], weather_forecast)
+
+
+def write_advisories_for_crops(crops, weather_forecast):
+    """
+    Replaces today's advisories for several crops, in a fixed number of
+    queries however many crops there are. Callers fetch the district's
+    forecast once and pass it in. Returns the new advisories.
+    """
+    crops = list(crops)
+    if not crops:
+        return []
     today = timezone.now().date()
-    
-    # Clean up old advisories (keep last 7 days, remove older ones)
+
+    # Clean up old advisories (keep last 7 days) and today's, to avoid duplicates
     one_week_ago = today - timedelta(days=7)
-    deleted_count = Advisory.objects.filter(crop=crop, date__lt=one_week_ago).delete()[0]
+    deleted_count = Advisory.objects.filter(crop__in=crops).filter(
+        Q(date__lt=one_week_ago) | Q(date=today)
+    ).delete()[0]
     if deleted_count > 0:
-        logger.info(f"Cleaned up {deleted_count} old advisories for crop {crop.id}")
-    
-    # Clean up today's advisories to avoid duplicates
-    Advisory.objects.filter(crop=crop, date=today).delete()
-    
-    # Fetch fresh weather data
-    weather_forecast = get_weather_forecast(crop.user.district)
+        logger.info(f"Cleaned up {deleted_count} old and today's advisories for {len(crops)} crops")
+
     if not weather_forecast:
-        logger.warning(f"Could not fetch weather data for {crop.user.district}. Using fallback logic.")
-    
-    # Get a list of advisory messages and categories
-    try:
-        advisory_data = analyze_crop_and_weather(crop, weather_forecast)
-    except Exception as e:
-        logger.error(f"Error analyzing crop {crop.id}: {e}")
-        # Fallback advisory
-        advisory_data = [{
-            "message": f"Unable to generate specific advice right now. Please check your {crop.name} manually and ensure basic care is provided.",
-            "category": "TIP"
-        }]
-    
-    # Create new Advisory objects in the database
-    saved_advisories = []
-    for data in advisory_data:
-        advisory = Advisory.objects.create(
-            crop=crop,
-            message=data["message"],
-            category=data["category"],
-            date=today,
-            is_acknowledged=False  # Always start as unread
+        logger.warning(f"No weather data for {len(crops)} crops. Using fallback logic.")
+
+    sown = [crop for crop in crops if crop.is_sown and crop.sown_date]
+    last_activity = last_activity_dates(sown) if sown else {}
+
+    advisories = []
+    for crop in crops:
+        try:
+            advisory_data = analyze_crop_and_weather(
+                crop, weather_forecast, last_activity.get(crop.id, (None, None, None))
+            )
+        except Exception as e:
+            logger.error(f"Error analyzing crop {crop.id}: {e}")
+            # Fallback advisory
+            advisory_data = [{
+                "message": f"Unable to generate specific advice right now. Please check your {crop.name} manually and ensure basic care is provided.",
+                "category": "TIP"
+            }]
+        advisories.extend(
+            Advisory(
+                crop=crop,
+                message=data["message"],
+                category=data["category"],
+                date=today,
+                is_acknowledged=False  # Always start as unread
+            )
+            for data in advisory_data
         )
-        saved_advisories.append(advisory)
-        
-    logger.info(f"Generated {len(saved_advisories)} new advisories for crop {crop.id} ({crop.name}).")
+
+    saved_advisories = Advisory.objects.bulk_create(advisories)
+    # Queryset deletes and bulk_create send no signals
+    for user_id in {crop.user_id for crop in crops}:
+        bump_user_version(user_id)
+
+    logger.info(f"Generated {len(saved_advisories)} new advisories for {len(crops)} crops.")
     return saved_advisories
 
 
@@ -323,7 +424,11 @@ def cleanup_old_advisories():
     Call this daily via a management command or cron job.
     """
     one_week_ago = timezone.now().date() - timedelta(days=7)
-    deleted_count = Advisory.objects.filter(date__lt=one_week_ago).delete()[0]
+    old_advisories = Advisory.objects.filter(date__lt=one_week_ago)
+    user_ids = set(old_advisories.values_list("crop__user_id", flat=True).distinct())
+    deleted_count = old_advisories.delete()[0]
+    for user_id in user_ids:
+        bump_user_version(user_id)
     logger.info(f"Cleaned up {deleted_count} old advisories from database")
     return deleted_count
 
@@ -333,7 +438,17 @@ def get_weather_summary(district: str):
     Simplified weather summary for the AJAX endpoint.
     Enhanced with better error handling.
     """
-    forecast = get_weather_forecast(district)
+    return summarize_forecast(get_weather_forecast(district))
+
+
+async def aget_weather_summary(district: str):
+    return summarize_forecast(await aget_weather_forecast(district))
+
+
+def summarize_forecast(forecast):
+    """
+    Today's weather from a processed forecast, as returned to the page.
+    """
     if not forecast or len(forecast) == 0:
         return {
             "status": "unavailable", 
@@ -369,6 +484,8 @@ def mark_all_advisories_read_for_crop(crop_id: int, user):
             crop__user=user,
             is_acknowledged=False
         ).update(is_acknowledged=True)
+        if updated_count:
+            bump_user_version(user.pk)
         
         logger.info(f"Marked {updated_count} advisories as read for crop {crop_id}")
         return updated_count
@@ -0,0 +1,178 @@
+# core/analytics.py
+
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Min, Q, Sum, Window
+from django.db.models.functions import Coalesce, Lag, Rank
+from django.utils import timezone
+from .context_version import catalog_version
+from .models import ActivityLog, Crop
+
+# Every farmer's logs feed the district totals and carry no version, so a
+# cached total is at most this old
+DISTRICT_USAGE_CACHE_SECONDS = 60 * 60
+
+def _as_timedelta(value):
+    """
+    Durations come back as timedelta on PostgreSQL and as microseconds on SQLite.
+    """
+    if value is None or isinstance(value, timedelta):
+        return value
+    return timedelta(microseconds=int(value))
+
+
+def _per_week(count, span):
+    if not count or span is None:
+        return 0.0
+    return round(count * 7 / (span.days + 1), 2)
+
+
+def _crop_usage_queryset(crops):
+    """
+    One row per crop with its irrigation aggregates, ranked by estimated water
+    use within its district.
+    """
+    irrigated = Q(activity_logs__did_irrigate=True)
+    estimated_liters = Coalesce(F("catalog__irrigation_liters_value"), 0) * Count("activity_logs", filter=irrigated)
+    return (
+        crops.order_by()
+        .annotate(
+            district=F("user__district"),
+            irrigation_liters_value=F("catalog__irrigation_liters_value"),
+            irrigation_days=Count("activity_logs", filter=irrigated),
+            fertilizer_days=Count("activity_logs", filter=Q(activity_logs__did_fertilize=True)),
+            pesticide_days=Count("activity_logs", filter=Q(activity_logs__did_apply_pesticide=True)),
+            first_irrigation=Min("activity_logs__date", filter=irrigated),
+            last_irrigation=Max("activity_logs__date", filter=irrigated),
+            irrigation_span=ExpressionWrapper(
+                Max("activity_logs__date", filter=irrigated) - Min("activity_logs__date", filter=irrigated),
+                output_field=DurationField(),
+            ),
+            estimated_liters=estimated_liters,
+            district_rank=Window(Rank(), partition_by=[F("user__district")], order_by=estimated_liters.desc()),
+        )
+        .values(
+            "id", "name", "english_name", "district", "irrigation_liters_value",
+            "irrigation_days", "fertilizer_days", "pesticide_days", "first_irrigation",
+            "last_irrigation", "irrigation_span", "estimated_liters", "district_rank",
+        )
+    )
+
+
+def _irrigation_gaps_queryset(crops):
+    """
+    One row per irrigation with the time since the crop's previous irrigation.
+    """
+    previous_irrigation = Window(Lag("date"), partition_by=[F("crop_id")], order_by=F("date").asc())
+    return (
+        ActivityLog.objects.filter(crop__in=crops.values("id"), did_irrigate=True)
+        .order_by()
+        .annotate(gap=ExpressionWrapper(F("date") - previous_irrigation, output_field=DurationField()))
+        .values("crop_id", "gap")
+    )
+
+
+def crop_water_usage(crops):
+    """
+    Irrigation frequency, estimated water use and gaps between irrigations for
+    every crop in `crops`, computed in a single query. district_rank is the
+    crop's rank among every crop in its district, not just among `crops`.
+
+    The ORM cannot group over a window function, so both windowed querysets are
+    compiled by Django and combined here: the per-crop aggregates, ranked over
+    the districts' crops, are filtered to `crops` and joined to the max/avg gap
+    per crop taken over the LAG() rows.
+    """
+    crops = crops.order_by()
+    district_crops = Crop.objects.filter(user__district__in=crops.values("user__district"))
+    usage_sql, usage_params = _crop_usage_queryset(district_crops).query.sql_with_params()
+    gaps_sql, gaps_params = _irrigation_gaps_queryset(crops).query.sql_with_params()
+    ids_sql, ids_params = crops.values("id").query.sql_with_params()
+    sql = (
+        f"SELECT crop_usage.*, crop_gaps.max_gap, crop_gaps.avg_gap FROM ({usage_sql}) crop_usage "
+        f"LEFT JOIN (SELECT crop_id, MAX(gap) AS max_gap, AVG(gap) AS avg_gap "
+        f"FROM ({gaps_sql}) irrigations GROUP BY crop_id) crop_gaps ON crop_gaps.crop_id = crop_usage.id "
+        f"WHERE crop_usage.id IN ({ids_sql}) "
+        f"ORDER BY crop_usage.district, crop_usage.district_rank"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, usage_params + gaps_params + ids_params)
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    results = []
+    for row in rows:
+        span = _as_timedelta(row["irrigation_span"])
+        max_gap = _as_timedelta(row["max_gap"])
+        avg_gap = _as_timedelta(row["avg_gap"])
+        results.append({
+            "crop_id": row["id"],
+            "name": row["name"],
+            "english_name": row["english_name"] or "",
+            "district": row["district"],
+            "liters_per_irrigation": row["irrigation_liters_value"],
+            "irrigation_days": row["irrigation_days"],
+            "fertilizer_days": row["fertilizer_days"],
+            "pesticide_days": row["pesticide_days"],
+            "irrigations_per_week": _per_week(row["irrigation_days"], span),
+            "estimated_liters": row["estimated_liters"],
+            "first_irrigation": str(row["first_irrigation"]) if row["first_irrigation"] else None,
+            "last_irrigation": str(row["last_irrigation"]) if row["last_irrigation"] else None,
+            "max_gap_days": max_gap.days if max_gap is not None else None,
+            "avg_gap_days": round(avg_gap.total_seconds() / 86400, 1) if avg_gap is not None else None,
+            "district_rank": row["district_rank"],
+        })
+    return results
+
+
+def district_water_usage(crops=None):
+    """
+    Per-district totals in one grouped query. Summing a crop's liters over its
+    irrigated log rows gives liters x irrigation days without a per-crop pass.
+    """
+    crops = Crop.objects.all() if crops is None else crops
+    irrigated = Q(activity_logs__did_irrigate=True)
+    rows = (
+        crops.order_by()
+        .values(district=F("user__district"))
+        .annotate(
+            crops=Count("id", distinct=True),
+            irrigated_crops=Count("id", filter=irrigated, distinct=True),
+            irrigation_days=Count("activity_logs", filter=irrigated),
+            estimated_liters=Coalesce(Sum("catalog__irrigation_liters_value", filter=irrigated), 0),
+            first_irrigation=Min("activity_logs__date", filter=irrigated),
+            last_irrigation=Max("activity_logs__date", filter=irrigated),
+        )
+        .order_by("-estimated_liters")
+    )
+
+    results = []
+    for row in rows:
+        first, last = row["first_irrigation"], row["last_irrigation"]
+        span = (last - first) if first and last else None
+        results.append({
+            "district": row["district"],
+            "crops": row["crops"],
+            "irrigated_crops": row["irrigated_crops"],
+            "irrigation_days": row["irrigation_days"],
+            "irrigations_per_crop_per_week": round(
+                _per_week(row["irrigation_days"], span) / row["irrigated_crops"], 2
+            ) if row["irrigated_crops"] else 0.0,
+            "estimated_liters": row["estimated_liters"],
+        })
+    return results
+
+
+def cached_district_water_usage(district=None):
+    """
+    district_water_usage for one district (every district when None), cached
+    per catalog version and day.
+    """
+    key = f"district-water:{district or '*'}:{catalog_version()}:{timezone.now().date().isoformat()}"
+    results = cache.get(key)
+    if results is None:
+        crops = Crop.objects.all() if district is None else Crop.objects.filter(user__district=district)
+        results = district_water_usage(crops)
+        cache.set(key, results, DISTRICT_USAGE_CACHE_SECONDS)
+    return results
@@ -0,0 +1,73 @@
+# core/context_version.py
+"""
+Version counters for data derived from a user's profile, crops, activity logs
+and advisories. Anything cached from that data is keyed on the version, so a
+write only has to bump the counter; stale entries are never read again and
+expire on their own.
+"""
+
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+USER_VERSION_KEY = "context-version:user:{user_id}"
+CATALOG_VERSION_KEY = "context-version:catalog"
+
+
+def _initial_version():
+    # A fresh starting point if the counter was evicted, so an evicted
+    # counter never hands out a version that was used before
+    return time.time_ns()
+
+
+def _get(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aget(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), None)
+
+
+def _bump_on_commit(key):
+    # Bumping before the commit would let a concurrent request cache the old
+    # rows under the new version
+    transaction.on_commit(lambda: _bump(key))
+
+
+def user_version(user_id):
+    return _get(USER_VERSION_KEY.format(user_id=user_id))
+
+
+async def auser_version(user_id):
+    return await _aget(USER_VERSION_KEY.format(user_id=user_id))
+
+
+def bump_user_version(user_id):
+    _bump_on_commit(USER_VERSION_KEY.format(user_id=user_id))
+
+
+def catalog_version():
+    return _get(CATALOG_VERSION_KEY)
+
+
+async def acatalog_version():
+    return await _aget(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    _bump_on_commit(CATALOG_VERSION_KEY)
@@ -0,0 +1,88 @@
+# core/crop_catalog.py
+"""
+Parsing of the free-text columns of kerala_crops_dataset.csv into the typed
+fields of CropCatalog. Kept free of model imports so migrations can use it.
+"""
+
+import re
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+ALL_MONTHS_MASK = (1 << 12) - 1
+
+
+def parse_liters(value):
+    """
+    Turns the free-text irrigation value from the crop CSV ("500", "300-400 L")
+    into whole liters. Ranges use their midpoint; returns None when there is no number.
+    """
+    numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", value or "")]
+    if not numbers:
+        return None
+    return round(sum(numbers[:2]) / len(numbers[:2]))
+
+
+def parse_hours_range(value):
+    """
+    "6-8" -> (6.0, 8.0), "7" -> (7.0, 7.0); (None, None) when there is no number.
+    """
+    numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", value or "")][:2]
+    if not numbers:
+        return None, None
+    return min(numbers), max(numbers)
+
+
+def parse_month_mask(value):
+    """
+    Turns a month window into a 12-bit mask (bit 0 = January).
+    Two months are a range, wrapping over the new year ("Jan-Dec" is all year,
+    "Dec-Jan" is two months); three or more are a list ("Jan-Feb-Mar").
+    """
+    months = [
+        MONTHS.index(part[:3])
+        for part in re.split(r"[\s,/-]+", (value or "").lower())
+        if part[:3] in MONTHS
+    ]
+    if len(months) == 2:
+        start, end = months
+        months = [(start + offset) % 12 for offset in range((end - start) % 12 + 1)]
+    mask = 0
+    for month in months:
+        mask |= 1 << month
+    return mask
+
+
+def months_in_mask(mask):
+    """
+    Month numbers (1-12) set in a mask from parse_month_mask.
+    """
+    return [month + 1 for month in range(12) if mask & (1 << month)]
+
+
+def parse_soil_types(value):
+    return [soil.strip() for soil in (value or "").split(",") if soil.strip()]
+
+
+def catalog_fields(row):
+    """
+    CropCatalog field values for one cleaned CSV row (keys as produced by
+    reference_data: crop_malayalam, crop_english, fertilizer, ...).
+    """
+    sunlight_min, sunlight_max = parse_hours_range(row.get("sunlight_hours"))
+    return {
+        "name": row.get("crop_malayalam", ""),
+        "english_name": row.get("crop_english", ""),
+        "image_url": row.get("image_url") or None,
+        "fertilizer": row.get("fertilizer", ""),
+        "pesticide": row.get("pesticide", ""),
+        "irrigation_liters": row.get("irrigation_liters", ""),
+        "irrigation_liters_value": parse_liters(row.get("irrigation_liters")),
+        "sunlight_hours": row.get("sunlight_hours", ""),
+        "sunlight_hours_min": sunlight_min,
+        "sunlight_hours_max": sunlight_max,
+        "sowing_months": row.get("sowing_months", ""),
+        "sowing_month_mask": parse_month_mask(row.get("sowing_months")),
+        "harvesting_months": row.get("harvesting_months", ""),
+        "harvesting_month_mask": parse_month_mask(row.get("harvesting_months")),
+        "soil_types": parse_soil_types(row.get("soil_type")),
+        "notes": row.get("notes", ""),
+    }
@@ -0,0 +1,29 @@
+# core/cursors.py
+"""
+Opaque keyset cursors: the (timestamp, id) of the last row a client was sent.
+Shared by the activity log sync and the chat history pages.
+"""
+
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(moment, row_id):
+    return f"{moment.isoformat()}|{row_id}"
+
+
+def decode_cursor(cursor):
+    """
+    Returns (timestamp, id) for a cursor string, or None for an empty cursor.
+    Raises ValueError for a malformed cursor.
+    """
+    if not cursor:
+        return None
+    timestamp, _, row_id = str(cursor).partition("|")
+    moment = parse_datetime(timestamp)
+    if moment is None:
+        raise ValueError("Invalid cursor")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment, int(row_id)
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+
+from accounts.models import User
+
+BENCH_MOBILE = "9000000000"
+BENCH_DISTRICT = "എറണാകുളം"
+
+LOCAL_HOSTS = ("", "localhost", "127.0.0.1", "::1")
+
+
+def _weather_handler(latency):
+    """
+    A stand-in for the weather API: waits `latency` seconds, then returns a
+    one-entry forecast for now.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps({"list": [{
+                "dt": int(time.time()),
+                "main": {"temp": 301.15, "humidity": 80},
+                "weather": [{"main": "Clouds", "description": "scattered clouds"}],
+            }]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare WSGI (gunicorn sync/gthread workers) and ASGI (gunicorn with uvicorn "
+        "workers, kissan/gunicorn_conf.py) throughput on the weather refresh endpoint "
+        "while a local stand-in weather API answers after --latency-ms. Creates a "
+        f"benchmark user ({BENCH_MOBILE}) and a session in the configured database and removes "
+        "them afterwards; runs only against SQLite, a local database or an explicit DATABASE_URL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--latency-ms", type=int, default=300)
+        parser.add_argument("--requests", type=int, default=400)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--threads", type=int, default=1, help="Threads per WSGI worker (gthread when > 1)")
+        parser.add_argument("--port", type=int, default=8765)
+
+    def handle(self, *args, **options):
+        self._check_database()
+        session_key = self._session_key()
+        try:
+            self._benchmark(session_key, options)
+        finally:
+            self._clean_up(session_key)
+
+    def _check_database(self):
+        # The settings fall back to the production database
+        if (
+            "DATABASE_URL" in os.environ
+            or connection.vendor == "sqlite"
+            or (connection.settings_dict.get("HOST") or "") in LOCAL_HOSTS
+        ):
+            return
+        raise CommandError(
+            "Refusing to create benchmark data in the default (production) database: "
+            "set DATABASE_URL to the database to use, e.g. DATABASE_URL=sqlite:///bench.sqlite3"
+        )
+
+    def _benchmark(self, session_key, options):
+        weather = ThreadingHTTPServer(("127.0.0.1", 0), _weather_handler(options["latency_ms"] / 1000))
+        weather.daemon_threads = True
+        threading.Thread(target=weather.serve_forever, daemon=True).start()
+
+        env = dict(os.environ, WEATHER_API_URL=f"http://127.0.0.1:{weather.server_port}/forecast")
+        cookies = {settings.SESSION_COOKIE_NAME: session_key}
+        bind = f"127.0.0.1:{options['port']}"
+        workers = str(options["workers"])
+        path = reverse("refresh_weather_advisory")
+
+        wsgi_worker = ["--worker-class", "gthread", "--threads", str(options["threads"])] if options["threads"] > 1 else []
+        modes = [
+            ("WSGI", ["kissan.wsgi:application", *wsgi_worker]),
+            ("ASGI", ["-c", str(settings.BASE_DIR / "kissan" / "gunicorn_conf.py"), "kissan.asgi:application"]),
+        ]
+
+        self.stdout.write(
+            f"{options['requests']} requests, {options['concurrency']} concurrent, "
+            f"{workers} workers, weather API latency {options['latency_ms']}ms"
+        )
+        try:
+            for name, arguments in modes:
+                server = subprocess.Popen(
+                    [sys.executable, "-m", "gunicorn", *arguments, "--bind", bind, "--workers", workers,
+                     "--access-logfile", "/dev/null"],
+                    env=env, cwd=settings.BASE_DIR,
+                )
+                try:
+                    elapsed, latencies, errors = asyncio.run(self._drive(f"http://{bind}", path, cookies, options))
+                finally:
+                    server.terminate()
+                    server.wait()
+                latencies.sort()
+                self.stdout.write(
+                    f"{name}: {len(latencies) / elapsed:.1f} req/s, "
+                    f"p50 {statistics.median(latencies) * 1000:.0f}ms, "
+                    f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}ms, {errors} errors"
+                )
+        finally:
+            weather.shutdown()
+
+    def _session_key(self):
+        user = User.objects.filter(mobile=BENCH_MOBILE).first()
+        if user is None:
+            user = User.objects.create_user(
+                BENCH_MOBILE, name="Benchmark", acreage="<1", district=BENCH_DISTRICT,
+                pincode="682001", soil_type="ചെങ്കൽ",
+            )
+        session = SessionStore()
+        session[SESSION_KEY] = user.pk
+        session[BACKEND_SESSION_KEY] = "accounts.backends.MobileBackend"
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def _clean_up(self, session_key):
+        SessionStore(session_key).delete()
+        User.objects.filter(mobile=BENCH_MOBILE).delete()
+
+    async def _drive(self, base_url, path, cookies, options):
+        limits = httpx.Limits(max_connections=options["concurrency"])
+        async with httpx.AsyncClient(base_url=base_url, cookies=cookies, limits=limits, timeout=120) as client:
+            await self._wait_ready(client, path)
+
+            latencies = []
+            errors = 0
+            remaining = iter(range(options["requests"]))
+
+            async def run():
+                nonlocal errors
+                for _ in remaining:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.get(path)
+                        ok = response.status_code == 200 and response.json().get("status") == "available"
+                    except (httpx.HTTPError, ValueError):
+                        ok = False
+                    if ok:
+                        latencies.append(time.perf_counter() - started)
+                    else:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(run() for _ in range(options["concurrency"])))
+            elapsed = time.perf_counter() - started
+        if not latencies:
+            raise CommandError(f"Every request to {base_url}{path} failed")
+        return elapsed, latencies, errors
+
+    async def _wait_ready(self, client, path):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                await client.get(path)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+        raise CommandError("The server did not start within 30 seconds")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import reference_data
+from core.context_version import bump_catalog_version
+from core.crop_catalog import catalog_fields
+from core.models import CropCatalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update the crop catalog from database/kerala_crops_dataset.csv. "
+        "Farmers' crops point at catalog rows, so an update reaches every crop "
+        "without rewriting them."
+    )
+
+    def handle(self, *args, **options):
+        rows = [row for row in reference_data.crops().rows if row.get("crop_malayalam")]
+        if not rows:
+            raise CommandError("kerala_crops_dataset.csv is missing or empty")
+
+        entries = {}
+        for row in rows:
+            entries.setdefault(row["crop_malayalam"], CropCatalog(**catalog_fields(row)))
+
+        fields = [f.name for f in CropCatalog._meta.concrete_fields if f.name not in ("id", "name")]
+        CropCatalog.objects.bulk_create(
+            list(entries.values()),
+            update_conflicts=True,
+            unique_fields=["name"],
+            update_fields=fields,
+        )
+        # bulk_create sends no post_save signals
+        CropCatalog.objects.clear_cache()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Imported {len(entries)} crops into the catalog"))
@@ -0,0 +1,53 @@
+import csv
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.price_history import ingest_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Append a crop price snapshot to the price history and refresh its rollups. "
+        "Reads database/district_crop_prices.csv by default; a 'date' column, if present, "
+        "overrides --date per row (useful for backfills)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "csv_path", nargs="?",
+            default=str(Path(settings.BASE_DIR) / "database" / "district_crop_prices.csv"),
+        )
+        parser.add_argument("--date", help="Snapshot date (YYYY-MM-DD), defaults to today")
+
+    def handle(self, *args, **options):
+        snapshot_date = timezone.now().date()
+        if options["date"]:
+            snapshot_date = parse_date(options["date"])
+            if snapshot_date is None:
+                raise CommandError("--date must be YYYY-MM-DD")
+
+        path = Path(options["csv_path"])
+        if not path.exists():
+            raise CommandError(f"{path} not found")
+
+        rows = []
+        with open(path, encoding="utf-8-sig") as f:
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                try:
+                    rows.append({
+                        "district": row["district"].strip(),
+                        "crop_english": row["crop_english"].strip(),
+                        "price_per_quintal_in_inr": int(float(row["price_per_quintal_in_inr"])),
+                        "date": parse_date(row["date"].strip()) if row.get("date") else None,
+                    })
+                except (KeyError, ValueError, TypeError) as e:
+                    raise CommandError(f"{path}:{line}: invalid row ({e})")
+
+        count, series = ingest_snapshot(rows, snapshot_date)
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {count} price points for {len(series)} series (snapshot {snapshot_date})"
+        ))
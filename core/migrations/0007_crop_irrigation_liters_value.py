@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-19 10:05
+
+import re
+
+from django.db import migrations, models
+
+
+def backfill_irrigation_liters_value(apps, schema_editor):
+    Crop = apps.get_model('core', 'Crop')
+    crops = []
+    for crop in Crop.objects.exclude(irrigation_liters__isnull=True).exclude(irrigation_liters='').only('id', 'irrigation_liters'):
+        numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", crop.irrigation_liters)][:2]
+        if numbers:
+            crop.irrigation_liters_value = round(sum(numbers) / len(numbers))
+            crops.append(crop)
+    Crop.objects.bulk_update(crops, ['irrigation_liters_value'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_activitylog_sync_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crop',
+            name='irrigation_liters_value',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_irrigation_liters_value, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.6 on 2026-10-19 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_crop_irrigation_liters_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CropPriceHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('district', models.CharField(max_length=50)),
+                ('crop_english', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('price_per_quintal', models.PositiveIntegerField()),
+            ],
+            options={
+                'unique_together': {('district', 'crop_english', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CropPriceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('district', models.CharField(max_length=50)),
+                ('crop_english', models.CharField(max_length=100)),
+                ('latest_date', models.DateField()),
+                ('latest_price', models.PositiveIntegerField()),
+                ('ma_7', models.FloatField(blank=True, null=True)),
+                ('ma_30', models.FloatField(blank=True, null=True)),
+                ('ma_90', models.FloatField(blank=True, null=True)),
+                ('p10', models.FloatField(blank=True, null=True)),
+                ('p25', models.FloatField(blank=True, null=True)),
+                ('p50', models.FloatField(blank=True, null=True)),
+                ('p75', models.FloatField(blank=True, null=True)),
+                ('p90', models.FloatField(blank=True, null=True)),
+                ('week_over_week_pct', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('district', 'crop_english')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CropPriceWeekly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('district', models.CharField(max_length=50)),
+                ('crop_english', models.CharField(max_length=100)),
+                ('week_start', models.DateField()),
+                ('avg_price', models.FloatField()),
+                ('min_price', models.PositiveIntegerField()),
+                ('max_price', models.PositiveIntegerField()),
+                ('points', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'unique_together': {('district', 'crop_english', 'week_start')},
+            },
+        ),
+    ]
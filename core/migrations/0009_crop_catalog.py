@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-19 13:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_crop_price_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CropCatalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('english_name', models.CharField(blank=True, max_length=100)),
+                ('image_url', models.URLField(blank=True, null=True)),
+                ('fertilizer', models.CharField(blank=True, max_length=200)),
+                ('pesticide', models.CharField(blank=True, max_length=200)),
+                ('irrigation_liters', models.CharField(blank=True, max_length=50)),
+                ('irrigation_liters_value', models.PositiveIntegerField(blank=True, null=True)),
+                ('sunlight_hours', models.CharField(blank=True, max_length=50)),
+                ('sunlight_hours_min', models.FloatField(blank=True, null=True)),
+                ('sunlight_hours_max', models.FloatField(blank=True, null=True)),
+                ('sowing_months', models.CharField(blank=True, max_length=200)),
+                ('sowing_month_mask', models.PositiveSmallIntegerField(default=0)),
+                ('harvesting_months', models.CharField(blank=True, max_length=200)),
+                ('harvesting_month_mask', models.PositiveSmallIntegerField(default=0)),
+                ('soil_types', models.JSONField(blank=True, default=list)),
+                ('notes', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['english_name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='crop',
+            name='catalog',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='crops', to='core.cropcatalog'),
+        ),
+    ]
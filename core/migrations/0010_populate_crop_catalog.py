@@ -0,0 +1,59 @@
+# Generated by Django 5.1.6 on 2026-10-19 13:25
+
+import csv
+from pathlib import Path
+
+from django.conf import settings
+from django.db import migrations
+
+from core.crop_catalog import catalog_fields
+
+CROP_DETAIL_FIELDS = (
+    'image_url', 'fertilizer', 'pesticide', 'irrigation_liters', 'sunlight_hours',
+    'sowing_months', 'harvesting_months', 'notes',
+)
+
+
+def populate_crop_catalog(apps, schema_editor):
+    CropCatalog = apps.get_model('core', 'CropCatalog')
+    Crop = apps.get_model('core', 'Crop')
+
+    catalog = {}
+    path = Path(settings.BASE_DIR) / 'database' / 'kerala_crops_dataset.csv'
+    if path.exists():
+        with open(path, encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                row = {k.strip().lower().replace(' ', '_'): (v or '').strip() for k, v in row.items() if k is not None}
+                if row.get('crop_malayalam') and row['crop_malayalam'] not in catalog:
+                    catalog[row['crop_malayalam']] = CropCatalog.objects.create(**catalog_fields(row))
+
+    # Crops added from an older copy of the dataset keep their own details
+    crops = list(Crop.objects.all().only('id', 'name', 'english_name', *CROP_DETAIL_FIELDS))
+    for crop in crops:
+        if crop.name not in catalog:
+            row = {field: getattr(crop, field) or '' for field in CROP_DETAIL_FIELDS}
+            row.update(crop_malayalam=crop.name, crop_english=crop.english_name or '')
+            catalog[crop.name] = CropCatalog.objects.create(**catalog_fields(row))
+        crop.catalog_id = catalog[crop.name].id
+    Crop.objects.bulk_update(crops, ['catalog'], batch_size=1000)
+
+
+def restore_crop_details(apps, schema_editor):
+    Crop = apps.get_model('core', 'Crop')
+    crops = list(Crop.objects.exclude(catalog=None).select_related('catalog'))
+    for crop in crops:
+        for field in CROP_DETAIL_FIELDS:
+            setattr(crop, field, getattr(crop.catalog, field))
+        crop.irrigation_liters_value = crop.catalog.irrigation_liters_value
+    Crop.objects.bulk_update(crops, [*CROP_DETAIL_FIELDS, 'irrigation_liters_value'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_crop_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_crop_catalog, restore_crop_details),
+    ]
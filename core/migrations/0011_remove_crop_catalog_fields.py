@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-19 13:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_populate_crop_catalog'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='crop',
+            name='fertilizer',
+        ),
+        migrations.RemoveField(
+            model_name='crop',
+            name='harvesting_months',
+        ),
+        migrations.RemoveField(
+            model_name='crop',
+            name='image_url',
+        ),
+        migrations.RemoveField(
+            model_name='crop',
+            name='irrigation_liters',
+        ),
+        migrations.RemoveField(
+            model_name='crop',
+            name='irrigation_liters_value',
+        ),
+        migrations.RemoveField(
+            model_name='crop',
+            name='notes',
+        ),
+        migrations.RemoveField(
+            model_name='crop',
+            name='pesticide',
+        ),
+        migrations.RemoveField(
+            model_name='crop',
+            name='sowing_months',
+        ),
+        migrations.RemoveField(
+            model_name='crop',
+            name='sunlight_hours',
+        ),
+    ]
@@ -1,21 +1,117 @@
+import threading
+import time
 from django.db import models
 from django.utils import timezone
 from accounts.models import User
+from .crop_catalog import months_in_mask, parse_liters  # noqa: F401  (parse_liters is re-exported)
+
+# Seconds a process trusts its in-memory copy of the crop catalog
+CATALOG_CACHE_SECONDS = 60
+
+
+class CropCatalogManager(models.Manager):
+    """
+    The catalog is a few dozen rows read on every crop page, so each process
+    keeps the whole table in memory and serves Crop.catalog_entry from it.
+    """
+
+    _lock = threading.Lock()
+    _cache = None  # (loaded at, {id: CropCatalog})
+
+    def cached(self, catalog_id):
+        cache = CropCatalogManager._cache
+        if cache is None or time.monotonic() - cache[0] > CATALOG_CACHE_SECONDS:
+            with self._lock:
+                cache = (time.monotonic(), {entry.id: entry for entry in self.get_queryset()})
+                CropCatalogManager._cache = cache
+        entry = cache[1].get(catalog_id)
+        if entry is None and catalog_id is not None:
+            # Added by another process since our copy was loaded
+            entry = self.get_queryset().filter(id=catalog_id).first()
+        return entry
+
+    def all_cached(self):
+        """
+        Every catalog row, from the per-process copy.
+        """
+        self.cached(None)
+        return list(CropCatalogManager._cache[1].values())
+
+    def clear_cache(self):
+        CropCatalogManager._cache = None
+
+
+class CropCatalog(models.Model):
+    """
+    One row per crop in kerala_crops_dataset.csv. Farmers' Crop rows point
+    here instead of each carrying a copy of the crop's details.
+    """
+    name = models.CharField(max_length=100, unique=True)  # Malayalam name
+    english_name = models.CharField(max_length=100, blank=True)
+    image_url = models.URLField(blank=True, null=True)
+    fertilizer = models.CharField(max_length=200, blank=True)
+    pesticide = models.CharField(max_length=200, blank=True)
+
+    # Free text as in the CSV, plus the parsed values used for queries
+    irrigation_liters = models.CharField(max_length=50, blank=True)
+    irrigation_liters_value = models.PositiveIntegerField(blank=True, null=True)
+    sunlight_hours = models.CharField(max_length=50, blank=True)
+    sunlight_hours_min = models.FloatField(blank=True, null=True)
+    sunlight_hours_max = models.FloatField(blank=True, null=True)
+    sowing_months = models.CharField(max_length=200, blank=True)
+    sowing_month_mask = models.PositiveSmallIntegerField(default=0)  # Bit 0 = January
+    harvesting_months = models.CharField(max_length=200, blank=True)
+    harvesting_month_mask = models.PositiveSmallIntegerField(default=0)
+    soil_types = models.JSONField(default=list, blank=True)  # Values from accounts.models.SOIL_TYPES
+
+    notes = models.TextField(blank=True)
+
+    objects = CropCatalogManager()
+
+    class Meta:
+        ordering = ["english_name"]
+
+    def sows_in(self, month):
+        return bool(self.sowing_month_mask & (1 << (month - 1)))
+
+    def harvests_in(self, month):
+        return bool(self.harvesting_month_mask & (1 << (month - 1)))
+
+    @property
+    def sowing_month_numbers(self):
+        return months_in_mask(self.sowing_month_mask)
+
+    @property
+    def harvesting_month_numbers(self):
+        return months_in_mask(self.harvesting_month_mask)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        CropCatalog.objects.clear_cache()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        CropCatalog.objects.clear_cache()
+        return result
+
+    def __str__(self):
+        return f"{self.name} ({self.english_name})"
+
+
+def _catalog_field(name):
+    def getter(self):
+        entry = self.catalog_entry
+        return getattr(entry, name) if entry else None
+    return property(getter)
+
 
 class Crop(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="crops")
     name = models.CharField(max_length=100)  # Malayalam name
     english_name = models.CharField(max_length=100, blank=True, null=True)
     
-    # Details from CSV
-    image_url = models.URLField(blank=True, null=True)
-    fertilizer = models.CharField(max_length=200, blank=True, null=True)
-    pesticide = models.CharField(max_length=200, blank=True, null=True)
-    irrigation_liters = models.CharField(max_length=50, blank=True, null=True)
-    sunlight_hours = models.CharField(max_length=50, blank=True, null=True)
-    sowing_months = models.CharField(max_length=200, blank=True, null=True)
-    harvesting_months = models.CharField(max_length=200, blank=True, null=True)
-    notes = models.TextField(blank=True, null=True)
+    # Crop details live in the shared catalog
+    catalog = models.ForeignKey(CropCatalog, on_delete=models.PROTECT, related_name="crops", blank=True, null=True)
     
     # Timeline
     sown_date = models.DateField(blank=True, null=True)
@@ -25,6 +121,27 @@ class Crop(models.Model):
     is_sown = models.BooleanField(default=False)
     is_harvested = models.BooleanField(default=False)
 
+    @property
+    def catalog_entry(self):
+        """
+        The crop's CropCatalog row, from select_related if it was used and
+        otherwise from the per-process catalog cache (no query).
+        """
+        if self.catalog_id is None:
+            return None
+        if Crop.catalog.is_cached(self):
+            return self.catalog
+        return CropCatalog.objects.cached(self.catalog_id)
+
+    image_url = _catalog_field("image_url")
+    fertilizer = _catalog_field("fertilizer")
+    pesticide = _catalog_field("pesticide")
+    irrigation_liters = _catalog_field("irrigation_liters")
+    sunlight_hours = _catalog_field("sunlight_hours")
+    sowing_months = _catalog_field("sowing_months")
+    harvesting_months = _catalog_field("harvesting_months")
+    notes = _catalog_field("notes")
+
     def __str__(self):
         return f"{self.name} ({self.english_name or ''}) - {self.user.name or self.user.mobile}"
 
@@ -41,6 +158,11 @@ class ActivityLog(models.Model):
     
     notes = models.TextField(blank=True, null=True)  # For any extra notes for the day
 
+    # Offline sync bookkeeping
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # Server change cursor
+    client_updated_at = models.DateTimeField(blank=True, null=True)  # When the farmer made the change on the device
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True)  # Key of the last sync delta applied
+
     class Meta:
         # This is very important: it ensures you can only have ONE log entry per crop per day.
         unique_together = ('crop', 'date')
@@ -61,3 +183,56 @@ class Advisory(models.Model):
     category = models.CharField(max_length=10, choices=CATEGORY_CHOICES, default="TIP")
     date = models.DateField(default=timezone.now)
     is_acknowledged = models.BooleanField(default=False)
+
+
+# Price history: append-only daily points plus rollups rebuilt on ingest (see core/price_history.py)
+class CropPriceHistory(models.Model):
+    district = models.CharField(max_length=50)
+    crop_english = models.CharField(max_length=100)
+    date = models.DateField()
+    price_per_quintal = models.PositiveIntegerField()  # INR
+
+    class Meta:
+        # One point per series per day; the unique index also serves date-range reads
+        unique_together = ('district', 'crop_english', 'date')
+
+    def __str__(self):
+        return f"{self.crop_english} in {self.district} on {self.date}: {self.price_per_quintal}"
+
+
+class CropPriceWeekly(models.Model):
+    district = models.CharField(max_length=50)
+    crop_english = models.CharField(max_length=100)
+    week_start = models.DateField()
+    avg_price = models.FloatField()
+    min_price = models.PositiveIntegerField()
+    max_price = models.PositiveIntegerField()
+    points = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ('district', 'crop_english', 'week_start')
+
+
+class CropPriceStats(models.Model):
+    district = models.CharField(max_length=50)
+    crop_english = models.CharField(max_length=100)
+    latest_date = models.DateField()
+    latest_price = models.PositiveIntegerField()
+
+    # Moving averages over the 7/30/90 days up to latest_date
+    ma_7 = models.FloatField(blank=True, null=True)
+    ma_30 = models.FloatField(blank=True, null=True)
+    ma_90 = models.FloatField(blank=True, null=True)
+
+    # Percentiles over the last 365 days
+    p10 = models.FloatField(blank=True, null=True)
+    p25 = models.FloatField(blank=True, null=True)
+    p50 = models.FloatField(blank=True, null=True)
+    p75 = models.FloatField(blank=True, null=True)
+    p90 = models.FloatField(blank=True, null=True)
+
+    week_over_week_pct = models.FloatField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('district', 'crop_english')
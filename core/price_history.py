@@ -0,0 +1,171 @@
+# core/price_history.py
+
+import logging
+import statistics
+from collections import defaultdict
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import TruncWeek
+from .models import CropPriceHistory, CropPriceStats, CropPriceWeekly
+
+logger = logging.getLogger(__name__)
+
+MOVING_AVERAGE_DAYS = (7, 30, 90)
+PERCENTILE_WINDOW_DAYS = 365
+# statistics.quantiles(n=20) cut points: index 1 is p10, 4 is p25, ...
+PERCENTILE_CUTS = {"p10": 1, "p25": 4, "p50": 9, "p75": 14, "p90": 17}
+
+
+def _series_filter(series):
+    query = Q()
+    for district, crop_english in series:
+        query |= Q(district=district, crop_english=crop_english)
+    return query
+
+
+def ingest_snapshot(rows, snapshot_date):
+    """
+    Appends one snapshot of prices. Each row needs district, crop_english and
+    price_per_quintal_in_inr; a row may carry its own 'date' for backfills.
+    Existing (district, crop, date) points are never overwritten.
+    Returns the number of rows offered and the set of series touched.
+    """
+    points = []
+    for row in rows:
+        points.append(CropPriceHistory(
+            district=row["district"],
+            crop_english=row["crop_english"],
+            date=row.get("date") or snapshot_date,
+            price_per_quintal=int(row["price_per_quintal_in_inr"]),
+        ))
+
+    with transaction.atomic():
+        CropPriceHistory.objects.bulk_create(points, ignore_conflicts=True, batch_size=1000)
+        series = {(p.district, p.crop_english) for p in points}
+        refresh_rollups(series, {p.date for p in points})
+
+    logger.info(f"Ingested {len(points)} price points for {len(series)} series")
+    return len(points), series
+
+
+def refresh_rollups(series, dates):
+    """
+    Rebuilds the weekly rollups for the weeks containing `dates` and the
+    per-series stats for every series in `series`.
+    """
+    if not series:
+        return
+
+    # Weekly rollups: aggregated in the database, only for the touched weeks
+    week_starts = {d - timedelta(days=d.weekday()) for d in dates}
+    weekly = (
+        CropPriceHistory.objects.filter(_series_filter(series))
+        .filter(date__gte=min(week_starts), date__lt=max(week_starts) + timedelta(days=7))
+        .annotate(week_start=TruncWeek("date"))
+        .values("district", "crop_english", "week_start")
+        .annotate(avg_price=Avg("price_per_quintal"), min_price=Min("price_per_quintal"),
+                  max_price=Max("price_per_quintal"), points=Count("id"))
+    )
+    CropPriceWeekly.objects.bulk_create(
+        [CropPriceWeekly(**row) for row in weekly if row["week_start"] in week_starts],
+        update_conflicts=True,
+        unique_fields=["district", "crop_english", "week_start"],
+        update_fields=["avg_price", "min_price", "max_price", "points"],
+    )
+
+    # Per-series stats over the last year of each touched series
+    latest_dates = dict(
+        ((row["district"], row["crop_english"]), row["latest"])
+        for row in CropPriceHistory.objects.filter(_series_filter(series))
+        .values("district", "crop_english").annotate(latest=Max("date"))
+    )
+    window_start = min(latest_dates.values()) - timedelta(days=PERCENTILE_WINDOW_DAYS - 1)
+    history = defaultdict(list)
+    for district, crop_english, day, price in (
+        CropPriceHistory.objects.filter(_series_filter(series), date__gte=window_start)
+        .order_by("date").values_list("district", "crop_english", "date", "price_per_quintal")
+    ):
+        history[(district, crop_english)].append((day, price))
+
+    stats = [
+        _series_stats(district, crop_english, latest_dates[(district, crop_english)], points)
+        for (district, crop_english), points in history.items()
+    ]
+    CropPriceStats.objects.bulk_create(
+        stats,
+        update_conflicts=True,
+        unique_fields=["district", "crop_english"],
+        update_fields=[
+            "latest_date", "latest_price", "ma_7", "ma_30", "ma_90",
+            "p10", "p25", "p50", "p75", "p90", "week_over_week_pct", "updated_at",
+        ],
+    )
+
+
+def _series_stats(district, crop_english, latest_date, points):
+    """
+    Builds the CropPriceStats row for one series from its (date, price) points,
+    oldest first, covering at most the last PERCENTILE_WINDOW_DAYS days.
+    """
+    points = [(day, price) for day, price in points if day > latest_date - timedelta(days=PERCENTILE_WINDOW_DAYS)]
+    latest_price = points[-1][1]
+    stats = CropPriceStats(
+        district=district, crop_english=crop_english,
+        latest_date=latest_date, latest_price=latest_price,
+    )
+
+    for days in MOVING_AVERAGE_DAYS:
+        window = [price for day, price in points if day > latest_date - timedelta(days=days)]
+        setattr(stats, f"ma_{days}", round(statistics.fmean(window), 2))
+
+    prices = [price for _, price in points]
+    if len(prices) > 1:
+        cuts = statistics.quantiles(prices, n=20, method="inclusive")
+        for name, index in PERCENTILE_CUTS.items():
+            setattr(stats, name, round(cuts[index], 2))
+    else:
+        for name in PERCENTILE_CUTS:
+            setattr(stats, name, float(latest_price))
+
+    # Compare with the latest point at least a week older
+    week_ago = latest_date - timedelta(days=7)
+    previous = [price for day, price in points if day <= week_ago]
+    if previous and previous[-1]:
+        stats.week_over_week_pct = round((latest_price - previous[-1]) * 100 / previous[-1], 2)
+    return stats
+
+
+def price_trend(district, crop_english, weeks=12):
+    """
+    Precomputed stats and the last `weeks` weekly averages for one series,
+    or None if the series has no history.
+    """
+    stats = CropPriceStats.objects.filter(district=district, crop_english__iexact=crop_english).first()
+    if stats is None:
+        return None
+
+    weekly = CropPriceWeekly.objects.filter(
+        district=district,
+        crop_english=stats.crop_english,
+        week_start__gt=stats.latest_date - timedelta(weeks=weeks),
+    ).order_by("week_start")
+
+    return {
+        "district": district,
+        "crop_english": stats.crop_english,
+        "latest_date": stats.latest_date.isoformat(),
+        "latest_price": stats.latest_price,
+        "moving_averages": {f"{days}d": getattr(stats, f"ma_{days}") for days in MOVING_AVERAGE_DAYS},
+        "percentiles_365d": {name: getattr(stats, name) for name in PERCENTILE_CUTS},
+        "week_over_week_pct": stats.week_over_week_pct,
+        "weekly": [
+            {
+                "week_start": week.week_start.isoformat(),
+                "avg_price": round(week.avg_price, 2),
+                "min_price": week.min_price,
+                "max_price": week.max_price,
+            }
+            for week in weekly
+        ],
+    }
@@ -0,0 +1,93 @@
+# core/price_lookup.py
+
+import threading
+import numpy as np
+from . import reference_data
+from .advisory_engine import DISTRICT_COORDINATES
+
+EARTH_RADIUS_KM = 6371.0
+
+# Default cost of moving one quintal one kilometre (INR), used for the net-price score
+TRANSPORT_COST_PER_QUINTAL_KM = 2.5
+
+DISTRICT_NAMES = tuple(DISTRICT_COORDINATES)
+DISTRICT_INDEX = {name: i for i, name in enumerate(DISTRICT_NAMES)}
+
+
+def haversine_matrix(lats, lngs):
+    """
+    Great-circle distances (km) between every pair of points, computed with
+    numpy broadcasting instead of a Python double loop.
+    """
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lng = np.radians(np.asarray(lngs, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+# Straight-line district-to-district distances, computed once per process
+DISTANCE_KM = haversine_matrix(
+    [DISTRICT_COORDINATES[name]["lat"] for name in DISTRICT_NAMES],
+    [DISTRICT_COORDINATES[name]["lng"] for name in DISTRICT_NAMES],
+)
+DISTANCE_KM.setflags(write=False)
+
+_lock = threading.Lock()
+_price_matrix = None  # (dataset version, {crop key: price row aligned with DISTRICT_NAMES})
+
+
+def prices_by_crop():
+    """
+    One float array per crop holding its price in every district (NaN where the
+    dataset has none). Rebuilt only when the prices dataset is reloaded.
+    """
+    global _price_matrix
+    dataset = reference_data.prices()
+    cached = _price_matrix
+    if cached and cached[0] == dataset.version:
+        return cached[1]
+
+    with _lock:
+        rows = {}
+        for row in dataset.rows:
+            index = DISTRICT_INDEX.get(row["district"])
+            if index is None:
+                continue
+            for key in (row["crop_english"].lower(), row["crop_malayalam"].lower()):
+                prices = rows.setdefault(key, np.full(len(DISTRICT_NAMES), np.nan))
+                prices[index] = row["price_per_quintal_in_inr"]
+        for prices in rows.values():
+            prices.setflags(write=False)
+        _price_matrix = (dataset.version, rows)
+        return rows
+
+
+def best_prices(district, crop, cost_per_km=TRANSPORT_COST_PER_QUINTAL_KM):
+    """
+    Ranks every district's price for `crop` (English or Malayalam name) by
+    net price = price - transport cost from the farmer's district.
+    Returns None if the district or crop is unknown.
+    """
+    origin = DISTRICT_INDEX.get(district)
+    prices = prices_by_crop().get((crop or "").strip().lower())
+    if origin is None or prices is None:
+        return None
+
+    distances = DISTANCE_KM[origin]
+    net = prices - distances * cost_per_km
+    available = np.flatnonzero(~np.isnan(prices))
+    ranked = available[np.argsort(-net[available], kind="stable")]
+    local_net = net[origin]
+
+    return [
+        {
+            "district": DISTRICT_NAMES[i],
+            "price_per_quintal": int(prices[i]),
+            "distance_km": round(float(distances[i]), 1),
+            "net_price_per_quintal": round(float(net[i]), 2),
+            "gain_vs_local": None if np.isnan(local_net) else round(float(net[i] - local_net), 2),
+        }
+        for i in ranked
+    ]
@@ -0,0 +1,151 @@
+# core/recommendations.py
+
+import logging
+import threading
+import numpy as np
+from django.utils import timezone
+from accounts.models import SOIL_TYPES
+from . import reference_data
+from .crop_catalog import parse_month_mask, parse_soil_types
+from .price_lookup import DISTRICT_INDEX, DISTRICT_NAMES, prices_by_crop
+
+logger = logging.getLogger(__name__)
+
+# How much each signal contributes to a crop's score (sums to 1)
+SOWING_WEIGHT = 0.5
+SOIL_WEIGHT = 0.3
+PRICE_WEIGHT = 0.2
+
+# Sowing score when the window opens next month: worth preparing the land now
+SOWING_NEXT_MONTH_SCORE = 0.5
+# Price score for a crop with no price in the district
+UNKNOWN_PRICE_SCORE = 0.5
+
+SOIL_NAMES = tuple(value for value, _ in SOIL_TYPES)
+SOIL_INDEX = {name: i for i, name in enumerate(SOIL_NAMES)}
+
+DEFAULT_LIMIT = 5
+
+
+def _soil_key(soil):
+    # The CSV and the signup form disagree on a trailing "soil" (ചെങ്കൽ / ചെങ്കൽ മണ്ണ്)
+    return soil.replace("മണ്ണ്", "").strip()
+
+
+def _price_ranks(prices):
+    """
+    Where each district's price sits among the districts selling the crop,
+    from 0 (cheapest) to 1 (dearest); UNKNOWN_PRICE_SCORE where there is no price.
+    """
+    ranks = np.full(len(prices), UNKNOWN_PRICE_SCORE)
+    available = np.flatnonzero(~np.isnan(prices))
+    if len(available) > 1:
+        order = available[np.argsort(prices[available], kind="stable")]
+        ranks[order] = np.arange(len(order)) / (len(order) - 1)
+    return ranks
+
+
+class RecommendationMatrix:
+    """
+    Scores for every crop in every (district, soil, month), with the crops of
+    each cell already sorted best first, so a recommendation is an index lookup.
+    """
+
+    def __init__(self, crops, prices, version):
+        self.version = version
+        self.crops = crops
+        count = len(crops)
+        months = np.arange(12)
+
+        # sowing[month, crop]
+        masks = np.array([parse_month_mask(crop.get("sowing_months")) for crop in crops], dtype=np.int64)
+        sow_now = (masks[None, :] >> months[:, None]) & 1
+        sow_next = (masks[None, :] >> ((months[:, None] + 1) % 12)) & 1
+        self.sowing = np.where(sow_now == 1, 1.0, np.where(sow_next == 1, SOWING_NEXT_MONTH_SCORE, 0.0))
+
+        # soil[soil, crop]
+        self.soil = np.zeros((len(SOIL_NAMES), count))
+        for c, crop in enumerate(crops):
+            suitable = {_soil_key(soil) for soil in parse_soil_types(crop.get("soil_type"))}
+            for s, name in enumerate(SOIL_NAMES):
+                self.soil[s, c] = 1.0 if _soil_key(name) in suitable else 0.0
+
+        # price[district, crop]
+        self.price = np.full((len(DISTRICT_NAMES), count), UNKNOWN_PRICE_SCORE)
+        for c, crop in enumerate(crops):
+            row = prices.get(crop.get("crop_english", "").lower())
+            if row is not None:
+                self.price[:, c] = _price_ranks(row)
+
+        # scores[district, soil, month, crop]
+        self.scores = (
+            SOWING_WEIGHT * self.sowing[None, None, :, :]
+            + SOIL_WEIGHT * self.soil[None, :, None, :]
+            + PRICE_WEIGHT * self.price[:, None, None, :]
+        )
+        self.ranked = np.argsort(-self.scores, axis=-1, kind="stable")
+        for array in (self.sowing, self.soil, self.price, self.scores, self.ranked):
+            array.setflags(write=False)
+
+    def recommend(self, district, soil, month, limit=DEFAULT_LIMIT):
+        d = DISTRICT_INDEX.get(district)
+        s = SOIL_INDEX.get(soil)
+        if d is None or s is None:
+            return []
+        m = month - 1
+
+        results = []
+        for c in self.ranked[d, s, m]:
+            # Only crops that can be sown now or next month
+            if not self.sowing[m, c]:
+                continue
+            crop = self.crops[c]
+            results.append({
+                "name": crop.get("crop_malayalam", ""),
+                "english_name": crop.get("crop_english", ""),
+                "image_url": crop.get("image_url", ""),
+                "score": round(float(self.scores[d, s, m, c]), 3),
+                "sow_now": bool(self.sowing[m, c] == 1.0),
+                "soil_match": bool(self.soil[s, c]),
+                "price_rank": round(float(self.price[d, c]), 2),
+                "sowing_months": crop.get("sowing_months", ""),
+            })
+            if len(results) == limit:
+                break
+        return results
+
+
+_lock = threading.Lock()
+_matrix = None
+
+
+def get_matrix():
+    """
+    Returns the matrix for the current crop and price datasets, rebuilding it
+    only when either has been reloaded.
+    """
+    global _matrix
+    crops = reference_data.crops()
+    prices = reference_data.prices()
+    version = (crops.version, prices.version)
+    matrix = _matrix
+    if matrix is not None and matrix.version == version:
+        return matrix
+    with _lock:
+        if _matrix is None or _matrix.version != version:
+            _matrix = RecommendationMatrix(crops.rows, prices_by_crop(), version)
+            logger.info(f"Built crop recommendation matrix for {len(crops.rows)} crops")
+        return _matrix
+
+
+def recommend_crops(district, soil, month=None, limit=DEFAULT_LIMIT):
+    """
+    Best crops to sow for a district and soil type this month (or `month`, 1-12),
+    best first. Unknown districts or soils get no recommendations.
+    """
+    month = month or timezone.localdate().month
+    return get_matrix().recommend(district, soil, month, limit)
+
+
+def recommend_for_user(user, month=None, limit=DEFAULT_LIMIT):
+    return recommend_crops(user.district, user.soil_type, month, limit)
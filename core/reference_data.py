@@ -0,0 +1,170 @@
+# core/reference_data.py
+
+import csv
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# How often (seconds) a dataset's file is stat'ed to see if it changed
+RELOAD_CHECK_INTERVAL = 5
+
+
+class ReferenceData:
+    """
+    Immutable rows of one CSV dataset plus a lookup index.
+    `version` is the file's mtime and changes whenever the dataset is reloaded.
+    """
+
+    def __init__(self, rows, index, version):
+        self.rows = tuple(rows)
+        self.index = MappingProxyType({key: tuple(value) for key, value in index.items()})
+        self.version = version
+
+    def get(self, key):
+        return self.index.get(key, ())
+
+
+def _freeze(row):
+    return MappingProxyType(row)
+
+
+def _load_crops(path):
+    rows = []
+    index = {}
+    with open(path, encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            clean_row = _freeze({
+                k.strip().lower().replace(" ", "_"): (v or "").strip()
+                for k, v in row.items()
+                if k is not None  # DictReader puts surplus columns under None
+            })
+            rows.append(clean_row)
+            # Index by both the Malayalam and the (case-insensitive) English name
+            for name in (clean_row.get("crop_malayalam"), clean_row.get("crop_english", "").lower()):
+                if name:
+                    index.setdefault(name, []).append(clean_row)
+    return rows, index
+
+
+def _load_prices(path):
+    rows = []
+    index = {}
+    with open(path, encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            try:
+                price = int(float(row.get("price_per_quintal_in_inr") or 0))
+            except ValueError:
+                logger.warning(f"Skipping price row with invalid price: {row}")
+                continue
+            clean_row = _freeze({
+                "district": row.get("district", "").strip(),
+                "crop_malayalam": row.get("crop_malayalam", "").strip(),
+                "crop_english": row.get("crop_english", "").strip(),
+                "price_per_quintal_in_inr": price,
+            })
+            rows.append(clean_row)
+            index.setdefault(clean_row["district"], []).append(clean_row)
+    return rows, index
+
+
+def _load_schemes(path):
+    rows = []
+    index = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            scheme = _freeze({
+                "name": (row.get("Scheme Name") or "").strip(),
+                "department": (row.get("Department / Authority") or "").strip(),
+                "category": (row.get("Category") or "").strip(),
+                "eligibility": (row.get("Eligibility / Key Points") or "").strip(),
+                "benefits": (row.get("Benefits") or "").strip(),
+                "link": (row.get("Official Website / More Info") or "").strip(),
+            })
+            # Keep only rows that name a scheme
+            if scheme["name"]:
+                rows.append(scheme)
+                index.setdefault(scheme["category"], []).append(scheme)
+    return rows, index
+
+
+DATASETS = {
+    "crops": ("kerala_crops_dataset.csv", _load_crops),
+    "prices": ("district_crop_prices.csv", _load_prices),
+    "schemes": ("gov_scheme.csv", _load_schemes),
+}
+
+_lock = threading.Lock()
+_loaded = {}  # name -> (ReferenceData, last checked at)
+
+
+def _dataset_path(filename):
+    return Path(settings.BASE_DIR) / "database" / filename
+
+
+def get_dataset(name):
+    """
+    Returns the ReferenceData for a dataset, parsing the CSV only on first use
+    and again when the file's mtime changes.
+    """
+    now = time.monotonic()
+    entry = _loaded.get(name)
+    if entry and now - entry[1] < RELOAD_CHECK_INTERVAL:
+        return entry[0]
+
+    filename, loader = DATASETS[name]
+    path = _dataset_path(filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    with _lock:
+        entry = _loaded.get(name)
+        if entry and entry[0].version == mtime:
+            _loaded[name] = (entry[0], now)
+            return entry[0]
+
+        if mtime is None:
+            logger.warning(f"{filename} not found, the {name} dataset will be empty.")
+            rows, index = [], {}
+        else:
+            rows, index = loader(path)
+            logger.info(f"Loaded {len(rows)} rows from {filename}")
+
+        data = ReferenceData(rows, index, mtime)
+        _loaded[name] = (data, now)
+        return data
+
+
+def crops():
+    return get_dataset("crops")
+
+
+def prices():
+    return get_dataset("prices")
+
+
+def schemes():
+    return get_dataset("schemes")
+
+
+def crop_by_name(name):
+    """
+    Looks a crop up by its Malayalam or English name. Returns None if unknown.
+    """
+    matches = crops().get(name) or crops().get((name or "").lower())
+    return matches[0] if matches else None
+
+
+def prices_for_district(district):
+    return prices().get(district)
+
+
+def schemes_in_category(category):
+    return schemes().get(category)
@@ -0,0 +1,156 @@
+# core/scheme_search.py
+
+import bisect
+import itertools
+import logging
+import math
+import threading
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import connection
+from . import reference_data
+from .text import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Field weights: a hit in the scheme name counts more than one in the benefits text
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "category": 2.0,
+    "department": 1.5,
+    "eligibility": 1.0,
+    "benefits": 1.0,
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+class SchemeIndex:
+    """
+    Inverted index over the scheme dataset: term -> [(scheme position, weighted tf)].
+    Scores are BM25 over the weighted term frequencies.
+    """
+
+    def __init__(self, schemes, version):
+        self.schemes = schemes
+        self.version = version
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+
+        for position, scheme in enumerate(schemes):
+            frequencies = Counter()
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(scheme[field]):
+                    frequencies[token] += weight
+            self.doc_lengths.append(sum(frequencies.values()))
+            for token, frequency in frequencies.items():
+                self.postings[token].append((position, frequency))
+
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        count = len(schemes)
+        self.idf = {
+            token: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for token, docs in self.postings.items()
+        }
+        self.postings = dict(self.postings)
+        self.vocabulary = sorted(self.postings)
+
+    def search(self, query):
+        """
+        Returns [(position, score)] for schemes matching any query term, best first.
+        The last query term also matches as a prefix, for search-as-you-type.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        expanded = [(term, 1.0) for term in set(terms[:-1])]
+        last = terms[-1]
+        expanded.append((last, 1.0))
+        if len(last) >= 3:
+            start = bisect.bisect_left(self.vocabulary, last)
+            for token in itertools.islice(self.vocabulary, start, None):
+                if not token.startswith(last):
+                    break
+                if token != last:
+                    expanded.append((token, 0.5))
+
+        scores = defaultdict(float)
+        for term, boost in expanded:
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, frequency in self.postings[term]:
+                norm = K1 * (1 - B + B * self.doc_lengths[position] / self.avg_length)
+                scores[position] += boost * idf * frequency * (K1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def get_index():
+    """
+    Returns the index for the current scheme dataset, rebuilding it only when
+    the dataset has been reloaded.
+    """
+    global _index
+    dataset = reference_data.schemes()
+    index = _index
+    if index is not None and index.version == dataset.version:
+        return index
+    with _lock:
+        if _index is None or _index.version != dataset.version:
+            _index = SchemeIndex(dataset.rows, dataset.version)
+            logger.info(f"Built scheme search index over {len(dataset.rows)} schemes")
+        return _index
+
+
+def _postgres_search(schemes, query):
+    """
+    Ranks the schemes with PostgreSQL full-text search. The rows are passed as an
+    array so no table is needed; the 'simple' configuration is used because
+    PostgreSQL ships no Malayalam dictionary.
+    """
+    documents = [
+        " ".join(scheme[field] for field in FIELD_WEIGHTS)
+        for scheme in schemes
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT t.ord - 1, ts_rank(to_tsvector('simple', t.document), query) AS score
+            FROM unnest(%s::text[]) WITH ORDINALITY AS t(document, ord),
+                 plainto_tsquery('simple', %s) AS query
+            WHERE to_tsvector('simple', t.document) @@ query
+            ORDER BY score DESC, t.ord
+            """,
+            [documents, query],
+        )
+        return [(int(position), float(score)) for position, score in cursor.fetchall()]
+
+
+def search_schemes(query, category=None, limit=10):
+    """
+    Searches the government schemes. Returns (results, facets, total) where
+    facets counts matches per category before the category filter is applied.
+    """
+    index = get_index()
+    use_postgres = (
+        getattr(settings, "SCHEME_SEARCH_BACKEND", "memory") == "postgres"
+        and connection.vendor == "postgresql"
+    )
+    matches = _postgres_search(index.schemes, query) if use_postgres else index.search(query)
+
+    facets = Counter(index.schemes[position]["category"] for position, _ in matches)
+    if category:
+        matches = [(position, score) for position, score in matches if index.schemes[position]["category"] == category]
+
+    results = [
+        {**index.schemes[position], "score": round(score, 4)}
+        for position, score in matches[:limit]
+    ]
+    return results, dict(facets.most_common()), len(matches)
@@ -0,0 +1,51 @@
+# core/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from accounts.models import User
+from .context_version import bump_catalog_version, bump_user_version
+from .models import ActivityLog, Advisory, Crop, CropCatalog
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    bump_user_version(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Crop)
+def crop_changed(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
+
+
+# A crop never changes owner, so owners are safe to remember
+_crop_owners = {}
+MAX_REMEMBERED_OWNERS = 10000
+
+
+def _crop_owner(crop_id):
+    owner = _crop_owners.get(crop_id)
+    if owner is None:
+        owner = Crop.objects.filter(pk=crop_id).values_list("user_id", flat=True).first()
+        if owner is not None:
+            if len(_crop_owners) >= MAX_REMEMBERED_OWNERS:
+                _crop_owners.clear()
+            _crop_owners[crop_id] = owner
+    return owner
+
+
+# Only saves: a delete receiver would turn off Django's fast queryset delete
+# for these high-volume tables, so the code deleting them bumps explicitly
+@receiver(post_save, sender=ActivityLog)
+@receiver(post_save, sender=Advisory)
+def crop_record_changed(sender, instance, **kwargs):
+    if sender.crop.is_cached(instance):
+        bump_user_version(instance.crop.user_id)
+    else:
+        owner = _crop_owner(instance.crop_id)
+        if owner is not None:
+            bump_user_version(owner)
+
+
+@receiver([post_save, post_delete], sender=CropCatalog)
+def catalog_changed(sender, instance, **kwargs):
+    bump_catalog_version()
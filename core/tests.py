@@ -1,3 +1,565 @@
+import os
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from kissan.perf_budget import ViewBudget, ViewBudgetMixin, make_farmer
+from . import recommendations, reference_data
+from .activity_logs import (
+    MAX_NOTES_LENGTH, SYNC_SETTLE_SECONDS, bulk_upsert_activity_logs, parse_activity_entries,
+    parse_sync_deltas, sync_activity_logs,
+)
+from .analytics import cached_district_water_usage, crop_water_usage
+from .models import ActivityLog, Crop, CropCatalog, CropPriceHistory
+from .price_history import ingest_snapshot, price_trend
+from .price_lookup import DISTRICT_INDEX, DISTRICT_NAMES, best_prices, haversine_matrix
+from .reference_data import ReferenceData
+from .scheme_search import SchemeIndex, search_schemes
+from .text import tokenize
+
+
+class CoreViewBudgetTests(ViewBudgetMixin, TestCase):
+    urlconf = "core.urls"
+
+    def budgets(self):
+        return [
+            ViewBudget("dashboard", max_queries=5),
+            ViewBudget("logout", max_queries=4),
+            ViewBudget("profile_page", max_queries=2),
+            ViewBudget("add_crop", max_queries=2),
+            ViewBudget("crop_activity_log", max_queries=5, kwargs={"crop_id": lambda t: t.crop.id}),
+            ViewBudget("bulk_activity_log", max_queries=4, method="post", content_type="application/json",
+                       data=lambda t: {"entries": [{"crop_id": t.crop.id, "did_irrigate": True}]}),
+            ViewBudget("activity_log_sync", max_queries=5, method="post", content_type="application/json",
+                       data={"changes": []}),
+            ViewBudget("water_analytics", max_queries=4),
+            ViewBudget("prices_page", max_queries=2),
+            ViewBudget("prices_json", max_queries=2),
+            ViewBudget("price_history", max_queries=4, data={"crop": "Paddy"}),
+            ViewBudget("best_price_lookup", max_queries=2, data={"crop": "Paddy"}),
+            ViewBudget("gov_schemes", max_queries=0),
+            ViewBudget("gov_schemes_search", max_queries=0, data={"q": "coconut subsidy"}),
+            ViewBudget("advisory_page", max_queries=7),
+            ViewBudget("mark_advisory_acknowledged", max_queries=3, method="post",
+                       kwargs={"advisory_id": lambda t: t.advisory.id}),
+            ViewBudget("refresh_weather_advisory", max_queries=2),
+        ]
+
+
+class BulkActivityLogTests(TestCase):
+    def setUp(self):
+        self.user = make_farmer()
+        self.crop = Crop.objects.create(user=self.user, name="നെല്ല്", is_sown=True)
+        self.today = timezone.now().date()
+
+    def upsert(self, raw_entries):
+        entries, errors = parse_activity_entries(raw_entries)
+        self.assertEqual(errors, [])
+        return bulk_upsert_activity_logs(self.user, entries)
+
+    def test_overwrites_the_existing_days_log(self):
+        ActivityLog.objects.create(crop=self.crop, date=self.today, did_irrigate=True, notes="morning")
+        self.assertEqual(self.upsert([{"crop_id": self.crop.id, "did_fertilize": True, "notes": "evening"}]), (1, []))
+        log = ActivityLog.objects.get(crop=self.crop)
+        self.assertEqual((log.did_irrigate, log.did_fertilize, log.notes), (False, True, "evening"))
+
+    def test_another_farmers_crop_is_rejected_and_the_rest_written(self):
+        other = Crop.objects.create(user=make_farmer("9000000003"), name="വാഴ")
+        written, rejected = self.upsert([
+            {"crop_id": self.crop.id, "did_irrigate": True},
+            {"crop_id": other.id, "did_irrigate": True},
+        ])
+        self.assertEqual(written, 1)
+        self.assertEqual([entry["crop_id"] for entry in rejected], [other.id])
+        self.assertFalse(ActivityLog.objects.filter(crop=other).exists())
+
+    def test_last_entry_for_a_day_wins(self):
+        entries, _ = parse_activity_entries([
+            {"crop_id": self.crop.id, "did_irrigate": True},
+            {"crop_id": self.crop.id, "did_fertilize": "on", "date": self.today.isoformat()},
+        ])
+        self.assertEqual(len(entries), 1)
+        self.assertEqual((entries[0]["did_irrigate"], entries[0]["did_fertilize"]), (False, True))
+
+    def test_notes_must_be_text_of_bounded_length(self):
+        _, errors = parse_activity_entries([
+            {"crop_id": self.crop.id, "notes": {"text": "x"}},
+            {"crop_id": self.crop.id, "notes": ["x"]},
+            {"crop_id": self.crop.id, "notes": "x" * (MAX_NOTES_LENGTH + 1)},
+        ])
+        self.assertEqual([error["index"] for error in errors], [0, 1, 2])
+        entries, _ = parse_activity_entries([{"crop_id": self.crop.id, "notes": "  x" * 10}])
+        self.assertEqual(entries[0]["notes"], ("  x" * 10).strip())
+
+
+class ActivityLogSyncTests(TestCase):
+    def setUp(self):
+        self.user = make_farmer()
+        self.crop = Crop.objects.create(user=self.user, name="നെല്ല്", english_name="Paddy", is_sown=True)
+        self.today = timezone.now().date()
+
+    def delta(self, key, minutes_ago, **fields):
+        return {
+            "crop_id": self.crop.id, "date": self.today.isoformat(), "idempotency_key": key,
+            "client_updated_at": (timezone.now() - timedelta(minutes=minutes_ago)).isoformat(), **fields,
+        }
+
+    def sync(self, raw_deltas, cursor=None):
+        deltas, errors = parse_sync_deltas(raw_deltas)
+        self.assertEqual(errors, [])
+        return sync_activity_logs(self.user, deltas, cursor=cursor)
+
+    def settle(self):
+        ActivityLog.objects.update(updated_at=timezone.now() - timedelta(seconds=SYNC_SETTLE_SECONDS + 1))
+
+    def test_applies_then_acknowledges_a_retry_as_duplicate(self):
+        change = self.delta("a", 5, did_irrigate=True)
+        self.assertEqual(self.sync([change])["applied"], ["a"])
+        result = self.sync([change])
+        self.assertEqual((result["applied"], result["duplicates"]), ([], ["a"]))
+        self.assertTrue(ActivityLog.objects.get(crop=self.crop).did_irrigate)
+
+    def test_older_change_loses_to_newer_server_row(self):
+        self.sync([self.delta("new", 1, did_irrigate=True)])
+        result = self.sync([self.delta("old", 10, did_fertilize=True)])
+        self.assertEqual([conflict["idempotency_key"] for conflict in result["conflicts"]], ["old"])
+        log = ActivityLog.objects.get(crop=self.crop)
+        self.assertEqual((log.did_irrigate, log.did_fertilize), (True, False))
+
+    def test_older_change_for_the_same_day_in_a_batch_is_superseded(self):
+        result = self.sync([self.delta("newer", 1), self.delta("older", 5), self.delta("oldest", 9)])
+        self.assertEqual(result["applied"], ["newer"])
+        self.assertCountEqual(result["superseded"], ["older", "oldest"])
+
+    def test_changes_are_held_back_until_settled(self):
+        self.sync([self.delta("a", 5)])
+        result = self.sync([])
+        self.assertEqual((result["changes"], result["cursor"]), ([], ""))
+
+        self.settle()
+        result = self.sync([])
+        self.assertEqual(len(result["changes"]), 1)
+        self.assertEqual(self.sync([], cursor=result["cursor"])["changes"], [])
+
+    def test_cursor_pages_through_changes(self):
+        Crop.objects.bulk_create([Crop(user=self.user, name=f"വിള {i}") for i in range(2)])
+        for crop in Crop.objects.filter(user=self.user):
+            ActivityLog.objects.create(crop=crop, date=self.today)
+        self.settle()
+
+        deltas, _ = parse_sync_deltas([])
+        seen, cursor = [], None
+        while True:
+            page = sync_activity_logs(self.user, deltas, cursor=cursor, limit=2)
+            seen += [change["id"] for change in page["changes"]]
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                break
+        self.assertCountEqual(seen, ActivityLog.objects.values_list("id", flat=True))
+
+
+class WaterAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        self.catalog = CropCatalog.objects.create(name="നെല്ല്", irrigation_liters_value=100)
+        self.user = make_farmer()
+        self.crop = self.add_crop(self.user, irrigated_days_ago=[4, 2, 0])
+
+    def add_crop(self, user, irrigated_days_ago):
+        crop = Crop.objects.create(user=user, name="നെല്ല്", catalog=self.catalog, is_sown=True)
+        ActivityLog.objects.bulk_create([
+            ActivityLog(crop=crop, date=self.today - timedelta(days=days), did_irrigate=True)
+            for days in irrigated_days_ago
+        ])
+        return crop
+
+    def test_crop_usage(self):
+        [usage] = crop_water_usage(Crop.objects.filter(user=self.user))
+        self.assertEqual(usage["irrigation_days"], 3)
+        self.assertEqual(usage["estimated_liters"], 300)
+        # Three irrigations over five days
+        self.assertEqual(usage["irrigations_per_week"], 4.2)
+        self.assertEqual((usage["max_gap_days"], usage["avg_gap_days"]), (2, 2.0))
+        self.assertEqual(usage["district_rank"], 1)
+
+    def test_rank_is_among_every_crop_in_the_district(self):
+        neighbour = self.add_crop(make_farmer("9000000003"), irrigated_days_ago=[3, 2, 1, 0])
+        self.add_crop(make_farmer("9000000004", district="തൃശൂർ"), irrigated_days_ago=[5, 4, 3, 2, 1, 0])
+        [own] = crop_water_usage(Crop.objects.filter(user=self.user))
+        self.assertEqual((own["crop_id"], own["district_rank"]), (self.crop.id, 2))
+        [theirs] = crop_water_usage(Crop.objects.filter(id=neighbour.id))
+        self.assertEqual(theirs["district_rank"], 1)
+
+    def test_district_totals_are_limited_to_the_district(self):
+        self.add_crop(make_farmer("9000000003", district="തൃശൂർ"), irrigated_days_ago=[0])
+        [own] = cached_district_water_usage(self.user.district)
+        self.assertEqual((own["district"], own["estimated_liters"]), (self.user.district, 300))
+        self.assertEqual(len(cached_district_water_usage()), 2)
+
+    def test_farmers_only_see_their_district(self):
+        self.add_crop(make_farmer("9000000003", district="തൃശൂർ"), irrigated_days_ago=[0])
+        self.client.force_login(self.user, backend="accounts.backends.MobileBackend")
+        districts = self.client.get(reverse("water_analytics")).json()["districts"]
+        self.assertEqual([row["district"] for row in districts], [self.user.district])
+
+
+class TokenizeTests(TestCase):
+    def test_longest_malayalam_suffix_is_stripped(self):
+        self.assertEqual(tokenize("കായയിൽ"), ["കായ"])
+        self.assertEqual(tokenize("നെല്ലിന്റെ നെല്ലിൽ നെല്ല്"), ["നെല്ല"] * 3)
+
+    def test_legacy_chillu_and_english_plurals(self):
+        self.assertEqual(tokenize("അവന്\u200d"), tokenize("അവൻ"))
+        self.assertEqual(tokenize("The pests and varieties"), ["pest", "variety"])
+
+
+class DatasetFilesMixin:
+    """
+    Points reference_data at CSV files in a temporary directory, re-stat'ed on
+    every call.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dataset_dir = Path(directory.name)
+        for patcher in (
+            mock.patch.object(reference_data, "_dataset_path", lambda filename: self.dataset_dir / filename),
+            mock.patch.object(reference_data, "RELOAD_CHECK_INTERVAL", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        reference_data._loaded.clear()
+        self.addCleanup(reference_data._loaded.clear)
+        cache.clear()
+
+    def write_dataset(self, name, text, mtime_ns):
+        """
+        Writes a dataset's CSV with an explicit mtime, so a rewrite is seen even
+        within the file system's timestamp resolution.
+        """
+        path = self.dataset_dir / reference_data.DATASETS[name][0]
+        path.write_text(text, encoding="utf-8")
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class ReferenceDataTests(DatasetFilesMixin, TestCase):
+    header = "district,crop_malayalam,crop_english,price_per_quintal_in_inr\n"
+
+    def test_unchanged_file_reuses_the_loaded_dataset(self):
+        self.write_dataset("prices", self.header + "കോഴിക്കോട്,അരി,Paddy,2365\n", 1_000)
+        dataset = reference_data.prices()
+        self.assertIs(reference_data.prices(), dataset)
+        self.assertEqual(dataset.version, 1_000)
+        with self.assertRaises(TypeError):
+            dataset.rows[0]["price_per_quintal_in_inr"] = 0
+
+    def test_touching_the_file_reloads_it(self):
+        self.write_dataset("prices", self.header + "കോഴിക്കോട്,അരി,Paddy,2365\n", 1_000)
+        dataset = reference_data.prices()
+        path = self.dataset_dir / "district_crop_prices.csv"
+        os.utime(path, ns=(2_000, 2_000))
+        touched = reference_data.prices()
+        self.assertIsNot(touched, dataset)
+        self.assertEqual(touched.version, 2_000)
+        self.assertEqual(touched.rows, dataset.rows)
+
+    def test_rewriting_the_file_reloads_its_rows(self):
+        self.write_dataset("prices", self.header + "കോഴിക്കോട്,അരി,Paddy,2365\n", 1_000)
+        self.assertEqual(reference_data.prices_for_district("കോഴിക്കോട്")[0]["price_per_quintal_in_inr"], 2365)
+        self.write_dataset("prices", self.header + "കോഴിക്കോട്,അരി,Paddy,2500\nമലപ്പുറം,അരി,Paddy,2400\n", 2_000)
+        dataset = reference_data.prices()
+        self.assertEqual(dataset.version, 2_000)
+        self.assertEqual(dataset.get("കോഴിക്കോട്")[0]["price_per_quintal_in_inr"], 2500)
+        self.assertEqual(len(dataset.rows), 2)
+
+    def test_file_is_not_stated_again_within_the_check_interval(self):
+        self.write_dataset("prices", self.header + "കോഴിക്കോട്,അരി,Paddy,2365\n", 1_000)
+        with mock.patch.object(reference_data, "RELOAD_CHECK_INTERVAL", 5), \
+                mock.patch.object(reference_data.time, "monotonic", return_value=100.0) as monotonic:
+            dataset = reference_data.prices()
+            self.write_dataset("prices", self.header + "കോഴിക്കോട്,അരി,Paddy,2500\n", 2_000)
+            monotonic.return_value = 104.0
+            self.assertIs(reference_data.prices(), dataset)
+            monotonic.return_value = 105.0
+            self.assertEqual(reference_data.prices().version, 2_000)
+
+    def test_missing_file_is_an_empty_dataset(self):
+        with self.assertLogs("core.reference_data", "WARNING"):
+            dataset = reference_data.prices()
+        self.assertEqual((dataset.rows, dataset.version), ((), None))
+
+
+class PricesJsonTests(DatasetFilesMixin, TestCase):
+    header = "district,crop_malayalam,crop_english,price_per_quintal_in_inr\n"
+
+    def setUp(self):
+        super().setUp()
+        self.write_dataset("prices", self.header + (
+            "കോഴിക്കോട്,അരി,Paddy,2365\n"
+            "കോഴിക്കോട്,വാഴ,Banana,3000\n"
+            "മലപ്പുറം,അരി,Paddy,2400\n"
+        ), 1_000)
+        self.client.force_login(make_farmer(), backend="accounts.backends.MobileBackend")
+
+    def test_defaults_to_the_farmers_district(self):
+        response = self.client.get(reverse("prices_json"))
+        self.assertEqual(response.json(), {"district": "കോഴിക്കോട്", "items": [
+            {"district": "കോഴിക്കോട്", "crop_malayalam": "അരി", "crop_english": "Paddy", "price_per_quintal_in_inr": 2365},
+            {"district": "കോഴിക്കോട്", "crop_malayalam": "വാഴ", "crop_english": "Banana", "price_per_quintal_in_inr": 3000},
+        ]})
+        other = self.client.get(reverse("prices_json"), {"district": "മലപ്പുറം"}).json()
+        self.assertEqual([item["price_per_quintal_in_inr"] for item in other["items"]], [2400])
+        self.assertEqual(self.client.get(reverse("prices_json"), {"district": "Atlantis"}).status_code, 404)
+
+    def test_unchanged_prices_are_not_modified(self):
+        response = self.client.get(reverse("prices_json"))
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(reverse("prices_json"), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Each district has its own tag
+        other = self.client.get(reverse("prices_json"), {"district": "മലപ്പുറം"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other["ETag"], etag)
+
+    def test_reloaded_prices_replace_the_cached_response(self):
+        etag = self.client.get(reverse("prices_json"))["ETag"]
+        self.write_dataset("prices", self.header + "കോഴിക്കോട്,അരി,Paddy,2500\n", 2_000)
+        response = self.client.get(reverse("prices_json"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual([item["price_per_quintal_in_inr"] for item in response.json()["items"]], [2500])
+
+
+class CropPickerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_farmer()
+        self.client.force_login(self.user, backend="accounts.backends.MobileBackend")
+
+    def test_picker_offers_catalog_crops_that_can_be_added(self):
+        CropCatalog.objects.create(name="കാന്താരി", english_name="Bird's Eye Chilli")
+        self.assertContains(self.client.get(reverse("dashboard")), "കാന്താരി")
+
+        self.client.post(reverse("add_crop"), {"malayalam": "കാന്താരി"})
+        self.assertTrue(Crop.objects.filter(user=self.user, name="കാന്താരി", catalog__isnull=False).exists())
+
+    def test_catalog_change_rerenders_the_cached_picker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog = CropCatalog.objects.create(name="കാന്താരി", english_name="Bird Chilli")
+        self.assertContains(self.client.get(reverse("dashboard")), "Bird Chilli")
+
+        catalog.english_name = "Wild Chilli"
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog.save()
+        response = self.client.get(reverse("dashboard"))
+        self.assertContains(response, "Wild Chilli")
+        self.assertNotContains(response, "Bird Chilli")
+
+
+class SchemePageTests(DatasetFilesMixin, TestCase):
+    header = "Scheme Name,Department / Authority,Category,Eligibility / Key Points,Benefits,Official Website / More Info\n"
+
+    def test_dataset_reload_rerenders_the_cached_page(self):
+        self.write_dataset("schemes", self.header + "Old Pension Scheme,Agriculture,State Scheme,All farmers,Pension,\n", 1_000)
+        self.assertContains(self.client.get(reverse("gov_schemes")), "Old Pension Scheme")
+
+        self.write_dataset("schemes", self.header + "New Pension Scheme,Agriculture,State Scheme,All farmers,Pension,\n", 2_000)
+        response = self.client.get(reverse("gov_schemes"))
+        self.assertContains(response, "New Pension Scheme")
+        self.assertNotContains(response, "Old Pension Scheme")
+
+
+class PriceHistoryTests(TestCase):
+    def setUp(self):
+        # 30 daily points, 100 on 2 March up to 129 on Tuesday 31 March
+        self.latest = date(2026, 3, 31)
+        ingest_snapshot([
+            {"district": "കോഴിക്കോട്", "crop_english": "Paddy", "price_per_quintal_in_inr": 100 + day,
+             "date": self.latest - timedelta(days=29 - day)}
+            for day in range(30)
+        ], self.latest)
+
+    def test_moving_averages_and_percentiles(self):
+        trend = price_trend("കോഴിക്കോട്", "paddy")
+        self.assertEqual((trend["latest_date"], trend["latest_price"]), ("2026-03-31", 129))
+        self.assertEqual(trend["moving_averages"], {"7d": 126.0, "30d": 114.5, "90d": 114.5})
+        self.assertEqual(trend["percentiles_365d"], {"p10": 102.9, "p25": 107.25, "p50": 114.5, "p75": 121.75, "p90": 126.1})
+        # 129 against 122 a week earlier
+        self.assertEqual(trend["week_over_week_pct"], 5.74)
+        self.assertEqual(trend["weekly"][-1], {"week_start": "2026-03-30", "avg_price": 128.5, "min_price": 128, "max_price": 129})
+
+    def test_points_are_never_overwritten(self):
+        ingest_snapshot([{"district": "കോഴിക്കോട്", "crop_english": "Paddy", "price_per_quintal_in_inr": 999}], self.latest)
+        self.assertEqual(CropPriceHistory.objects.get(date=self.latest).price_per_quintal, 129)
+        self.assertEqual(price_trend("കോഴിക്കോട്", "Paddy")["latest_price"], 129)
+
+    def test_unknown_series(self):
+        self.assertIsNone(price_trend("കോഴിക്കോട്", "Cardamom"))
+
+
+class BestPriceTests(TestCase):
+    def setUp(self):
+        prices = np.full(len(DISTRICT_NAMES), np.nan)
+        prices[DISTRICT_INDEX["കോഴിക്കോട്"]] = 2000
+        prices[DISTRICT_INDEX["മലപ്പുറം"]] = 2100
+        prices[DISTRICT_INDEX["തിരുവനന്തപുരം"]] = 2600
+        patcher = mock.patch("core.price_lookup.prices_by_crop", return_value={"paddy": prices})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_haversine_distances(self):
+        distances = haversine_matrix([10.0, 11.0, 10.0], [76.0, 76.0, 77.0])
+        # One degree of latitude, and of longitude at 10°N
+        self.assertAlmostEqual(distances[0, 1], 111.19, places=2)
+        self.assertAlmostEqual(distances[0, 2], 109.51, places=2)
+        self.assertTrue(np.allclose(distances, distances.T))
+        self.assertTrue(np.all(np.diag(distances) == 0))
+
+    def test_ranked_by_price_net_of_transport(self):
+        ranked = best_prices("കോഴിക്കോട്", "Paddy")
+        # Thiruvananthapuram pays most but is too far away to be worth it
+        self.assertEqual([row["district"] for row in ranked], ["മലപ്പുറം", "കോഴിക്കോട്", "തിരുവനന്തപുരം"])
+        local = ranked[1]
+        self.assertEqual((local["distance_km"], local["net_price_per_quintal"], local["gain_vs_local"]), (0.0, 2000.0, 0.0))
+        nearby = ranked[0]
+        self.assertAlmostEqual(nearby["net_price_per_quintal"], 2100 - nearby["distance_km"] * 2.5, places=0)
+        self.assertGreater(nearby["gain_vs_local"], 0)
+
+    def test_cheaper_transport_changes_the_ranking(self):
+        ranked = best_prices("കോഴിക്കോട്", "paddy", cost_per_km=0.5)
+        self.assertEqual(ranked[0]["district"], "തിരുവനന്തപുരം")
+
+    def test_unknown_district_or_crop(self):
+        self.assertIsNone(best_prices("Nowhere", "Paddy"))
+        self.assertIsNone(best_prices("കോഴിക്കോട്", "Saffron"))
+
+
+def make_scheme(name, category="Subsidy", department="Agriculture", eligibility="", benefits=""):
+    return {"name": name, "category": category, "department": department,
+            "eligibility": eligibility, "benefits": benefits}
+
+
+class SchemeSearchTests(TestCase):
+    def setUp(self):
+        self.index = SchemeIndex([
+            make_scheme("Coconut Palm Rejuvenation", benefits="Replanting of old palms"),
+            make_scheme("Paddy Procurement", category="Market", benefits="Support price for paddy and coconut farmers"),
+            make_scheme("Drip Irrigation Subsidy", category="Irrigation", benefits="Subsidy for drip systems"),
+            make_scheme("Soil Health Card", category="Soil", benefits="Free soil testing"),
+        ], version=1)
+
+    def positions(self, query):
+        return [position for position, _ in self.index.search(query)]
+
+    def test_name_hits_outrank_body_hits(self):
+        self.assertEqual(self.positions("coconut"), [0, 1])
+
+    def test_rare_terms_outrank_common_ones(self):
+        # Every scheme is in Agriculture, only one is about drip
+        self.assertEqual(self.positions("agriculture drip")[0], 2)
+
+    def test_last_term_matches_as_a_prefix(self):
+        self.assertEqual(self.positions("irrig"), [2])
+        self.assertEqual(self.positions("ir"), [])
+
+    def test_facets_count_matches_before_the_category_filter(self):
+        with mock.patch("core.scheme_search.get_index", return_value=self.index):
+            results, facets, total = search_schemes("coconut", category="Market")
+        self.assertEqual([result["name"] for result in results], ["Paddy Procurement"])
+        self.assertEqual((facets, total), ({"Subsidy": 1, "Market": 1}, 1))
+
+
+class RecommendationTests(TestCase):
+    crops = [
+        {"crop_malayalam": "ഒന്ന്", "crop_english": "Alpha", "sowing_months": "Jun-Jul", "soil_type": "ചെങ്കൽ മണ്ണ്"},
+        {"crop_malayalam": "രണ്ട്", "crop_english": "Beta", "sowing_months": "Jul-Aug", "soil_type": "മണൽ"},
+        {"crop_malayalam": "മൂന്ന്", "crop_english": "Gamma", "sowing_months": "Jan-Feb", "soil_type": "ചെങ്കൽ"},
+    ]
+
+    def setUp(self):
+        alpha = np.full(len(DISTRICT_NAMES), np.nan)
+        alpha[DISTRICT_INDEX["കോഴിക്കോട്"]] = 3000
+        alpha[DISTRICT_INDEX["മലപ്പുറം"]] = 2000
+        self.matrix = recommendations.RecommendationMatrix(self.crops, {"alpha": alpha}, version=1)
+
+    def names(self, district="കോഴിക്കോട്", soil="ചെങ്കൽ", month=6, limit=5):
+        return [crop["english_name"] for crop in self.matrix.recommend(district, soil, month, limit)]
+
+    def test_open_window_beats_one_opening_next_month(self):
+        alpha, beta = self.matrix.recommend("കോഴിക്കോട്", "ചെങ്കൽ", 6)
+        self.assertEqual((alpha["english_name"], alpha["sow_now"]), ("Alpha", True))
+        self.assertEqual((beta["english_name"], beta["sow_now"]), ("Beta", False))
+        # Sowing now, matching soil and the dearest district, against next month's window alone
+        self.assertEqual((alpha["score"], beta["score"]), (1.0, 0.35))
+        # Gamma's window is months away
+        self.assertNotIn("Gamma", self.names(month=6))
+        self.assertEqual(self.names(month=1), ["Gamma"])
+
+    def test_laterite_with_and_without_soil_is_one_soil(self):
+        self.assertEqual(recommendations._soil_key("ചെങ്കൽ മണ്ണ്"), recommendations._soil_key("ചെങ്കൽ"))
+        for soil in ("ചെങ്കൽ", "ചെങ്കൽ മണ്ണ്"):
+            self.assertTrue(self.matrix.recommend("കോഴിക്കോട്", soil, 6)[0]["soil_match"])
+        self.assertFalse(self.matrix.recommend("കോഴിക്കോട്", "മണൽ", 6)[0]["soil_match"])
+
+    def test_price_ranks(self):
+        nan = np.nan
+        self.assertEqual(recommendations._price_ranks(np.array([nan, nan])).tolist(), [0.5, 0.5])
+        self.assertEqual(recommendations._price_ranks(np.array([nan, 100.0])).tolist(), [0.5, 0.5])
+        self.assertEqual(recommendations._price_ranks(np.array([300.0, nan, 100.0, 200.0])).tolist(), [1.0, 0.5, 0.0, 0.5])
+
+    def test_unknown_district_or_soil(self):
+        self.assertEqual(self.names(district="Nowhere"), [])
+        self.assertEqual(self.names(soil="Clay"), [])
+
+    def test_limit(self):
+        self.assertEqual(self.names(limit=1), ["Alpha"])
+
+    def test_rebuilt_when_a_dataset_is_reloaded(self):
+        versions = {"crops": 1, "prices": 1}
+
+        def dataset(name, rows):
+            return lambda: ReferenceData(rows, {}, versions[name])
+
+        self.enterContext(mock.patch.object(recommendations, "_matrix", None))
+        self.enterContext(mock.patch("core.recommendations.reference_data.crops", dataset("crops", self.crops)))
+        self.enterContext(mock.patch("core.recommendations.reference_data.prices", dataset("prices", [])))
+        self.enterContext(mock.patch("core.recommendations.prices_by_crop", return_value={}))
+
+        matrix = recommendations.get_matrix()
+        self.assertIs(recommendations.get_matrix(), matrix)
+        versions["prices"] = 2
+        rebuilt = recommendations.get_matrix()
+        self.assertIsNot(rebuilt, matrix)
+        self.assertEqual(rebuilt.version, (1, 2))
+
+
+class BenchmarkServingTests(TestCase):
+    command = "core.management.commands.benchmark_serving"
+
+    def test_benchmark_user_and_session_are_removed(self):
+        with mock.patch(f"{self.command}.Command._benchmark", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                call_command("benchmark_serving")
+        self.assertFalse(User.objects.filter(mobile="9000000000").exists())
+        self.assertFalse(Session.objects.exists())
 
-# Create your tests here.
+    def test_refuses_the_default_remote_database(self):
+        remote = mock.Mock(vendor="postgresql", settings_dict={"HOST": "db.example.com"})
+        environ = {key: value for key, value in os.environ.items() if key != "DATABASE_URL"}
+        with mock.patch(f"{self.command}.connection", remote), mock.patch.dict(os.environ, environ, clear=True):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_serving")
+        self.assertFalse(User.objects.filter(mobile="9000000000").exists())
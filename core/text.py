@@ -0,0 +1,77 @@
+# core/text.py
+"""
+Tokenization shared by the search, matching and retrieval code.
+
+Python's \\w does not match Malayalam vowel signs or the virama, so it splits
+words like മഴക്കാലത്ത് into fragments; tokens here are runs of ASCII
+letters/digits or of characters from the Malayalam block instead.
+"""
+
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r"[0-9a-z]+|[\u0D00-\u0D7F]+")
+
+ZWJ = "\u200d"
+ZWNJ = "\u200c"
+VIRAMA = "\u0d4d"
+
+# Old-style chillu letters (consonant + virama + ZWJ) and their atomic forms
+CHILLU_SEQUENCES = {
+    "ണ്" + ZWJ: "ൺ",  # nn
+    "ന്" + ZWJ: "ൻ",  # n
+    "ര്" + ZWJ: "ർ",  # r
+    "ല്" + ZWJ: "ൽ",  # l
+    "ള്" + ZWJ: "ൾ",  # ll
+}
+
+ENGLISH_STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its my
+of on or our should that the their this to was what when where which who why
+will with you your me we am not no any all
+""".split())
+
+# Common case endings, longest first, stripped so that e.g. നെല്ലിന് / നെല്ലിൽ match നെല്ല്
+MALAYALAM_SUFFIXES = tuple(sorted((
+    "ത്തിന്റെ", "യുടെ", "ിന്റെ", "ന്റെ", "ത്തിൽ", "ത്തിന്", "ിൽ", "യിൽ",
+    "ക്ക്", "ിന്", "ിനെ", "യെ", "ൽ", "ും",
+), key=len, reverse=True))
+
+
+def normalize(text):
+    """
+    NFC-normalizes, lowercases and rewrites legacy chillu sequences so the
+    same Malayalam word typed on different keyboards compares equal.
+    """
+    text = unicodedata.normalize("NFC", text or "").lower()
+    for sequence, chillu in CHILLU_SEQUENCES.items():
+        text = text.replace(sequence, chillu)
+    return text.replace(ZWJ, "").replace(ZWNJ, "")
+
+
+def _stem(token):
+    if token.isascii():
+        if len(token) > 4 and token.endswith("ies"):
+            return token[:-3] + "y"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            return token[:-1]
+        return token
+    for suffix in MALAYALAM_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            token = token[: -len(suffix)]
+            break
+    # A bare stem and the dictionary form differ only by a final virama (നെല്ല / നെല്ല്)
+    return token.rstrip(VIRAMA) or token
+
+
+def tokenize(text, stem=True):
+    """
+    Splits Malayalam and English text into normalized tokens, dropping English
+    stopwords and stripping common plural/case endings.
+    """
+    tokens = []
+    for token in TOKEN_RE.findall(normalize(text)):
+        if token in ENGLISH_STOPWORDS:
+            continue
+        tokens.append(_stem(token) if stem else token)
+    return tokens
@@ -8,8 +8,15 @@ urlpatterns = [
     path("profile_page/", views.profile_page, name="profile_page"),
     path("add-crop/", views.add_crop, name="add_crop"),
     path("logs/crop/<int:crop_id>/", views.crop_activity_log, name="crop_activity_log"),
+    path("logs/bulk/", views.bulk_activity_log, name="bulk_activity_log"),
+    path("logs/sync/", views.activity_log_sync, name="activity_log_sync"),
+    path("analytics/water/", views.water_analytics, name="water_analytics"),
     path("prices_page/", views.prices_page, name="prices_page"),
+    path("prices_page/json/", views.prices_json, name="prices_json"),
+    path("prices_page/history/", views.price_history, name="price_history"),
+    path("prices_page/best/", views.best_price_lookup, name="best_price_lookup"),
     path("gov_schemes/", views.gov_schemes, name="gov_schemes"),
+    path("gov_schemes/search/", views.gov_schemes_search, name="gov_schemes_search"),
     path("advisory/", views.advisory_page, name="advisory_page"),
     path("advisory/mark-read/<int:advisory_id>/", views.mark_advisory_acknowledged, name="mark_advisory_acknowledged"),
     path("advisory/refresh-weather/", views.refresh_weather_advisory, name="refresh_weather_advisory"),
@@ -1,9 +1,11 @@
 # <-- FIX: All imports are consolidated at the top for clarity. -->
 import csv
+import hashlib
+import json
 import os
 import calendar
+import zlib
 from datetime import date
-import pandas as pd
 import csv
 from pathlib import Path
 from django.conf import settings
@@ -20,8 +22,32 @@ from django.contrib.auth import logout
 from django.conf import settings
 from django.utils import timezone
 from django.contrib import messages
-
-from .models import Crop, ActivityLog
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import etag, require_http_methods
+
+from .models import Crop, ActivityLog, CropCatalog
+from .activity_logs import (
+    parse_activity_entries, bulk_upsert_activity_logs, parse_sync_deltas, sync_activity_logs,
+)
+from .analytics import cached_district_water_usage, crop_water_usage
+from .context_version import catalog_version
+from . import reference_data
+from .price_history import price_trend
+from .recommendations import recommend_for_user
+from .price_lookup import best_prices, TRANSPORT_COST_PER_QUINTAL_KM
+from .scheme_search import search_schemes
+
+# Decompressed size limit for gzip-encoded sync requests
+MAX_SYNC_BODY_BYTES = 5 * 1024 * 1024
+
+# How long a district's serialized price list stays cached
+PRICES_CACHE_SECONDS = 60 * 60
+
+# Lifetime of cached user-independent template fragments. Their keys include the
+# dataset version, so this only bounds how long superseded versions linger.
+FRAGMENT_CACHE_SECONDS = 24 * 60 * 60
 
 
 import csv
@@ -31,41 +57,35 @@ from django.conf import settings
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 
+# Weather icon SVGs, built once per process rather than on every call
+WEATHER_ICONS = {
+    'Sunny': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-yellow-500"><path stroke-linecap="round" stroke-linejoin="round" d="M12 3v2.25m6.364.386l-1.591 1.591M21 12h-2.25m-.386 6.364l-1.591-1.591M12 18.75V21m-4.773-4.227l-1.591 1.591M5.25 12H3m4.227-4.773L5.636 5.636M15.75 12a3.75 3.75 0 11-7.5 0 3.75 3.75 0 017.5 0z" /></svg>""",
+    'Rainy': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-blue-500"><path stroke-linecap="round" stroke-linejoin="round" d="M10.5 6h9.75M10.5 6a1.5 1.5 0 11-3 0m3 0a1.5 1.5 0 10-3 0M3.75 6H7.5m3 12h9.75m-9.75 0a1.5 1.5 0 01-3 0m3 0a1.5 1.5 0 00-3 0m-3.75 0H7.5m9-6h3.75m-3.75 0a1.5 1.5 0 01-3 0m3 0a1.5 1.5 0 00-3 0m-9.75 0h9.75" /></svg>""",
+    'Cloudy': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-gray-500"><path stroke-linecap="round" stroke-linejoin="round" d="M2.25 15a4.5 4.5 0 004.5 4.5H18a3.75 3.75 0 001.332-7.257 3 3 0 00-2.086-5.432A4.5 4.5 0 006.75 7.5 4.5 4.5 0 002.25 15z" /></svg>""",
+    'Thunderstorm': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-indigo-600"><path stroke-linecap="round" stroke-linejoin="round" d="M9.53 16.122a3 3 0 00-5.78 1.128 2.25 2.25 0 01-2.43 2.43a4.5 4.5 0 00-.586 7.756 4.5 4.5 0 00.723 7.756h9.243a4.5 4.5 0 00.723-7.756 2.25 2.25 0 01-2.43-2.43a3 3 0 00-5.78-1.128zM15.75 12a3.75 3.75 0 11-7.5 0 3.75 3.75 0 017.5 0z" /></svg>""",
+    'Overcast': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-slate-600"><path stroke-linecap="round" stroke-linejoin="round" d="M2.25 15a4.5 4.5 0 004.5 4.5H18a3.75 3.75 0 001.332-7.257 3 3 0 00-2.086-5.432A4.5 4.5 0 006.75 7.5 4.5 4.5 0 002.25 15z M8.25 15a3.75 3.75 0 117.5 0 3.75 3.75 0 01-7.5 0z" /></svg>""",
+}
+
 def get_weather_icon(forecast):
     """Returns an SVG icon string based on the weather forecast."""
-    icons = {
-        'Sunny': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-yellow-500"><path stroke-linecap="round" stroke-linejoin="round" d="M12 3v2.25m6.364.386l-1.591 1.591M21 12h-2.25m-.386 6.364l-1.591-1.591M12 18.75V21m-4.773-4.227l-1.591 1.591M5.25 12H3m4.227-4.773L5.636 5.636M15.75 12a3.75 3.75 0 11-7.5 0 3.75 3.75 0 017.5 0z" /></svg>""",
-        'Rainy': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-blue-500"><path stroke-linecap="round" stroke-linejoin="round" d="M10.5 6h9.75M10.5 6a1.5 1.5 0 11-3 0m3 0a1.5 1.5 0 10-3 0M3.75 6H7.5m3 12h9.75m-9.75 0a1.5 1.5 0 01-3 0m3 0a1.5 1.5 0 00-3 0m-3.75 0H7.5m9-6h3.75m-3.75 0a1.5 1.5 0 01-3 0m3 0a1.5 1.5 0 00-3 0m-9.75 0h9.75" /></svg>""",
-        'Cloudy': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-gray-500"><path stroke-linecap="round" stroke-linejoin="round" d="M2.25 15a4.5 4.5 0 004.5 4.5H18a3.75 3.75 0 001.332-7.257 3 3 0 00-2.086-5.432A4.5 4.5 0 006.75 7.5 4.5 4.5 0 002.25 15z" /></svg>""",
-        'Thunderstorm': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-indigo-600"><path stroke-linecap="round" stroke-linejoin="round" d="M9.53 16.122a3 3 0 00-5.78 1.128 2.25 2.25 0 01-2.43 2.43a4.5 4.5 0 00-.586 7.756 4.5 4.5 0 00.723 7.756h9.243a4.5 4.5 0 00.723-7.756 2.25 2.25 0 01-2.43-2.43a3 3 0 00-5.78-1.128zM15.75 12a3.75 3.75 0 11-7.5 0 3.75 3.75 0 017.5 0z" /></svg>""",
-        'Overcast': """<svg xmlns="http://www.w3.org/2000/svg" fill="none" viewBox="0 0 24 24" stroke-width="1.5" stroke="currentColor" class="w-full h-full text-slate-600"><path stroke-linecap="round" stroke-linejoin="round" d="M2.25 15a4.5 4.5 0 004.5 4.5H18a3.75 3.75 0 001.332-7.257 3 3 0 00-2.086-5.432A4.5 4.5 0 006.75 7.5 4.5 4.5 0 002.25 15z M8.25 15a3.75 3.75 0 117.5 0 3.75 3.75 0 01-7.5 0z" /></svg>""",
-    }
     # Return the specific icon or the 'Cloudy' icon as a default
-    return icons.get(forecast, icons['Cloudy'])
+    return WEATHER_ICONS.get(forecast, WEATHER_ICONS['Cloudy'])
 
 @login_required
 def dashboard(request):
     """
     Renders the main dashboard. Weather data is now fetched client-side.
     """
-    # --- Crop Data Logic (from your original code) ---
-    csv_path_crops = os.path.join(settings.BASE_DIR, "database", "kerala_crops_dataset.csv")
-    crops_data = []
-    try:
-        with open(csv_path_crops, encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                clean_row = {k.strip().lower().replace(" ", "_"): v.strip() for k, v in row.items()}
-                crops_data.append(clean_row)
-    except FileNotFoundError:
-        print("Crops CSV file not found, crop selection modal will be empty.")
-
+    # --- Crop Data Logic: the picker offers exactly the crops add_crop accepts ---
     # --- Context for Template ---
     user_crops_sorted = request.user.crops.order_by('-id')
     
     context = {
-        "crops": crops_data,
+        "crops": CropCatalog.objects.all_cached(),
+        "crops_version": catalog_version(),
+        "fragment_cache_seconds": FRAGMENT_CACHE_SECONDS,
         "user_crops": user_crops_sorted,
+        "recommended_crops": recommend_for_user(request.user),
         # We pass the user's district directly to the template for JavaScript to use
         "user_district": request.user.district, 
     }
@@ -74,33 +94,22 @@ def dashboard(request):
 def add_crop(request):
     if request.method == "POST":
         malayalam = request.POST.get("malayalam", "")
-        english = request.POST.get("english", "")
         
         if Crop.objects.filter(user=request.user, name=malayalam, is_harvested=False).exists():
             messages.error(request, f"An active crop named '{malayalam}' is already in your list.")
             return redirect("dashboard")
 
-        irrigation_liters = request.POST.get("irrigation_liters", "")
-        image_url = request.POST.get("image_url", "")
-        fertilizer = request.POST.get("fertilizer", "")
-        pesticide = request.POST.get("pesticide", "")
-        sunlight_hours = request.POST.get("sunlight_hours", "")
-        sowing_months = request.POST.get("sowing_months", "")
-        harvesting_months = request.POST.get("harvesting_months", "")  # ✅ fixed here
-        notes = request.POST.get("notes", "")
+        # The crop's details come from the catalog; the posted copies are ignored
+        catalog = CropCatalog.objects.filter(name=malayalam).first()
+        if catalog is None:
+            messages.error(request, f"'{malayalam}' is not in the crop list.")
+            return redirect("dashboard")
 
         Crop.objects.create(
             user=request.user,
             name=malayalam,
-            english_name=english,
-            image_url=image_url,
-            fertilizer=fertilizer,
-            pesticide=pesticide,
-            irrigation_liters=irrigation_liters,
-            sunlight_hours=sunlight_hours,
-            sowing_months=sowing_months,
-            harvesting_months=harvesting_months,
-            notes=notes,
+            english_name=catalog.english_name,
+            catalog=catalog,
         )
         
         messages.success(request, f"Successfully added a new cycle for '{malayalam}'!")
@@ -142,7 +151,10 @@ def crop_activity_log(request, crop_id):
                     'did_irrigate': did_irrigate,
                     'did_fertilize': did_fertilize,
                     'did_apply_pesticide': did_apply_pesticide,
-                    'notes': notes  # <-- BUG FIX: Added notes to the saved data.
+                    'notes': notes,  # <-- BUG FIX: Added notes to the saved data.
+                    # A web edit is newer than any earlier device change
+                    'client_updated_at': None,
+                    'idempotency_key': None,
                 }
             )
         
@@ -220,6 +232,89 @@ def crop_activity_log(request, crop_id):
 
 
 
+@login_required
+@require_http_methods(["POST"])
+def bulk_activity_log(request):
+    """
+    Saves many daily logs in one request.
+    Expects JSON: {"entries": [{"crop_id", "date", "did_irrigate", "did_fertilize",
+    "did_apply_pesticide", "notes"}, ...]}. Existing (crop, date) logs are updated.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    entries, errors = parse_activity_entries(data.get('entries') if isinstance(data, dict) else None)
+    if errors:
+        return JsonResponse({'error': 'Invalid entries', 'details': errors}, status=400)
+
+    saved, rejected = bulk_upsert_activity_logs(request.user, entries)
+    return JsonResponse({
+        'status': 'success',
+        'saved': saved,
+        'rejected': rejected,
+    })
+
+
+
+@login_required
+@require_http_methods(["POST"])
+@gzip_page
+def activity_log_sync(request):
+    """
+    Offline-first delta sync for activity logs.
+    Expects JSON (optionally gzip-encoded): {"cursor": "...", "changes": [{"crop_id", "date",
+    flags..., "notes", "client_updated_at", "idempotency_key"}, ...]}.
+    Returns the outcome of every change plus the server changes since the cursor.
+    """
+    body = request.body
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, MAX_SYNC_BODY_BYTES)
+        except zlib.error:
+            return JsonResponse({'error': 'Invalid gzip body'}, status=400)
+        if decompressor.unconsumed_tail:
+            return JsonResponse({'error': 'Request body too large'}, status=413)
+
+    try:
+        data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    deltas, errors = parse_sync_deltas(data.get('changes', []))
+    if errors:
+        return JsonResponse({'error': 'Invalid changes', 'details': errors}, status=400)
+
+    try:
+        result = sync_activity_logs(request.user, deltas, cursor=data.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    return JsonResponse({'status': 'success', **result})
+
+
+@login_required
+@require_http_methods(["GET"])
+def water_analytics(request):
+    """
+    Irrigation frequency, estimated water use and gaps between irrigations for the
+    farmer's crops, plus the totals for the farmer's district (every district for
+    staff). Staff can pass ?scope=all for every crop.
+    """
+    if request.GET.get('scope') == 'all' and request.user.is_staff:
+        crops = Crop.objects.all()
+    else:
+        crops = Crop.objects.filter(user=request.user)
+
+    return JsonResponse({
+        'crops': crop_water_usage(crops),
+        'districts': cached_district_water_usage(None if request.user.is_staff else request.user.district),
+    })
+
 
 def logout_view(request):
     logout(request)
@@ -248,48 +343,104 @@ def profile_page(request):
 
 @login_required
 def prices_page(request):
-    # Path to your CSV file
-    csv_path = os.path.join(settings.BASE_DIR, "database", "district_crop_prices.csv")
-
-    # Read the CSV into a DataFrame
-    df = pd.read_csv(csv_path)
-
     # Get the logged-in user's district
     user_district = request.user.district
 
-    # Filter rows for that district
-    df_filtered = df[df["district"] == user_district]
-
-    # Convert DataFrame to list of dicts for template
-    items = df_filtered.to_dict(orient="records")
+    # Price rows for that district, from the in-memory per-district index
+    items = reference_data.prices_for_district(user_district)
 
     return render(request, "core/prices.html", {"items": items, "district": user_district})
 
+
+def _prices_etag(request):
+    district = request.GET.get("district") or request.user.district or ""
+    district_hash = hashlib.md5(district.encode("utf-8")).hexdigest()[:12]
+    return f"{reference_data.prices().version}-{district_hash}"
+
+
+@login_required
+@require_http_methods(["GET"])
+@etag(_prices_etag)
+def prices_json(request):
+    """
+    JSON variant of prices_page. Defaults to the user's district; ?district= picks another.
+    The serialized response is cached per district and dataset version.
+    """
+    district = request.GET.get("district") or request.user.district
+    if district not in dict(DISTRICTS):
+        return JsonResponse({'error': 'Unknown district'}, status=404)
+
+    dataset = reference_data.prices()
+    cache_key = f"prices:json:{dataset.version}:{district}"
+    body = cache.get(cache_key)
+    if body is None:
+        body = json.dumps({
+            'district': district,
+            'items': [dict(row) for row in dataset.get(district)],
+        })
+        cache.set(cache_key, body, PRICES_CACHE_SECONDS)
+
+    response = HttpResponse(body, content_type="application/json")
+    response["Cache-Control"] = f"private, max-age={PRICES_CACHE_SECONDS}"
+    return response
+
+
+@login_required
+@require_http_methods(["GET"])
+def price_history(request):
+    """
+    Moving averages, percentiles, week-over-week change and weekly trend for one crop.
+    ?crop=<English name> is required; ?district= defaults to the user's district.
+    """
+    crop_english = request.GET.get("crop", "").strip()
+    district = request.GET.get("district") or request.user.district
+    if not crop_english:
+        return JsonResponse({'error': 'crop is required'}, status=400)
+    try:
+        weeks = min(max(int(request.GET.get("weeks", 12)), 1), 260)
+    except ValueError:
+        return JsonResponse({'error': 'weeks must be a number'}, status=400)
+
+    trend = price_trend(district, crop_english, weeks=weeks)
+    if trend is None:
+        return JsonResponse({'error': 'No price history for this crop and district'}, status=404)
+    return JsonResponse(trend)
+
+
+@login_required
+@require_http_methods(["GET"])
+def best_price_lookup(request):
+    """
+    Ranks every district's price for ?crop= by net price after transport from the
+    user's district. ?cost_per_km= overrides the per-quintal transport cost.
+    """
+    crop = request.GET.get("crop", "").strip()
+    if not crop:
+        return JsonResponse({'error': 'crop is required'}, status=400)
+    try:
+        cost_per_km = float(request.GET.get("cost_per_km", TRANSPORT_COST_PER_QUINTAL_KM))
+    except ValueError:
+        return JsonResponse({'error': 'cost_per_km must be a number'}, status=400)
+    if not 0 <= cost_per_km <= 1000:
+        return JsonResponse({'error': 'cost_per_km must be between 0 and 1000'}, status=400)
+
+    ranked = best_prices(request.user.district, crop, cost_per_km=cost_per_km)
+    if ranked is None:
+        return JsonResponse({'error': 'Unknown crop or district'}, status=404)
+    return JsonResponse({
+        'district': request.user.district,
+        'crop': crop,
+        'cost_per_km': cost_per_km,
+        'ranked': ranked,
+    })
+
 def gov_schemes(request):
     """
-    Read data/kerala_schemes.csv and render gov_scheme.html
+    Render gov_scheme.html from database/gov_scheme.csv (via the reference data registry)
     """
-    csv_path = Path(settings.BASE_DIR) / "database" / "gov_scheme.csv"
-    schemes = []
-    if csv_path.exists():
-        with open(csv_path, newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # Ensure keys exist and strip whitespace
-                scheme = {
-                    'name': row.get('Scheme Name', '').strip(),
-                    'department': row.get('Department / Authority', '').strip(),
-                    'category': row.get('Category', '').strip(),
-                    'eligibility': row.get('Eligibility / Key Points', '').strip(),
-                    'benefits': row.get('Benefits', '').strip(),
-                    'link': row.get('Official Website / More Info', '').strip(),
-                }
-                # Optional: keep only non-empty rows
-                if scheme['name']:
-                    schemes.append(scheme)
-    else:
-        # if file missing, pass empty and show message in template
-        schemes = []
+    # if file missing, this is empty and the template shows a message
+    dataset = reference_data.schemes()
+    schemes = dataset.rows
 
     # simple pagination - 10 per page
     paginator = Paginator(schemes, 10)
@@ -298,7 +449,32 @@ def gov_schemes(request):
 
     return render(request, "core/gov_scheme.html", {
         "schemes_page": page_obj,
-        "total": len(schemes)
+        "total": len(schemes),
+        "schemes_version": dataset.version,
+        "fragment_cache_seconds": FRAGMENT_CACHE_SECONDS,
+    })
+
+
+@require_http_methods(["GET"])
+def gov_schemes_search(request):
+    """
+    Ranked search over the government schemes: ?q= (Malayalam or English),
+    optional ?category= filter and ?limit=. Returns category facets for the query.
+    """
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({'error': 'q is required'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+
+    results, facets, total = search_schemes(query, category=request.GET.get("category") or None, limit=limit)
+    return JsonResponse({
+        'query': query,
+        'total': total,
+        'results': results,
+        'facets': facets,
     })
 
 from django.contrib.auth.decorators import login_required
@@ -328,48 +504,62 @@ from django.views.decorators.http import require_http_methods
 from .models import Crop, Advisory
 # Import the new generation function
 from .advisory_engine import generate_advisories_for_crop, get_weather_summary
+from . import advisory_engine
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 
 @login_required
-def advisory_page(request):
-    user = request.user
-    crops = Crop.objects.filter(user=user, is_harvested=False) # Only show active crops
+async def advisory_page(request):
+    """
+    Regenerates today's advisories for the farmer's active crops and shows
+    them. The district forecast is fetched once for all crops, asynchronously,
+    so waiting on the weather API holds no worker thread under ASGI.
+    """
+    user = await request.auser()
+    weather_forecast = await advisory_engine.aget_weather_forecast(user.district)
+    return await sync_to_async(_render_advisory_page)(request, user, weather_forecast)
 
-    all_advisories = []
+
+def _render_advisory_page(request, user, weather_forecast):
+    crops = list(Crop.objects.filter(user=user, is_harvested=False)) # Only show active crops
 
     # !! KEY CHANGE: Generate advisories for each crop before displaying !!
-    for crop in crops:
-        generate_advisories_for_crop(crop)
+    advisory_engine.write_advisories_for_crops(crops, weather_forecast)
 
-    # Now, fetch the newly created (or existing) advisories to display
+    # Now fetch the last 7 days of advisories for every crop at once, for some context
+    recent = defaultdict(list)
+    for advisory in Advisory.objects.filter(
+        crop__in=crops, date__gte=timezone.now().date() - timedelta(days=7)
+    ).order_by("-date"):
+        recent[advisory.crop_id].append(advisory)
+
+    all_advisories = []
     for crop in crops:
-        # Fetch advisories from the last 7 days to give some context
-        advisories_qs = crop.advisories.filter(
-            date__gte=timezone.now().date() - timedelta(days=7)
-        ).order_by("-date")
+        advisories = recent[crop.id]
+        unread = [advisory for advisory in advisories if not advisory.is_acknowledged]
 
         # Group them by category for the template
         grouped = {
-            "urgent": advisories_qs.filter(category="URGENT"),
-            "routine": advisories_qs.filter(category="ROUTINE"),
-            "tips": advisories_qs.filter(category="TIP"),
-            "all": advisories_qs
+            "urgent": [advisory for advisory in advisories if advisory.category == "URGENT"],
+            "routine": [advisory for advisory in advisories if advisory.category == "ROUTINE"],
+            "tips": [advisory for advisory in advisories if advisory.category == "TIP"],
+            "all": advisories
         }
 
         all_advisories.append({
             "crop": crop,
             "advisories": grouped,
-            "unread_count": advisories_qs.filter(is_acknowledged=False).count(),
-            "has_urgent": advisories_qs.filter(category="URGENT", is_acknowledged=False).exists(),
+            "unread_count": len(unread),
+            "has_urgent": any(advisory.category == "URGENT" for advisory in unread),
             "crop_age": (timezone.now().date() - crop.sown_date).days if crop.is_sown and crop.sown_date else None,
         })
 
     context = {
         "all_advisories": all_advisories,
         "stats": {
-            "active_crops": crops.count(),
-            "total_advisories": sum(c["advisories"]["all"].count() for c in all_advisories),
-            "urgent_count": sum(c["advisories"]["urgent"].count() for c in all_advisories),
+            "active_crops": len(crops),
+            "total_advisories": sum(len(c["advisories"]["all"]) for c in all_advisories),
+            "urgent_count": sum(len(c["advisories"]["urgent"]) for c in all_advisories),
             "unread_total": sum(c["unread_count"] for c in all_advisories),
         },
         "user_district": getattr(user, "district", "Unknown"),
@@ -398,11 +588,13 @@ def mark_advisory_acknowledged(request, advisory_id):
 
 @login_required
 @require_http_methods(["GET"])
-def refresh_weather_advisory(request):
+async def refresh_weather_advisory(request):
     """
-    AJAX endpoint to refresh weather data without page reload. (No changes needed here)
+    AJAX endpoint to refresh weather data without page reload. Async, so
+    waiting on the weather API holds no worker thread under ASGI.
     """
-    weather_summary = get_weather_summary(request.user.district)
+    user = await request.auser()
+    weather_summary = await advisory_engine.aget_weather_summary(user.district)
     return JsonResponse(weather_summary)
 
 # Add these URLs to your urlpatterns in urls.py:
@@ -0,0 +1,35 @@
+"""
+Production serving profile: gunicorn manages the processes and each worker
+runs the ASGI app on uvicorn's event loop, so the async views (chat streaming,
+weather, AI context) wait on the network without holding a thread.
+
+    gunicorn -c kissan/gunicorn_conf.py kissan.asgi:application
+
+Single process, for development:
+
+    uvicorn kissan.asgi:application --reload
+
+`python manage.py benchmark_serving` compares this profile with plain WSGI
+workers while the weather API is slow.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# An event loop keeps one core busy, so one worker per core; sync workers
+# would need one per concurrent slow request instead
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Chat replies stream for up to LLM_STREAM_TIMEOUT seconds
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to bound growth of the per-process caches
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = "-"
@@ -0,0 +1,291 @@
+"""
+Query-count and wall-time budgets for views.
+
+Each app's tests declare a ViewBudget for every URL in its urls.py; the
+ViewBudgetMixin seeds a representative farmer, requests each URL and fails
+when a view runs more queries or takes longer than declared. Each URL is also
+requested for a farmer with GROWTH_SCALE times as much data, and must not run
+more queries there. Failures report the captured queries with their EXPLAIN
+plans.
+"""
+
+import time
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from ai.chat_history import rebuild_chat_sessions
+from ai.models import ChatLog
+from core.models import Crop, CropCatalog, ActivityLog, Advisory
+
+# Size of the representative data set
+SEED_CROPS = 8
+SEED_LOG_DAYS = 20
+SEED_ADVISORIES_PER_CROP = 3
+SEED_CHAT_SESSIONS = 6
+SEED_MESSAGES_PER_SESSION = 4
+
+# How much larger the second data set is when checking that query counts do not grow
+GROWTH_SCALE = 3
+
+DEFAULT_MAX_MS = 750
+
+
+class ViewBudget:
+    """
+    Declared budget for one URL. `kwargs` and `data` may be callables taking the
+    test case, so they can refer to the seeded objects.
+    """
+
+    def __init__(self, url_name, max_queries, max_ms=DEFAULT_MAX_MS, method="get",
+                 kwargs=None, data=None, content_type=None):
+        self.url_name = url_name
+        self.max_queries = max_queries
+        self.max_ms = max_ms
+        self.method = method
+        self.kwargs = kwargs or {}
+        self.data = data
+        self.content_type = content_type
+
+    def resolve(self, testcase, value):
+        return value(testcase) if callable(value) else value
+
+
+def make_farmer(mobile="9000000002", district="കോഴിക്കോട്"):
+    """
+    Creates a farmer with no crops or chats.
+    """
+    return User.objects.create(
+        mobile=mobile, name="Test Farmer", acreage="<1", district=district,
+        pincode="673001", soil_type="ചെങ്കൽ",
+    )
+
+
+def seed_representative_data(mobile="9000000001", scale=1):
+    """
+    Creates a farmer with several crops, daily logs, advisories and chat sessions,
+    `scale` times the representative size. Returns the user.
+    """
+    user = User.objects.create(
+        mobile=mobile,
+        name="Budget Farmer",
+        acreage=">1",
+        district="കോഴിക്കോട്",
+        pincode="673001",
+        soil_type="ചെങ്കൽ മണ്ണ്",
+    )
+    today = timezone.now().date()
+
+    catalog, _ = CropCatalog.objects.get_or_create(
+        name="വിള",
+        defaults=dict(
+            english_name="Budget Crop",
+            fertilizer="NPK 10kg/acre",
+            pesticide="Yes",
+            irrigation_liters="250",
+            irrigation_liters_value=250,
+            sunlight_hours="6-8",
+            sowing_months="Jan-Feb",
+            sowing_month_mask=0b11,
+            harvesting_months="Jun-Jul",
+            harvesting_month_mask=0b1100000,
+        ),
+    )
+    crops = Crop.objects.bulk_create([
+        Crop(
+            user=user,
+            name=f"വിള {i}",
+            english_name=f"Crop {i}",
+            catalog=catalog,
+            is_sown=i % 4 != 0,
+            sown_date=today - timedelta(days=10 * i + 5) if i % 4 != 0 else None,
+        )
+        for i in range(SEED_CROPS * scale)
+    ])
+
+    ActivityLog.objects.bulk_create([
+        ActivityLog(
+            crop=crop,
+            date=today - timedelta(days=day),
+            did_irrigate=day % 2 == 0,
+            did_fertilize=day % 7 == 0,
+            did_apply_pesticide=day % 10 == 0,
+        )
+        for crop in crops
+        for day in range(SEED_LOG_DAYS * scale)
+    ])
+
+    Advisory.objects.bulk_create([
+        Advisory(crop=crop, message=f"Advisory {n} for {crop.name}", category=category, date=today)
+        for crop in crops
+        for n, category in enumerate(["URGENT", "ROUTINE", "TIP"][:SEED_ADVISORIES_PER_CROP])
+    ])
+
+    ChatLog.objects.bulk_create([
+        ChatLog(
+            user=user,
+            session_id=f"session-{s}",
+            user_question=f"ചോദ്യം {s}-{m}: how do I treat leaf spot on paddy?",
+            ai_response="Use a recommended fungicide and improve drainage.",
+            language="ml" if s % 2 == 0 else "en",
+            user_district=user.district,
+        )
+        for s in range(SEED_CHAT_SESSIONS * scale)
+        for m in range(SEED_MESSAGES_PER_SESSION * scale)
+    ])
+    rebuild_chat_sessions(user)
+    return user
+
+
+def consume_streaming_content(response):
+    """
+    Reads a streaming response to the end, including async (ASGI) streams.
+    Returns the body.
+    """
+    if not response.is_async:
+        return b"".join(response.streaming_content)
+
+    async def read():
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    return async_to_sync(read)()
+
+
+def url_names(urlconf):
+    """
+    Returns the (namespaced) names of every URL pattern in a urls module.
+    """
+    module = import_module(urlconf)
+    namespace = getattr(module, "app_name", None)
+    return {
+        f"{namespace}:{pattern.name}" if namespace else pattern.name
+        for pattern in module.urlpatterns
+        if getattr(pattern, "name", None)
+    }
+
+
+def explain_queries(queries):
+    """
+    Formats captured queries with their EXPLAIN plans.
+    """
+    lines = []
+    prefix = connection.ops.explain_query_prefix()
+    for number, query in enumerate(queries, start=1):
+        sql = query["sql"]
+        lines.append(f"[{number}] ({query['time']}s) {sql}")
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"{prefix} {sql}")
+                plan = cursor.fetchall()
+        except Exception as e:
+            lines.append(f"    EXPLAIN failed: {e}")
+            continue
+        for row in plan:
+            lines.append("    " + " | ".join(str(col) for col in row))
+    return "\n".join(lines)
+
+
+class ViewBudgetMixin:
+    """
+    Mix into a django.test.TestCase. Subclasses set `urlconf` and implement
+    budgets() returning a ViewBudget for every URL name in that urlconf.
+    """
+
+    urlconf = None
+
+    def setUp(self):
+        super().setUp()
+        # Budgets measure our own work, never the weather API
+        for target in ("core.advisory_engine.get_weather_forecast", "core.advisory_engine.aget_weather_forecast"):
+            patcher = mock.patch(target, return_value=None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.use_farmer(seed_representative_data())
+
+    def use_farmer(self, user):
+        """
+        Makes `user` the farmer the budgets are requested as.
+        """
+        self.user = user
+        # Per-process caches are warm in a running server; budgets measure that steady state
+        CropCatalog.objects.cached(None)
+        self.crop = self.user.crops.filter(is_sown=True).first()
+        self.advisory = Advisory.objects.filter(crop=self.crop).first()
+
+    def budgets(self):
+        raise NotImplementedError
+
+    def test_every_url_has_a_budget(self):
+        declared = {budget.url_name for budget in self.budgets()}
+        missing = url_names(self.urlconf) - declared
+        self.assertFalse(missing, f"URLs without a declared query budget: {sorted(missing)}")
+
+    def test_view_budgets(self):
+        for budget in self.budgets():
+            with self.subTest(url=budget.url_name):
+                self.assertWithinBudget(budget)
+
+    def test_query_counts_do_not_grow_with_data(self):
+        # Both farmers are measured in one test, so they see the same warm caches
+        baseline = {budget.url_name: len(self.request_budget(budget)[1]) for budget in self.budgets()}
+        self.use_farmer(seed_representative_data(mobile="9000000009", scale=GROWTH_SCALE))
+        for budget in self.budgets():
+            with self.subTest(url=budget.url_name):
+                _, captured, _ = self.request_budget(budget)
+                if len(captured) > baseline[budget.url_name]:
+                    self.fail(
+                        f"{budget.url_name} ran {len(captured)} queries with {GROWTH_SCALE}x the data "
+                        f"(was {baseline[budget.url_name]})\n{explain_queries(captured.captured_queries)}"
+                    )
+
+    def request_budget(self, budget):
+        """
+        Requests a budget's URL as the current farmer. Returns the response, the
+        captured queries and the wall time in milliseconds.
+        """
+        self.client.force_login(self.user, backend="accounts.backends.MobileBackend")
+        url = reverse(
+            budget.url_name,
+            kwargs={key: budget.resolve(self, value) for key, value in budget.kwargs.items()},
+        )
+        request_kwargs = {}
+        data = budget.resolve(self, budget.data)
+        if data is not None:
+            request_kwargs["data"] = data
+        if budget.content_type:
+            request_kwargs["content_type"] = budget.content_type
+
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(self.client, budget.method)(url, **request_kwargs)
+            if response.streaming:
+                # Streamed bodies do their work as they are consumed
+                consume_streaming_content(response)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self.assertLess(response.status_code, 500, f"{budget.url_name} returned {response.status_code}")
+        return response, captured, elapsed_ms
+
+    def assertWithinBudget(self, budget):
+        _, captured, elapsed_ms = self.request_budget(budget)
+        failures = []
+        if len(captured) > budget.max_queries:
+            failures.append(f"{len(captured)} queries (budget {budget.max_queries})")
+        if elapsed_ms > budget.max_ms:
+            failures.append(f"{elapsed_ms:.0f}ms (budget {budget.max_ms}ms)")
+        if failures:
+            self.fail(
+                f"{budget.url_name} over budget: {', '.join(failures)}\n"
+                f"{explain_queries(captured.captured_queries)}"
+            )